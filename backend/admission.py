@@ -0,0 +1,231 @@
+"""
+Admission control for the expensive endpoints.
+
+Each configured route gets a policy:
+  rate, burst       per-client token bucket (requests per second, bucket size);
+                    a client is the remote address (X-Forwarded-For only with
+                    ADMISSION_TRUST_PROXY=1); the session_user cookie is unsigned,
+                    so keying on it would let a client reset its bucket at will
+  concurrency       requests of this route allowed to run at once
+  queue             requests allowed to wait for a slot; beyond that they are shed
+  queue_timeout     seconds a queued request waits before it is shed
+
+An empty bucket answers 429 and a full queue (or a wait that times out)
+answers 503, both with Retry-After. Limiting concurrency here keeps heavy
+sync endpoints from occupying the whole threadpool, so cheap endpoints
+don't queue behind them. Routes without a policy pass straight through.
+
+Policies can be overridden with ADMISSION_POLICIES, a JSON object such as
+{"POST /api/trips/create": {"rate": 1, "burst": 10}}; ADMISSION_ENABLED=0
+turns the controller off.
+"""
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict, deque
+
+import orjson
+
+from metrics import (ADMISSION_CLIENTS, ADMISSION_DECISIONS, ADMISSION_IN_FLIGHT,
+                     ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUE_WAIT)
+
+ENABLED = os.getenv("ADMISSION_ENABLED", "1") != "0"
+TRUST_PROXY = os.getenv("ADMISSION_TRUST_PROXY", "0") == "1"
+MAX_CLIENTS = 10000         # token buckets kept per route (least recently seen are dropped)
+
+DEFAULT_POLICIES = {
+    "POST /api/recommendations": {"rate": 2.0, "burst": 20, "concurrency": 4, "queue": 16, "queue_timeout": 2.0},
+    "POST /api/trips/create": {"rate": 0.2, "burst": 5, "concurrency": 2, "queue": 8, "queue_timeout": 5.0},
+    "POST /api/trips/plan/scenarios": {"rate": 0.5, "burst": 5, "concurrency": 2, "queue": 4, "queue_timeout": 2.0},
+    "GET /api/search": {"rate": 5.0, "burst": 30, "concurrency": 8, "queue": 32, "queue_timeout": 1.0},
+}
+
+
+class Rejected(Exception):
+    def __init__(self, status, retry_after, reason):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now):
+        """0 if a token was taken, else seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class RoutePolicy:
+    """Token buckets and the concurrency gate of one route; used from the event loop only"""
+
+    def __init__(self, route, rate, burst, concurrency, queue, queue_timeout):
+        self.route = route
+        self.rate = float(rate)
+        self.burst = max(int(burst), 1)
+        self.concurrency = max(int(concurrency), 1)
+        self.queue = max(int(queue), 0)
+        self.queue_timeout = float(queue_timeout)
+        self.buckets = OrderedDict()
+        self.in_flight = 0
+        self.waiters = deque()
+        self.service_time = 0.5     # moving average of seconds per request, for Retry-After
+
+    def _bucket(self, client, now):
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = self.buckets[client] = TokenBucket(self.rate, self.burst, now)
+            if len(self.buckets) > MAX_CLIENTS:
+                self.buckets.popitem(last=False)
+            ADMISSION_CLIENTS.set(len(self.buckets), self.route)
+        else:
+            self.buckets.move_to_end(client)
+        return bucket
+
+    def check_rate(self, client):
+        now = time.monotonic()
+        wait = self._bucket(client, now).take(now)
+        if wait:
+            raise Rejected(429, wait, "rate_limited")
+
+    def _drain_estimate(self):
+        return self.service_time * (len(self.waiters) + 1) / self.concurrency
+
+    async def acquire(self):
+        if self.in_flight < self.concurrency and not self.waiters:
+            self.in_flight += 1
+            ADMISSION_IN_FLIGHT.set(self.in_flight, self.route)
+            return False
+        if len(self.waiters) >= self.queue:
+            raise Rejected(503, self._drain_estimate(), "shed")
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        ADMISSION_QUEUE_DEPTH.set(len(self.waiters), self.route)
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the wait ended; give it back
+                self.release()
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            raise Rejected(503, self._drain_estimate(), "timeout")
+        finally:
+            if future in self.waiters:
+                self.waiters.remove(future)
+            ADMISSION_QUEUE_DEPTH.set(len(self.waiters), self.route)
+        return True
+
+    def release(self, elapsed=None):
+        if elapsed is not None:
+            self.service_time += 0.2 * (elapsed - self.service_time)
+        # Hand the slot straight to the oldest live waiter, so in_flight never dips below the queue
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                break
+        else:
+            self.in_flight -= 1
+        ADMISSION_IN_FLIGHT.set(self.in_flight, self.route)
+        ADMISSION_QUEUE_DEPTH.set(len(self.waiters), self.route)
+
+
+def _pattern(path):
+    return re.compile("^" + re.sub(r"\\\{[^/]+?\\\}", "[^/]+", re.escape(path)) + "$")
+
+
+def load_policies(overrides=None):
+    """{route: RoutePolicy} from DEFAULT_POLICIES and ADMISSION_POLICIES (or `overrides`)"""
+    config = {route: dict(policy) for route, policy in DEFAULT_POLICIES.items()}
+    if overrides is None:
+        overrides = json.loads(os.getenv("ADMISSION_POLICIES") or "{}")
+    for route, policy in overrides.items():
+        if policy is None:
+            config.pop(route, None)
+        else:
+            config[route] = {**config.get(route, {}), **policy}
+    return {route: RoutePolicy(route, **policy) for route, policy in config.items()}
+
+
+def client_key(scope):
+    """The remote address; never a client-chosen value such as the session_user cookie"""
+    headers = dict(scope.get("headers") or ())
+    forwarded = headers.get(b"x-forwarded-for") if TRUST_PROXY else None
+    if forwarded:
+        return "ip:" + forwarded.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying the route policies before the request reaches the app"""
+
+    def __init__(self, app, policies=None, enabled=ENABLED):
+        self.app = app
+        self.enabled = enabled
+        self.policies = load_policies() if policies is None else policies
+        self._routes = {}
+        for route, policy in self.policies.items():
+            method, path = route.split(" ", 1)
+            self._routes.setdefault(method, []).append((_pattern(path), policy))
+
+    def match(self, method, path):
+        for pattern, policy in self._routes.get(method, ()):
+            if pattern.match(path):
+                return policy
+        return None
+
+    async def __call__(self, scope, receive, send):
+        policy = self.match(scope["method"], scope["path"]) if self.enabled and scope["type"] == "http" else None
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            policy.check_rate(client_key(scope))
+            queued_at = time.monotonic()
+            queued = await policy.acquire()
+        except Rejected as rejected:
+            ADMISSION_DECISIONS.inc(policy.route, rejected.reason)
+            await _reject(send, rejected)
+            return
+
+        start = time.monotonic()
+        if queued:
+            ADMISSION_QUEUE_WAIT.observe(start - queued_at, policy.route)
+        ADMISSION_DECISIONS.inc(policy.route, "queued" if queued else "admitted")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            policy.release(time.monotonic() - start)
+
+
+async def _reject(send, rejected):
+    retry_after = str(max(1, math.ceil(min(rejected.retry_after, 3600))))
+    detail = "Too many requests" if rejected.status == 429 else "Server busy, please retry"
+    body = orjson.dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": rejected.status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", retry_after.encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
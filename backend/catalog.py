@@ -0,0 +1,501 @@
+"""
+In-memory columnar copy of the TravelDatasetImported catalog.
+
+The catalog is read-mostly and every recommendation or trip build used to
+re-read the whole table into a DataFrame. Instead it is loaded once into
+numpy columns: REAL columns as float64 (NaN for missing or malformed
+values), low-cardinality text columns as int32 codes into a vocabulary,
+and the remaining text as a UTF-8 blob with offsets. Filters become
+vectorized mask operations and only the rows that are returned are turned
+back into dicts.
+
+The same arrays can be written to a snapshot directory of .npy files (the
+import scripts do this after loading the table) and memory-mapped back
+read-only, so every worker process shares one copy of the pages and
+startup is a map instead of a table scan.
+
+Imports publish generations: the new rows are loaded into a staging
+table, a snapshot is written for the next generation, and one transaction
+swaps the staging table in and bumps CatalogMeta.generation. Running
+workers notice the bump on a throttled version check and load the new
+generation in the background; requests keep whichever Catalog object they
+started with, so in-flight work finishes on the old generation.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from citygraph import CityGraph, city_graph, graph_names
+from filters import materialize as materialize_filters
+from lazy import lazy_import
+from metrics import CATALOG_GENERATION
+from search import rebuild_search_index
+import seasonality
+from similarity import TfidfIndex, tfidf_index
+
+np = lazy_import("numpy")
+
+TABLE = "TravelDatasetImported"
+STAGING_TABLE = TABLE + "_staging"
+CHECK_INTERVAL = 1.0        # seconds between generation checks per process
+
+META_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS CatalogMeta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        generation INTEGER NOT NULL,
+        published_at TEXT NOT NULL
+    )
+"""
+
+# Recreated on every publish; indexes are dropped with the table they belong to
+INDEXES = (
+    f"CREATE INDEX IF NOT EXISTS idx_places_city ON {TABLE}(City COLLATE NOCASE)",
+    f"CREATE INDEX IF NOT EXISTS idx_places_name ON {TABLE}(Name)",
+)
+
+# Text columns with few distinct values, stored as codes
+CATEGORICAL = (
+    "Zone", "State", "City", "Type", "Airport_with_50km_Radius", "Weekly_Off", "Significance",
+    "DSLR_Allowed", "Best_Time_to_visit", "Kid_Friendly", "Activity_Type",
+)
+
+
+SNAPSHOT_FORMAT = 1
+MANIFEST = "manifest.json"
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class StringColumn:
+    """Text column as one UTF-8 byte blob plus int64 offsets (Arrow-style), NULLs in a mask"""
+
+    def __init__(self, offsets, data, nulls):
+        self.offsets = offsets      # int64, len n + 1
+        self.data = data            # uint8 blob
+        self.nulls = nulls          # bool, len n
+
+    @classmethod
+    def from_values(cls, values):
+        encoded = [b"" if v is None else str(v).encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        return cls(offsets, data, nulls)
+
+    def __len__(self):
+        return len(self.nulls)
+
+    def take(self, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self.offsets[positions].tolist()
+        ends = self.offsets[positions + 1].tolist()
+        nulls = self.nulls[positions].tolist()
+        data = self.data
+        return [None if null else data[start:end].tobytes().decode("utf-8")
+                for start, end, null in zip(starts, ends, nulls)]
+
+    def __iter__(self):
+        blob = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        for i, null in enumerate(self.nulls.tolist()):
+            yield None if null else blob[offsets[i]:offsets[i + 1]].decode("utf-8")
+
+
+class Catalog:
+    def __init__(self, columns, ids, numeric, codes, vocab, text, generation=0, integers=None):
+        self.generation = generation
+        self.columns = columns      # names in table order, as SELECT * returns them
+        self.ids = ids              # int64 row ids
+        self.numeric = numeric      # name -> float64 array
+        self.codes = codes          # name -> int32 codes, -1 for NULL
+        self.vocab = vocab          # name -> list of distinct values
+        self.text = text            # name -> StringColumn
+        self.integers = integers or {}  # name -> int64 array (bitmask columns), 0 for NULL
+        self.size = len(ids)
+        self._folded = {}           # name -> lower-cased value -> codes
+        self._positions = {}        # text column name -> value -> row positions
+        self._derived = {}          # per-generation indexes built by other modules
+        self._derived_lock = threading.Lock()
+
+    def derived(self, name, build):
+        """Cache `build()` on this catalog, so indexes derived from it are rebuilt once per generation"""
+        value = self._derived.get(name)
+        if value is None:
+            with self._derived_lock:
+                value = self._derived.get(name)
+                if value is None:
+                    value = self._derived[name] = build()
+        return value
+
+    def _folded_codes(self, column):
+        folded = self._folded.get(column)
+        if folded is None:
+            folded = {}
+            for code, value in enumerate(self.vocab[column]):
+                folded.setdefault(value.lower(), []).append(code)
+            self._folded[column] = folded
+        return folded
+
+    def isin(self, column, values, casefold=False):
+        """Boolean mask of rows whose categorical `column` is one of `values`"""
+        if casefold:
+            folded = self._folded_codes(column)
+            wanted = [c for v in values for c in folded.get(str(v).lower(), ())]
+        else:
+            lookup = {value: code for code, value in enumerate(self.vocab[column])}
+            wanted = [lookup[v] for v in values if v in lookup]
+        return np.isin(self.codes[column], np.array(wanted, dtype=np.int32))
+
+    def _text_index(self, column):
+        index = self._positions.get(column)
+        if index is None:
+            index = {}
+            for pos, value in enumerate(self.text[column]):
+                index.setdefault(value, []).append(pos)
+            self._positions[column] = index
+        return index
+
+    def positions(self, column, values):
+        """Row positions (in table order) whose text `column` equals any of `values`"""
+        index = self._text_index(column)
+        hits = sorted({pos for v in values for pos in index.get(v, ())})
+        return np.array(hits, dtype=np.int64)
+
+    def first_positions(self, column, values):
+        """First row position whose text `column` equals each of `values`, -1 where there is none"""
+        index = self._text_index(column)
+        return np.array([index.get(v, (-1,))[0] for v in values], dtype=np.int64)
+
+    def positions_of_ids(self, ids):
+        """Row positions for catalog ids, in the given order; unknown ids are dropped"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.size == 0 or len(ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.ids, ids), self.size - 1)
+        return positions[self.ids[positions] == ids]
+
+    def distinct(self, column):
+        present = np.unique(self.codes[column])
+        return sorted(self.vocab[column][c] for c in present if c >= 0)
+
+    def records(self, positions, extra=None):
+        """Rows at `positions` as dicts keyed like SELECT *; `extra` adds computed float columns"""
+        positions = np.asarray(positions, dtype=np.int64)
+        cols = []
+        for name in self.columns:
+            if name in self.numeric:
+                arr = self.numeric[name][positions]
+                cols.append([None if v != v else v for v in arr.tolist()])
+            elif name in self.integers:
+                cols.append(self.integers[name][positions].tolist())
+            elif name in self.codes:
+                vocab = self.vocab[name]
+                cols.append([vocab[c] if c >= 0 else None for c in self.codes[name][positions].tolist()])
+            elif name == "id":
+                cols.append(self.ids[positions].tolist())
+            else:
+                cols.append(self.text[name].take(positions))
+        names = list(self.columns)
+        for name, arr in (extra or {}).items():
+            names.append(name)
+            cols.append([None if v != v else v for v in np.asarray(arr, dtype=float).tolist()])
+        return [dict(zip(names, row)) for row in zip(*cols)]
+
+
+def load_catalog(conn, table=TABLE):
+    """Build a Catalog from `table` (the live catalog table by default)"""
+    declared = {row[1]: (row[2] or "").upper() for row in conn.execute(f"PRAGMA table_info({table})")}
+    cur = conn.cursor()
+    cur.row_factory = None
+    cur.execute(f"SELECT * FROM {table} ORDER BY id")
+    columns = tuple(d[0] for d in cur.description)
+    rows = cur.fetchall()
+    data = list(zip(*rows)) if rows else [()] * len(columns)
+
+    ids, numeric, codes, vocab, text, integers = None, {}, {}, {}, {}, {}
+    for name, values in zip(columns, data):
+        if name == "id":
+            ids = np.array(values, dtype=np.int64)
+        elif declared.get(name) == "INTEGER":
+            integers[name] = np.array([v or 0 for v in values], dtype=np.int64)
+        elif declared.get(name) in ("REAL", "FLOAT", "DOUBLE", "NUMERIC"):
+            numeric[name] = np.array([_to_float(v) for v in values], dtype=np.float64)
+        elif name in CATEGORICAL:
+            lookup = {}
+            col = np.fromiter(
+                (-1 if v is None else lookup.setdefault(str(v), len(lookup)) for v in values),
+                dtype=np.int32, count=len(values)
+            )
+            codes[name] = col
+            vocab[name] = list(lookup)
+        else:
+            text[name] = StringColumn.from_values(values)
+    if ids is None:
+        ids = np.arange(1, len(rows) + 1, dtype=np.int64)
+    return Catalog(columns, ids, numeric, codes, vocab, text, integers=integers)
+
+
+# --- Snapshot ---
+
+def snapshot_root(db_path):
+    """Snapshots that belong to a database file: voyago_lite.db -> voyago_lite.catalog/"""
+    return os.path.splitext(os.path.abspath(db_path))[0] + ".catalog"
+
+
+def snapshot_path(db_path, generation):
+    return os.path.join(snapshot_root(db_path), f"gen-{generation}")
+
+
+def write_snapshot(catalog, directory):
+    """Write `catalog` as .npy files plus a manifest, replacing `directory` in one rename"""
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".catalog-", dir=parent)
+    try:
+        np.save(os.path.join(staging, "ids.npy"), catalog.ids)
+        for name, arr in catalog.numeric.items():
+            np.save(os.path.join(staging, f"num.{name}.npy"), arr)
+        for name, arr in catalog.codes.items():
+            np.save(os.path.join(staging, f"codes.{name}.npy"), arr)
+        for name, arr in catalog.integers.items():
+            np.save(os.path.join(staging, f"int.{name}.npy"), arr)
+        for name, col in catalog.text.items():
+            np.save(os.path.join(staging, f"text.{name}.offsets.npy"), col.offsets)
+            np.save(os.path.join(staging, f"text.{name}.data.npy"), col.data)
+            np.save(os.path.join(staging, f"text.{name}.nulls.npy"), col.nulls)
+        tfidf_index(catalog).save(staging)
+        city_graph(catalog).save(staging)
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "generation": catalog.generation,
+            "size": catalog.size,
+            "columns": list(catalog.columns),
+            "numeric": list(catalog.numeric),
+            "categorical": list(catalog.codes),
+            "integer": list(catalog.integers),
+            "text": list(catalog.text),
+            "vocab": catalog.vocab,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        # The manifest goes last: a directory without one is never read
+        with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        retired = None
+        if os.path.exists(directory):
+            retired = tempfile.mkdtemp(prefix=".catalog-old-", dir=parent)
+            os.replace(directory, os.path.join(retired, "snapshot"))
+        os.replace(staging, directory)
+        if retired is not None:
+            # Workers that still map the old files keep them alive until they unmap
+            shutil.rmtree(retired, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def _map(path):
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # Zero-length arrays can't be mapped
+        return np.load(path)
+
+
+def load_snapshot(directory):
+    """Memory-map a snapshot written by write_snapshot (read-only, shared between processes)"""
+    with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported catalog snapshot format {manifest.get('format')!r}")
+
+    def path(name):
+        return os.path.join(directory, name)
+
+    catalog = Catalog(
+        tuple(manifest["columns"]),
+        _map(path("ids.npy")),
+        {name: _map(path(f"num.{name}.npy")) for name in manifest["numeric"]},
+        {name: _map(path(f"codes.{name}.npy")) for name in manifest["categorical"]},
+        manifest["vocab"],
+        {name: StringColumn(_map(path(f"text.{name}.offsets.npy")), _map(path(f"text.{name}.data.npy")),
+                            _map(path(f"text.{name}.nulls.npy")))
+         for name in manifest["text"]},
+        manifest.get("generation", 0),
+        {name: _map(path(f"int.{name}.npy")) for name in manifest.get("integer", ())},
+    )
+    tfidf = TfidfIndex.load(directory, _map)
+    if tfidf is not None:
+        catalog.derived("tfidf", lambda: tfidf)
+    graph = CityGraph.load(directory, _map, graph_names(catalog))
+    if graph is not None:
+        catalog.derived("city_graph", lambda: graph)
+    return catalog
+
+
+# --- Generations ---
+
+def read_generation(conn):
+    try:
+        row = conn.execute("SELECT generation FROM CatalogMeta WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        # No import has published yet
+        return 0
+    return row[0] if row else 0
+
+
+def create_staging(conn, copy_rows=False):
+    """Fresh staging table with the live table's schema, optionally seeded with its rows"""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (TABLE,)).fetchone()
+    if row is None:
+        raise RuntimeError(f"{TABLE} does not exist; run scripts/import_dataset.py first")
+    conn.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+    conn.execute(row[0].replace(TABLE, STAGING_TABLE, 1))
+    if copy_rows:
+        conn.execute(f"INSERT INTO {STAGING_TABLE} SELECT * FROM {TABLE}")
+    conn.commit()
+
+
+def publish(conn, db_path, staging=True):
+    """
+    Make the next catalog generation current and return (generation, snapshot directory).
+    With `staging` the staging table replaces the live table; otherwise the live table
+    was modified in place. The snapshot is written before the swap, so workers that see
+    the new generation can map it straight away.
+    """
+    conn.commit()
+    conn.execute(META_SCHEMA)
+    previous = read_generation(conn)
+    generation = previous + 1
+
+    seasonality.annotate(conn, STAGING_TABLE if staging else TABLE)
+    conn.commit()
+    catalog = load_catalog(conn, STAGING_TABLE if staging else TABLE)
+    catalog.generation = generation
+    directory = snapshot_path(db_path, generation)
+    write_snapshot(catalog, directory)
+
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if read_generation(conn) != previous:
+            raise RuntimeError("Another import published a catalog generation at the same time")
+        if staging:
+            conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            conn.execute(f"ALTER TABLE {STAGING_TABLE} RENAME TO {TABLE}")
+        for sql in INDEXES:
+            conn.execute(sql)
+        rebuild_search_index(conn)
+        materialize_filters(conn)
+        conn.execute(
+            "INSERT INTO CatalogMeta (id, generation, published_at) VALUES (1, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET generation = excluded.generation, published_at = excluded.published_at",
+            (generation, datetime.utcnow().isoformat())
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    _prune_snapshots(db_path, keep_from=previous)
+    return generation, directory
+
+
+def _prune_snapshots(db_path, keep_from):
+    # The previous generation stays for workers that are still loading it
+    root = snapshot_root(db_path)
+    for name in os.listdir(root):
+        if name.startswith("gen-") and name[4:].isdigit() and int(name[4:]) < keep_from:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+class CatalogStore:
+    """
+    Per-process holder of the current catalog generation. `get()` never blocks on a
+    reload once a catalog is loaded; `warm()` does the first load off the request path.
+    """
+
+    def __init__(self, db_path, check_interval=CHECK_INTERVAL):
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self._catalog = None
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._checked_at = 0.0
+
+    def get(self):
+        catalog = self._catalog
+        if catalog is None:
+            with self._lock:
+                catalog = self._catalog
+                if catalog is None:
+                    catalog = self._catalog = self._load()
+                    CATALOG_GENERATION.set(catalog.generation)
+        else:
+            self._check_generation(catalog)
+        return catalog
+
+    def warm(self):
+        threading.Thread(target=self.get, name="catalog-warmup", daemon=True).start()
+
+    def _check_generation(self, catalog):
+        now = time.monotonic()
+        if self._reloading or now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        conn = sqlite3.connect(self.db_path)
+        try:
+            generation = read_generation(conn)
+        finally:
+            conn.close()
+        if generation == catalog.generation:
+            return
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, name="catalog-reload", daemon=True).start()
+
+    def _reload(self):
+        try:
+            catalog = self._load()
+            # Readers pick up the new object on their next get(); the old one stays valid for them
+            self._catalog = catalog
+            CATALOG_GENERATION.set(catalog.generation)
+        except Exception as e:
+            print(f"Catalog reload failed, keeping generation {self._catalog.generation}: {e}")
+        finally:
+            self._reloading = False
+
+    def _load(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            generation = read_generation(conn)
+            directory = snapshot_path(self.db_path, generation)
+            if os.path.exists(os.path.join(directory, MANIFEST)):
+                try:
+                    catalog = load_snapshot(directory)
+                    if catalog.generation == generation:
+                        return catalog
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Ignoring unreadable catalog snapshot {directory}: {e}")
+            # No usable snapshot: read the generation and its rows in one read transaction
+            conn.execute("BEGIN")
+            generation = read_generation(conn)
+            catalog = load_catalog(conn)
+            catalog.generation = generation
+            conn.rollback()
+            return catalog
+        finally:
+            conn.close()
@@ -0,0 +1,333 @@
+"""
+Per-trip change feed for collaborative trips.
+
+Write endpoints publish an event once their transaction has committed
+(expense, member, itinerary and checklist changes, with the changed rows
+or ids as the payload). GET /api/trips/{trip_id}/events streams them as
+server-sent events, so members see each other's edits without polling.
+
+Every event gets an id "<boot>-<seq>" from one process-wide sequence. The
+last BUFFER_SIZE events of each trip are kept in a ring buffer, so a client
+that reconnects with Last-Event-ID gets exactly what it missed. When that
+is no longer possible (the id fell out of the buffer, or the server
+restarted) it gets a single "reset" event and should refetch the trip.
+
+Buffers and subscribers are per process, so with several uvicorn workers
+a subscriber is connected to one worker while writes land on any of them.
+Each published event is therefore also appended to the TripEvents table
+of the shared database, and a worker with subscribers tails that table
+(every POLL_INTERVAL, by seq) for events written by the other workers,
+which it then buffers and delivers as its own. Event ids stay per worker:
+a client that reconnects to another worker gets a "reset". If the table
+was trimmed past what a worker had read, its subscribers are cut off and
+their Last-Event-IDs expire, so they get a "reset" and refetch too.
+"""
+import asyncio
+import itertools
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+import orjson
+
+from db_writer import get_writer
+
+BUFFER_SIZE = 256           # events kept per trip for resuming
+MAX_TRIPS = 1000            # trips with a buffer; idle ones are dropped first
+QUEUE_SIZE = 256            # events a slow subscriber may fall behind before it is cut off
+HEARTBEAT = 15.0            # seconds between keep-alive comments
+RETRY_MS = 3000             # reconnect delay suggested to EventSource
+POLL_INTERVAL = 1.0         # seconds between reads of the shared log per process
+LOG_SIZE = 10000            # events kept in the shared log
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS TripEvents (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        trip_id INTEGER NOT NULL,
+        boot TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        data TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+"""
+
+BOOT = secrets.token_hex(4)
+
+
+class Event:
+    __slots__ = ("seq", "kind", "data")
+
+    def __init__(self, seq, kind, data):
+        self.seq = seq
+        self.kind = kind
+        self.data = data
+
+    @property
+    def id(self):
+        return f"{BOOT}-{self.seq}"
+
+    def encode(self):
+        return f"id: {self.id}\nevent: {self.kind}\ndata: ".encode() + orjson.dumps(self.data) + b"\n\n"
+
+
+def reset_event():
+    return b"event: reset\ndata: {}\n\n"
+
+
+def comment(text):
+    return f": {text}\n\n".encode()
+
+
+def parse_id(last_event_id):
+    """Sequence number of an event id from this process, else None"""
+    boot, _, seq = (last_event_id or "").rpartition("-")
+    if boot != BOOT or not seq.isdigit():
+        return None
+    return int(seq)
+
+
+class Subscription:
+    def __init__(self, feed, trip_id, loop):
+        self.feed = feed
+        self.trip_id = trip_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def _deliver(self, event):
+        # Runs on the subscriber's event loop
+        if self.overflowed:
+            return
+        if self.queue.full():
+            # Cut the stream off; the client resumes from its Last-Event-ID
+            self.overflowed = True
+            return
+        self.queue.put_nowait(event)
+
+    def _cut(self):
+        # Runs on the subscriber's event loop; ends the stream like an overflow
+        self.overflowed = True
+
+    async def next(self, timeout):
+        """The next event, or None on timeout or when the subscriber fell too far behind"""
+        if self.overflowed and self.queue.empty():
+            return None
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+
+class _Trip:
+    __slots__ = ("events", "subscribers", "dropped")
+
+    def __init__(self, dropped):
+        self.events = deque(maxlen=BUFFER_SIZE)
+        self.subscribers = set()
+        # Newest sequence that may belong to this trip but is no longer buffered
+        self.dropped = dropped
+
+
+class ChangeFeed:
+    def __init__(self, db_path=None, factory=sqlite3.Connection):
+        self.db_path = db_path      # shared log for other workers; None keeps the feed in-process
+        self.factory = factory      # connection factory of the shared writer (see db_writer.get_writer)
+        self._trips = OrderedDict()
+        self._seq = itertools.count(1)
+        self._last = 0
+        self._lock = threading.Lock()
+        self._tail = None           # newest log seq read; None until the first poll
+        self._polled = 0.0
+        self._poll_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _trip(self, trip_id):
+        trip = self._trips.get(trip_id)
+        if trip is None:
+            # A trip seen before may have been dropped along with its events
+            trip = self._trips[trip_id] = _Trip(self._last)
+            if len(self._trips) > MAX_TRIPS:
+                for other, state in self._trips.items():
+                    if not state.subscribers and other != trip_id:
+                        del self._trips[other]
+                        break
+        else:
+            self._trips.move_to_end(trip_id)
+        return trip
+
+    def publish(self, trip_id, kind, data):
+        """Record an event for `trip_id`, hand it to its subscribers and log it for other workers; safe from any thread"""
+        if trip_id is None:
+            return None
+        trip_id = int(trip_id)
+        event = self._record(trip_id, kind, data)
+        if self.db_path is not None:
+            future = get_writer(self.db_path, factory=self.factory).submit(
+                lambda conn: self._append(conn, trip_id, kind, data)
+            )
+            future.add_done_callback(_report_log_failure)
+        return event
+
+    def _record(self, trip_id, kind, data):
+        with self._lock:
+            trip = self._trip(trip_id)
+            event = Event(next(self._seq), kind, data)
+            self._last = event.seq
+            if len(trip.events) == BUFFER_SIZE:
+                trip.dropped = trip.events[0].seq
+            trip.events.append(event)
+            subscribers = list(trip.subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # The subscriber's loop is gone
+                self.unsubscribe(subscription)
+        return event
+
+    def _ensure_schema(self, conn):
+        if not self._schema_ready:
+            conn.execute(SCHEMA)
+            self._schema_ready = True
+
+    def _append(self, conn, trip_id, kind, data):
+        self._ensure_schema(conn)
+        conn.execute(
+            "INSERT INTO TripEvents (trip_id, boot, kind, data, created_at) VALUES (?, ?, ?, ?, ?)",
+            (trip_id, BOOT, kind, orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8"),
+             datetime.utcnow().isoformat())
+        )
+        conn.execute("DELETE FROM TripEvents WHERE seq <= (SELECT MAX(seq) FROM TripEvents) - ?", (LOG_SIZE,))
+
+    def poll(self, force=False):
+        """
+        Deliver events that other workers appended to the shared log since the last poll.
+        Blocking; at most one read per POLL_INTERVAL unless `force`. The first poll only
+        finds where the log ends, so call it before the first subscription.
+        """
+        if self.db_path is None or not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            if not force and self._tail is not None and now - self._polled < POLL_INTERVAL:
+                return
+            self._polled = now
+            conn = sqlite3.connect(self.db_path, factory=self.factory)
+            try:
+                self._ensure_schema(conn)
+                if self._tail is None:
+                    self._tail = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM TripEvents").fetchone()[0]
+                    return
+                rows = conn.execute(
+                    "SELECT seq, trip_id, boot, kind, data FROM TripEvents WHERE seq > ? ORDER BY seq", (self._tail,)
+                ).fetchall()
+            finally:
+                conn.close()
+            # seq has no holes, so a jump means rows were trimmed before this worker read them
+            if rows and rows[0][0] > self._tail + 1:
+                self._lose_track()
+            for seq, trip_id, boot, kind, data in rows:
+                self._tail = seq
+                if boot != BOOT:
+                    self._record(trip_id, kind, orjson.loads(data))
+        finally:
+            self._poll_lock.release()
+
+    def _lose_track(self):
+        """Expire every resume point and cut off the subscribers, so clients reset and refetch"""
+        with self._lock:
+            self._last = next(self._seq)
+            subscribers = []
+            for trip in self._trips.values():
+                trip.dropped = self._last
+                subscribers.extend(trip.subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._cut)
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+    def backlog(self, trip_id, after=None):
+        """Buffered events of a trip newer than sequence `after`; None if some may have been dropped"""
+        with self._lock:
+            return self._backlog(self._trips.get(trip_id), after)
+
+    @staticmethod
+    def _backlog(trip, after):
+        if trip is None:
+            return None if after is not None else []
+        if after is None:
+            return list(trip.events)
+        if trip.dropped > after:
+            return None
+        return [e for e in trip.events if e.seq > after]
+
+    def subscribe(self, trip_id, last_event_id=None):
+        """
+        (Subscription, missed events) for a client on the running event loop. Missed events
+        are None when the client should start over (unknown or expired Last-Event-ID).
+        """
+        subscription = Subscription(self, trip_id, asyncio.get_running_loop())
+        after = parse_id(last_event_id)
+        with self._lock:
+            trip = self._trip(trip_id)
+            trip.subscribers.add(subscription)
+            if last_event_id and after is None:
+                missed = None
+            elif after is None:
+                missed = []
+            else:
+                missed = self._backlog(trip, after)
+        return subscription, missed
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            trip = self._trips.get(subscription.trip_id)
+            if trip is not None:
+                trip.subscribers.discard(subscription)
+
+    def subscribers(self, trip_id):
+        with self._lock:
+            trip = self._trips.get(trip_id)
+            return len(trip.subscribers) if trip is not None else 0
+
+
+def _report_log_failure(future):
+    if future.exception() is not None:
+        print(f"Change feed log write failed: {future.exception()}")
+
+
+async def stream(subscription, missed, is_disconnected, heartbeat=HEARTBEAT):
+    """SSE body for one subscriber: missed events (or a reset), then live events until disconnect"""
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode()
+        if missed is None:
+            yield reset_event()
+        else:
+            for event in missed:
+                yield event.encode()
+        feed = subscription.feed
+        wait = min(heartbeat, POLL_INTERVAL) if feed.db_path is not None else heartbeat
+        idle = 0.0
+        while True:
+            if feed.db_path is not None:
+                await asyncio.to_thread(feed.poll)
+            event = await subscription.next(wait)
+            if event is not None:
+                idle = 0.0
+                yield event.encode()
+            elif subscription.overflowed or await is_disconnected():
+                return
+            else:
+                idle += wait
+                if idle >= heartbeat:
+                    idle = 0.0
+                    yield comment("keep-alive")
+    finally:
+        subscription.close()
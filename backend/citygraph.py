@@ -0,0 +1,161 @@
+"""
+Inter-city graph for multi-city trips.
+
+Nodes are the catalog's cities followed by its states (a destination can be
+either), each placed at the mean coordinates of its places. The full node x
+node great-circle distance matrix is computed once per catalog generation,
+written with the snapshot and memory-mapped, so planning a trip only
+gathers a k x k block of it. Travel times and fares for a mode are derived
+from those distances.
+
+plan_route() orders the destinations (exactly, by Held-Karp over subsets)
+to minimise travel time, and allocate_days() splits the trip's days between
+them by marginal value.
+"""
+import os
+
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+EARTH_RADIUS_KM = 6371.0
+ROAD_DETOUR = 1.3           # ground routes are longer than the great circle
+
+# mode: (average km/h, fixed hours for stations, check-in etc., INR per km)
+MODES = {
+    'flight': (650.0, 3.0, 5.0),
+    'train': (60.0, 0.5, 1.5),
+    'road': (50.0, 0.0, 2.0),
+    'bus': (45.0, 0.5, 1.2),
+    'car': (55.0, 0.0, 8.0),
+}
+GROUND_MODES = frozenset(('train', 'road', 'bus', 'car'))
+
+OVERNIGHT_AFTER = 8.0       # longer legs are taken overnight...
+NIGHT_HOURS = 14.0          # ...and only what runs past a 19:00-09:00 night costs daytime
+MAX_DESTINATIONS = 10       # Held-Karp is O(2^k k^2)
+ARRAYS = ("lat", "lon", "distances")
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class CityGraph:
+    def __init__(self, names, lat, lon, distances):
+        self.names = names              # city vocab, then state vocab
+        self.lat = lat                  # centroid per node (NaN without coordinates)
+        self.lon = lon
+        self.distances = distances      # km, float32, node x node
+        self._nodes = {}
+        for i, name in enumerate(names):
+            self._nodes.setdefault(name.casefold(), i)
+
+    def node(self, name):
+        return self._nodes.get(name.strip().casefold())
+
+    def legs(self, nodes, travel_mode):
+        """(km, hours, INR) matrices between `nodes` for `travel_mode`"""
+        mode = (travel_mode or "").lower()
+        speed, fixed, per_km = MODES.get(mode, MODES['train'])
+        km = np.asarray(self.distances[np.ix_(nodes, nodes)], dtype=float)
+        if mode in GROUND_MODES:
+            km = km * ROAD_DETOUR
+        # Nodes without coordinates are treated as a short hop rather than breaking the plan
+        km = np.nan_to_num(km, nan=0.0)
+        hours = np.where(km > 0, fixed + km / speed, 0.0)
+        return km, hours, km * per_km
+
+    def save(self, directory):
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f"graph.{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, load, names):
+        paths = [os.path.join(directory, f"graph.{name}.npy") for name in ARRAYS]
+        if not all(os.path.exists(p) for p in paths):
+            return None
+        return cls(names, *(load(p) for p in paths))
+
+
+def _centroids(codes, size, lat, lon):
+    known = (codes >= 0) & ~np.isnan(lat) & ~np.isnan(lon)
+    counts = np.bincount(codes[known], minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (np.bincount(codes[known], weights=lat[known], minlength=size) / counts,
+                np.bincount(codes[known], weights=lon[known], minlength=size) / counts)
+
+
+def build_graph(catalog):
+    """Centroids and the pairwise distance matrix for every city and state in `catalog`"""
+    lat, lon = catalog.numeric["Latitude"], catalog.numeric["Longitude"]
+    parts = [_centroids(np.asarray(catalog.codes[column]), len(catalog.vocab[column]), lat, lon)
+             for column in ("City", "State")]
+    node_lat = np.concatenate([p[0] for p in parts])
+    node_lon = np.concatenate([p[1] for p in parts])
+    distances = haversine(node_lat[:, None], node_lon[:, None], node_lat[None, :], node_lon[None, :])
+    return CityGraph(graph_names(catalog), node_lat, node_lon, distances.astype(np.float32))
+
+
+def graph_names(catalog):
+    return list(catalog.vocab["City"]) + list(catalog.vocab["State"])
+
+
+def city_graph(catalog):
+    """The catalog's city graph: mapped from its snapshot, or built once per generation"""
+    return catalog.derived("city_graph", lambda: build_graph(catalog))
+
+
+def plan_route(hours, start=None):
+    """
+    Visiting order of nodes 0..k-1 (indices into `hours`) with the least total travel
+    time, as an open path. With `start` (the index of an extra last row/column, e.g. the
+    trip's origin) the path leaves from there.
+    """
+    k = hours.shape[0] - (start is not None)
+    if k <= 1:
+        return list(range(k))
+    full = 1 << k
+    # best[mask, j]: shortest path covering `mask` and ending at j
+    best = np.full((full, k), np.inf)
+    parent = np.full((full, k), -1, dtype=np.int64)
+    for j in range(k):
+        best[1 << j, j] = hours[start, j] if start is not None else 0.0
+    step = hours[:k, :k]
+    for mask in range(1, full):
+        ends = [j for j in range(k) if mask >> j & 1]
+        if len(ends) < 2:
+            continue
+        for j in ends:
+            prev = mask ^ (1 << j)
+            via = best[prev, :] + step[:, j]
+            i = int(np.argmin(via))
+            if via[i] < best[mask, j]:
+                best[mask, j], parent[mask, j] = via[i], i
+    # Walk back from the cheapest end
+    order, mask, j = [], full - 1, int(np.argmin(best[full - 1]))
+    while j >= 0:
+        order.append(j)
+        mask, j = mask ^ (1 << j), int(parent[mask, j])
+    return order[::-1]
+
+
+def daytime_hours(leg_hours, max_hours):
+    """Sightseeing time a leg costs on the arrival day, rounded up to the half hour"""
+    if leg_hours > OVERNIGHT_AFTER:
+        leg_hours = max(0.0, leg_hours - NIGHT_HOURS)
+    return min(float(np.ceil(leg_hours * 2) / 2), max_hours)
+
+
+def allocate_days(day_values, num_days):
+    """
+    Days per stop: one each, then every remaining day to the stop whose next day adds
+    the most. `day_values[s][d]` is the value of stop s's (d+1)-th day.
+    """
+    days = [1] * len(day_values)
+    for _ in range(num_days - len(day_values)):
+        gains = [values[d] if d < len(values) else 0.0 for values, d in zip(day_values, days)]
+        days[int(np.argmax(gains))] += 1
+    return days
@@ -81,5 +81,69 @@ CREATE TABLE IF NOT EXISTS TravelDatasetImported (
   Food_Options TEXT,
   Kid_Friendly TEXT,
   Activity_Type TEXT,
-  imported_at TEXT
+  imported_at TEXT,
+  Best_Month_Mask INTEGER,
+  Best_Daypart_Mask INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS IdempotencyKeys (
+  scope TEXT NOT NULL,
+  key TEXT NOT NULL,
+  fingerprint TEXT NOT NULL,
+  response TEXT NOT NULL,
+  created_at TEXT NOT NULL,
+  PRIMARY KEY (scope, key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_trips_user ON Trips(user_id);
+CREATE INDEX IF NOT EXISTS idx_itinerary_trip ON ItineraryItems(trip_id);
+CREATE INDEX IF NOT EXISTS idx_expenses_trip ON Expenses(trip_id);
+CREATE INDEX IF NOT EXISTS idx_members_trip ON TripMembers(trip_id);
+CREATE INDEX IF NOT EXISTS idx_places_city ON TravelDatasetImported(City COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_places_name ON TravelDatasetImported(Name);
+
+CREATE TABLE IF NOT EXISTS ChecklistItems (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  trip_id INTEGER NOT NULL,
+  task TEXT NOT NULL,
+  is_completed BOOLEAN DEFAULT 0,
+  FOREIGN KEY (trip_id) REFERENCES Trips (id)
+);
+
+CREATE TABLE IF NOT EXISTS CatalogMeta (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  generation INTEGER NOT NULL,
+  published_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS FilterValues (
+  kind TEXT NOT NULL,
+  value TEXT NOT NULL,
+  PRIMARY KEY (kind, value)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS CityCentroids (
+  City TEXT PRIMARY KEY,
+  lat REAL,
+  lon REAL,
+  places INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS PlacePopularity (
+  place_name TEXT PRIMARY KEY,
+  trips INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS PlaceCooccurrence (
+  place_a TEXT NOT NULL,
+  place_b TEXT NOT NULL,
+  trips INTEGER NOT NULL,
+  PRIMARY KEY (place_a, place_b)
+);
+
+CREATE TABLE IF NOT EXISTS UserPlaceAffinity (
+  user_id INTEGER NOT NULL,
+  place_name TEXT NOT NULL,
+  trips INTEGER NOT NULL,
+  PRIMARY KEY (user_id, place_name)
 );
@@ -0,0 +1,120 @@
+"""
+Group-commit writer for SQLite.
+
+SQLite admits a single writer at a time, so rather than letting every
+request take the write lock and fsync on its own, small writes are queued
+as "intents" (callables taking a connection) to one writer thread. The
+thread applies whatever has queued up within a few milliseconds (or up to
+a batch limit) inside one transaction and commits once; each caller's
+future resolves only after that commit, so durability is unchanged.
+"""
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import WRITER_BATCH_SIZE, WRITER_QUEUE_WAIT
+
+MAX_BATCH = 64          # statements per group commit
+MAX_DELAY = 0.002       # seconds to wait for more intents after the first
+
+
+class GroupCommitWriter:
+    def __init__(self, db_path, max_batch=MAX_BATCH, max_delay=MAX_DELAY, factory=sqlite3.Connection):
+        self.db_path = db_path
+        self.factory = factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.commits = 0
+        self.intents = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="sqlite-group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, intent):
+        """Queue `intent(conn)`; the returned future resolves with its result after commit"""
+        future = Future()
+        self._queue.put((intent, future, time.perf_counter()))
+        return future
+
+    def execute(self, intent):
+        """Submit an intent and block until its group has been committed"""
+        return self.submit(intent).result()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers keep going while the writer commits; synchronous stays FULL
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            for _, _, queued_at in batch:
+                WRITER_QUEUE_WAIT.observe(started - queued_at)
+            WRITER_BATCH_SIZE.observe(len(batch))
+            outcomes = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for intent, future, _ in batch:
+                    # A savepoint per intent so one failing write doesn't sink the group
+                    conn.execute("SAVEPOINT intent")
+                    try:
+                        outcomes.append((future, intent(conn), None))
+                        conn.execute("RELEASE intent")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO intent")
+                        conn.execute("RELEASE intent")
+                        outcomes.append((future, None, e))
+                conn.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            self.commits += 1
+            self.intents += len(batch)
+            for future, result, error in outcomes:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_path, factory=sqlite3.Connection):
+    """
+    Process-wide writer for `db_path`, started on first use.
+    There is one writer per database, so every caller must ask for the same connection factory.
+    """
+    writer = _writers.get(db_path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(db_path)
+            if writer is None:
+                writer = _writers[db_path] = GroupCommitWriter(db_path, factory=factory)
+    if writer.factory is not factory:
+        raise ValueError(f"Writer for {db_path} uses {writer.factory.__name__}, not {factory.__name__}")
+    return writer
@@ -0,0 +1,99 @@
+"""
+Facet counts for the trip planner's filters.
+
+Every facet value owns a bitset over the catalog rows (one bit per row,
+packed into uint64 words), built once per catalog generation. For a filter
+selection, the count shown next to a value is the number of rows in scope
+that match every *other* facet's selection plus that value, i.e. what the
+result size would become if the user clicked it. Each facet's counts are
+one AND of its value bitsets with that base set, then a popcount.
+
+Duration is a threshold facet: its bitsets are cumulative ("up to N hours").
+"""
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# facet -> categorical catalog column
+FACETS = {
+    "type": "Type",
+    "significance": "Significance",
+    "activity": "Activity_Type",
+    "kid_friendly": "Kid_Friendly",
+}
+DURATION_FACET = "max_duration"
+DURATION_LIMITS = (1, 2, 3, 4, 6, 8)    # hours
+
+_BYTE_COUNTS = None
+
+
+def popcount(words):
+    """Set bits per row of a uint64 array, summed over the last axis"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    global _BYTE_COUNTS
+    if _BYTE_COUNTS is None:
+        _BYTE_COUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+    as_bytes = np.ascontiguousarray(words).view(np.uint8)
+    return _BYTE_COUNTS[as_bytes].sum(axis=-1)
+
+
+def pack(mask):
+    """Boolean row mask(s) -> uint64 words (last axis), zero-padded to a whole word"""
+    mask = np.asarray(mask, dtype=bool)
+    packed = np.packbits(mask, axis=-1, bitorder="little")
+    pad = (-packed.shape[-1]) % 8
+    if pad:
+        packed = np.concatenate([packed, np.zeros(packed.shape[:-1] + (pad,), dtype=np.uint8)], axis=-1)
+    return np.ascontiguousarray(packed).view("<u8")
+
+
+class FacetIndex:
+    def __init__(self, catalog):
+        self.size = catalog.size
+        self.words = (catalog.size + 63) // 64
+        self.values = {}            # facet -> value labels, in bitset row order
+        self.bits = {}              # facet -> (n_values, n_words) uint64
+        for facet, column in FACETS.items():
+            if column not in catalog.codes:
+                continue
+            codes = catalog.codes[column]
+            self.values[facet] = list(catalog.vocab[column])
+            rows = [pack(codes == code) for code in range(len(self.values[facet]))]
+            self.bits[facet] = np.stack(rows) if rows else np.zeros((0, self.words), dtype=np.uint64)
+        hours = catalog.numeric["time_needed_to_visit_hrs"]
+        self.values[DURATION_FACET] = [str(limit) for limit in DURATION_LIMITS]
+        self.bits[DURATION_FACET] = np.stack([pack(hours <= limit) for limit in DURATION_LIMITS])
+
+    def selection(self, facet, values):
+        """Bitset of rows having any of `values` (case-insensitive) for a categorical facet"""
+        wanted = {str(v).lower() for v in values}
+        rows = [i for i, label in enumerate(self.values[facet]) if label.lower() in wanted]
+        if not rows:
+            return np.zeros(self.words, dtype=np.uint64)
+        return np.bitwise_or.reduce(self.bits[facet][rows], axis=0)
+
+    def counts(self, scope, selections):
+        """
+        (total, {facet: {value: count}}) for rows in `scope` (a packed bitset) under
+        `selections` (facet -> packed bitset). Values absent from the scope are left out.
+        """
+        total = scope.copy()
+        for bits in selections.values():
+            total &= bits
+        facets = {}
+        for facet, bits in self.bits.items():
+            base = scope.copy()
+            for other, selected in selections.items():
+                if other != facet:
+                    base &= selected
+            present = popcount(bits & scope) > 0
+            counts = popcount(bits & base)
+            facets[facet] = {label: int(count) for label, count, keep
+                             in zip(self.values[facet], counts.tolist(), present.tolist()) if keep}
+        return int(popcount(total)), facets
+
+
+def facet_index(catalog):
+    """The catalog's FacetIndex, built once per generation"""
+    return catalog.derived("facets", lambda: FacetIndex(catalog))
@@ -0,0 +1,118 @@
+"""
+Materialized filter data for /api/filters.
+
+The filter vocabularies (distinct cities, states, types, significance
+levels, best times) and per-city centroids only change when an import
+publishes a catalog generation, so publish() writes them to FilterValues
+and CityCentroids in the same transaction as the swap. The endpoint then
+serializes them once per generation, keeps the JSON and a gzip copy in
+memory, and answers revalidations with a strong ETag and 304.
+"""
+import gzip
+import hashlib
+import sqlite3
+import threading
+
+import orjson
+
+TABLE = "TravelDatasetImported"
+
+# payload key -> catalog column
+FILTER_COLUMNS = {
+    "cities": "City",
+    "states": "State",
+    "types": "Type",
+    "significance": "Significance",
+    "best_times": "Best_Time_to_visit",
+}
+
+FILTER_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS FilterValues (
+        kind TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (kind, value)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS CityCentroids (
+        City TEXT PRIMARY KEY,
+        lat REAL,
+        lon REAL,
+        places INTEGER NOT NULL
+    );
+"""
+
+
+def materialized(conn):
+    """Whether a publish has filled the tables (db_init.sql creates them empty)"""
+    try:
+        return conn.execute("SELECT 1 FROM FilterValues LIMIT 1").fetchone() is not None
+    except sqlite3.OperationalError:
+        return False
+
+
+def materialize(conn, table=TABLE):
+    """Rewrite both tables from the catalog table; run inside the publishing transaction"""
+    for statement in FILTER_SCHEMA.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+    conn.execute("DELETE FROM FilterValues")
+    conn.execute("DELETE FROM CityCentroids")
+    for kind, column in FILTER_COLUMNS.items():
+        conn.execute(
+            f"INSERT INTO FilterValues (kind, value) SELECT DISTINCT ?, {column} FROM {table} WHERE {column} IS NOT NULL",
+            (kind,)
+        )
+    conn.execute(f"""
+        INSERT INTO CityCentroids (City, lat, lon, places)
+        SELECT City, AVG(Latitude), AVG(Longitude), COUNT(*) FROM {table}
+        WHERE City IS NOT NULL GROUP BY City
+    """)
+
+
+def load_payload(conn):
+    """The /api/filters document, read from the materialized tables"""
+    payload = {kind: [] for kind in FILTER_COLUMNS}
+    for kind, value in conn.execute("SELECT kind, value FROM FilterValues ORDER BY kind, value"):
+        payload[kind].append(value)
+    payload["city_data"] = [
+        {"City": city, "lat": lat, "lon": lon}
+        for city, lat, lon in conn.execute("SELECT City, lat, lon FROM CityCentroids ORDER BY City")
+    ]
+    return payload
+
+
+class FiltersEntry:
+    def __init__(self, generation, payload):
+        self.generation = generation
+        self.body = orjson.dumps(payload)
+        self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+        # Strong validators: same generation and same bytes, so each content-coding gets its own
+        self.etag = f'"g{generation}-{hashlib.sha1(self.body).hexdigest()[:16]}"'
+        self.gzip_etag = self.etag[:-1] + '-gz"'
+
+    def matches(self, if_none_match):
+        """
+        If-None-Match check (weak comparison, as RFC 9110 specifies for it). Either coding's tag
+        matches: both stand for the same document, and the 304 carries the tag of the coding served.
+        """
+        if not if_none_match:
+            return False
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags or self.gzip_etag in tags
+
+
+class FiltersCache:
+    """One serialized filters document, replaced when the catalog generation changes"""
+
+    def __init__(self):
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def get(self, generation, load):
+        entry = self._entry
+        if entry is not None and entry.generation == generation:
+            return entry
+        with self._lock:
+            entry = self._entry
+            if entry is None or entry.generation != generation:
+                entry = self._entry = FiltersEntry(generation, load())
+            return entry
@@ -0,0 +1,163 @@
+"""
+Idempotency-Key support for retried POSTs.
+
+The first request carrying a key runs normally and its JSON response is
+stored in the IdempotencyKeys table plus an in-process LRU. Retries with
+the same key are answered from there without re-running the handler, and
+a duplicate that arrives while the first is still executing waits for it.
+Keys expire after KEY_TTL in both places.
+
+Handlers built on a run_write intent should call `record(conn, response)`
+inside that intent, so the key is stored in the same transaction as the
+rows it guards. Other handlers (trip creation commits on its own
+connection and then sends email) have the key stored in a separate write
+after they return. A crash between the two leaves the work done but the
+key unrecorded, and a retry runs the handler again.
+"""
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi import HTTPException
+
+from db_writer import get_writer
+from metrics import CACHE_REQUESTS
+
+LRU_CAPACITY = 1024
+KEY_TTL = timedelta(hours=24)
+MAX_KEY_LENGTH = 255
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS IdempotencyKeys (
+        scope TEXT NOT NULL,
+        key TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        response TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (scope, key)
+    )
+"""
+
+
+class IdempotencyStore:
+    def __init__(self, db_path, capacity=LRU_CAPACITY, factory=sqlite3.Connection):
+        self.db_path = db_path
+        self.factory = factory      # connection factory of the shared writer (see db_writer.get_writer)
+        self.capacity = capacity
+        self._lru = OrderedDict()   # (scope, key) -> ((fingerprint, response), stored at)
+        self._inflight = {}         # (scope, key) -> (fingerprint, Future)
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def run(self, scope, key, payload, handler):
+        """
+        Return (response, replayed). `handler(record)` runs at most once per (scope, key);
+        `payload` is the serialized request, used to reject a key reused for a different body.
+        """
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+        fingerprint = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        ident = (scope, key)
+
+        with self._lock:
+            cached = self._lru.get(ident)
+            if cached is not None and datetime.utcnow() - cached[1] > KEY_TTL:
+                del self._lru[ident]
+                cached = None
+            if cached is not None:
+                self._lru.move_to_end(ident)
+                cached = cached[0]
+            else:
+                inflight = self._inflight.get(ident)
+                if inflight is None:
+                    owner = Future()
+                    self._inflight[ident] = (fingerprint, owner)
+
+        if cached is not None:
+            CACHE_REQUESTS.inc("idempotency", "hit")
+            return self._replay(cached, fingerprint), True
+        CACHE_REQUESTS.inc("idempotency", "miss")
+
+        if inflight is not None:
+            # Same key already executing: wait for it instead of running twice
+            first_fingerprint, future = inflight
+            response = future.result()
+            return self._replay((first_fingerprint, response), fingerprint), True
+
+        try:
+            stored = self._load(ident)
+            if stored is not None:
+                replayed = True
+                response = self._replay(stored, fingerprint)
+            else:
+                replayed = False
+                recorded = []
+
+                def record(conn, result):
+                    self._insert(conn, ident, fingerprint, result)
+                    recorded.append(True)
+
+                response = handler(record)
+                stored = (fingerprint, response)
+                if not recorded:
+                    self._save(ident, fingerprint, response)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[ident]
+            owner.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[ident]
+            self._lru[ident] = (stored, datetime.utcnow())
+            if len(self._lru) > self.capacity:
+                self._lru.popitem(last=False)
+        owner.set_result(stored[1])
+        return response, replayed
+
+    @staticmethod
+    def _replay(stored, fingerprint):
+        stored_fingerprint, response = stored
+        if stored_fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+        return response
+
+    def _ensure_schema(self, conn):
+        if not self._schema_ready:
+            conn.execute(SCHEMA)
+            self._schema_ready = True
+
+    def _load(self, ident):
+        # Another worker process may have answered this key already
+        conn = sqlite3.connect(self.db_path, factory=self.factory)
+        try:
+            self._ensure_schema(conn)
+            row = conn.execute(
+                "SELECT fingerprint, response FROM IdempotencyKeys WHERE scope = ? AND key = ? AND created_at >= ?",
+                (*ident, (datetime.utcnow() - KEY_TTL).isoformat())
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return row[0], orjson.loads(row[1])
+
+    def _insert(self, conn, ident, fingerprint, response):
+        """Store a key with `conn`, in whatever transaction it is in"""
+        now = datetime.utcnow()
+        body = orjson.dumps(response, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+        self._ensure_schema(conn)
+        conn.execute("DELETE FROM IdempotencyKeys WHERE created_at < ?", ((now - KEY_TTL).isoformat(),))
+        conn.execute(
+            "INSERT OR REPLACE INTO IdempotencyKeys (scope, key, fingerprint, response, created_at) VALUES (?, ?, ?, ?, ?)",
+            (*ident, fingerprint, body, now.isoformat())
+        )
+
+    def _save(self, ident, fingerprint, response):
+        get_writer(self.db_path, factory=self.factory).execute(
+            lambda conn: self._insert(conn, ident, fingerprint, response)
+        )
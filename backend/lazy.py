@@ -0,0 +1,32 @@
+"""
+Deferred imports for heavy modules.
+
+`np = lazy_import("numpy")` binds a stand-in that imports the real module
+on first attribute access, so modules that only need numpy/pandas in a few
+handlers don't pay for them at process start.
+"""
+import importlib
+
+
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            # importlib holds the import lock, so concurrent first uses import once
+            module = self._module = importlib.import_module(self._name)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
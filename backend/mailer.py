@@ -3,8 +3,9 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 from dotenv import load_dotenv
+from metrics import EMAIL_SENDS
 
-load_dotenv()
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
 
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
@@ -30,7 +31,9 @@ def send_itinerary_email(to_email, subject, html_body):
         server.sendmail(SMTP_USER, to_email, text)
         server.quit()
         print(f"Email sent to {to_email}")
+        EMAIL_SENDS.inc("sent")
         return True
     except Exception as e:
         print(f"Failed to send email: {e}")
+        EMAIL_SENDS.inc("failed")
         return False
@@ -1,39 +1,98 @@
-from fastapi import FastAPI, HTTPException, Depends, Response, Request
+from fastapi import FastAPI, HTTPException, Depends, Response, Request, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+from contextlib import asynccontextmanager
 import sqlite3
-import pandas as pd
-import numpy as np
 import bcrypt
 import os
 from dotenv import load_dotenv
-from authlib.integrations.starlette_client import OAuth
+from lazy import lazy_import
 
-load_dotenv()
+# numpy is only needed by a few handlers; import it on first use to keep cold start short
+np = lazy_import("numpy")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Explicit path: skips find_dotenv's directory walk at import time
+load_dotenv(os.path.join(BASE_DIR, ".env"))
 
-# Initialize OAuth
-oauth = OAuth()
 # These should be set in environment variables for security
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-if GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET:
-    oauth.register(
-        name='google',
-        client_id=GOOGLE_CLIENT_ID,
-        client_secret=GOOGLE_CLIENT_SECRET,
-        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-        client_kwargs={'scope': 'openid email profile'}
-    )
-else:
-    # In development, you can set dummy values or skip registration
-    pass
 
+_oauth = None
+
+def get_oauth():
+    """OAuth registry, built on first use so authlib stays out of the import path"""
+    global _oauth
+    if _oauth is None:
+        from authlib.integrations.starlette_client import OAuth
+        oauth = OAuth()
+        if GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET:
+            oauth.register(
+                name='google',
+                client_id=GOOGLE_CLIENT_ID,
+                client_secret=GOOGLE_CLIENT_SECRET,
+                server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+                client_kwargs={'scope': 'openid email profile'}
+            )
+        # In development, you can set dummy values or skip registration
+        _oauth = oauth
+    return _oauth
+
+import csv
+import itertools
+import io
 import json
 from datetime import datetime
 from mailer import send_itinerary_email
-
-app = FastAPI(title="Voyago Lite API")
+from serialization import ORJSONResponse, fetch_dicts, fetch_one, fetch_tuples
+from db_writer import get_writer
+from idempotency import IdempotencyStore
+import metrics
+from metrics import MetricsMiddleware, TimedConnection
+from admission import AdmissionMiddleware
+import changefeed
+from changefeed import ChangeFeed
+import profiling
+from profiling import ProfiledRoute, ProfilingMiddleware
+from catalog import CatalogStore
+from similarity import tfidf_index
+import personalization
+import filters
+from filters import FiltersCache
+import planner
+import seasonality
+import facets
+import surprise
+import replan
+from facets import facet_index
+import citygraph
+from citygraph import city_graph
+from search import correct_tokens, rebuild_search_index, resolve_destination, search_ids, search_index_exists, term_index, words
+
+# Absolute, so the app doesn't depend on the working directory; VOYAGO_DB_PATH points it at another file
+DB_PATH = os.getenv("VOYAGO_DB_PATH", os.path.join(BASE_DIR, "voyago_lite.db"))
+
+places_catalog = CatalogStore(DB_PATH)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load the catalog in the background: the server accepts requests immediately and
+    # a request that needs the catalog before warm-up finishes just loads it itself
+    places_catalog.warm()
+    yield
+
+app = FastAPI(title="Voyago Lite API", lifespan=lifespan)
+# Lets sampled/admin-requested requests be profiled inside the endpoint's own thread
+app.router.route_class = ProfiledRoute
+
+# Per-client token buckets and per-route concurrency limits for the expensive endpoints
+# (added before CORS so 429/503 responses still carry the CORS headers)
+app.add_middleware(AdmissionMiddleware)
 
 # CORS
 app.add_middleware(
@@ -51,14 +110,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-DB_PATH = "voyago_lite.db"
+app.add_middleware(ProfilingMiddleware)
+
+# Per-route latency, status and in-flight metrics, exposed at /metrics
+app.add_middleware(MetricsMiddleware)
+
+idempotency = IdempotencyStore(DB_PATH, factory=TimedConnection)
+
+def use_database(db_path):
+    """
+    Serve requests from another database file, e.g. a copy for benchmarks and tests.
+    The place catalog keeps coming from the original, which these copies share.
+    """
+    global DB_PATH, idempotency, trip_feed
+    DB_PATH = db_path
+    idempotency = IdempotencyStore(db_path, factory=TimedConnection)
+    trip_feed = ChangeFeed(db_path, factory=TimedConnection)
+
+# Per-trip change events for collaborators, streamed at /api/trips/{trip_id}/events;
+# logged in the database so every worker sees the others' events
+trip_feed = ChangeFeed(DB_PATH, factory=TimedConnection)
 
 # --- Database Helper ---
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
+def run_write(intent):
+    """
+    Run `intent(conn)` on the shared group-commit writer and return its result.
+    Use for small single-statement writes so bursts share one commit.
+    """
+    return get_writer(DB_PATH, factory=TimedConnection).execute(intent)
+
 # --- Models ---
 class UserSignup(BaseModel):
     full_name: str
@@ -77,6 +162,9 @@ class RecommendationRequest(BaseModel):
     budget: float
     num_days: int
     preferences: List[str]
+    user_id: Optional[int] = None  # Personalizes the ranking from the user's past trips
+    start_date: Optional[str] = None  # Travel dates: out-of-season places drop out, in-season ones rank higher
+    end_date: Optional[str] = None
 
 class TripCreate(BaseModel):
     user_id: int
@@ -87,10 +175,27 @@ class TripCreate(BaseModel):
     budget: float
     travel_mode: str
     selected_places: List[str] = [] # List of place names
+    destinations: List[str] = [] # Multi-city trips: cities/states to visit (overrides destination)
+    keep_order: bool = False # Visit destinations in the given order instead of the fastest one
     start_date: str
     end_date: str
     currency: str = "INR"  # NEW: Currency selection (USD, EUR, GBP, INR, JPY)
 
+class TripScenario(BaseModel):
+    """Fields of the base trip to change for one what-if variant"""
+    name: Optional[str] = None
+    num_days: Optional[int] = None
+    budget: Optional[float] = None
+    travel_mode: Optional[str] = None
+    destinations: Optional[List[str]] = None
+    keep_order: Optional[bool] = None
+
+class ScenarioRequest(BaseModel):
+    base: TripCreate
+    variations: List[TripScenario] = []
+    grid: Dict[str, List[Any]] = {}  # every combination, e.g. {"num_days": [3, 5], "travel_mode": ["train", "flight"]}
+    include_itinerary: bool = False
+
 class ExpenseCreate(BaseModel):
     trip_id: int
     user_id: int
@@ -102,6 +207,44 @@ class ExpenseCreate(BaseModel):
     payer: str  # Required field for who paid
     cleared: bool = False  # Optional field for settlement tracking
 
+class ExpenseUpdate(BaseModel):
+    id: int
+    category: Optional[str] = None
+    amount: Optional[float] = None
+    date: Optional[str] = None
+    note: Optional[str] = None
+    payer: Optional[str] = None
+    cleared: Optional[bool] = None
+
+class ExpenseBulkRequest(BaseModel):
+    insert: List[ExpenseCreate] = []
+    update: List[ExpenseUpdate] = []
+    delete: List[int] = []
+
+# --- Itinerary Models ---
+class ItineraryItemCreate(BaseModel):
+    trip_id: int
+    day: Optional[int] = None
+    place_name: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    notes: Optional[str] = None
+    estimated_cost: Optional[float] = None
+
+class ItineraryItemUpdate(BaseModel):
+    id: int
+    day: Optional[int] = None
+    place_name: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    notes: Optional[str] = None
+    estimated_cost: Optional[float] = None
+
+class ItineraryBulkRequest(BaseModel):
+    insert: List[ItineraryItemCreate] = []
+    update: List[ItineraryItemUpdate] = []
+    delete: List[int] = []
+
 # --- Trip Members Model ---
 class TripMemberCreate(BaseModel):
     trip_id: int
@@ -116,6 +259,49 @@ class ChecklistItemCreate(BaseModel):
 class ChecklistItemUpdate(BaseModel):
     is_completed: bool
 
+# --- Metrics ---
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(content=metrics.render_latest(), media_type=metrics.CONTENT_TYPE)
+
+# --- Request Profiles (admin) ---
+
+def _require_admin(token):
+    # Disabled entirely unless ADMIN_TOKEN is configured
+    if not profiling.is_admin(token):
+        raise HTTPException(status_code=404, detail="Not found")
+
+@app.get("/api/admin/profiles", include_in_schema=False)
+def list_request_profiles(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return profiling.list_profiles()
+
+@app.get("/api/admin/profiles/{profile_id}", include_in_schema=False)
+def download_request_profile(profile_id: int, format: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    """Download a captured profile: pstats/text for cProfile captures, speedscope for sampled ones"""
+    _require_admin(x_admin_token)
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found (it may have been evicted)")
+
+    if profile["mode"] == "cprofile":
+        format = format or "pstats"
+        if format == "pstats":
+            return Response(
+                content=profiling.to_pstats(profile),
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": f"attachment; filename=profile_{profile_id}.pstats"}
+            )
+        if format == "text":
+            return Response(content=profiling.to_text(profile), media_type="text/plain")
+    elif (format or "speedscope") == "speedscope":
+        return ORJSONResponse(
+            profiling.to_speedscope(profile),
+            headers={"Content-Disposition": f"attachment; filename=profile_{profile_id}.speedscope.json"}
+        )
+    raise HTTPException(status_code=400, detail=f"Format '{format}' is not available for {profile['mode']} profiles")
+
 # --- Auth Endpoints ---
 
 @app.post("/api/auth/signup")
@@ -170,10 +356,13 @@ def logout(response: Response):
 
 # --- Checklist Endpoints ---
 
-@app.get("/api/trips/{trip_id}/checklist")
-def get_checklist(trip_id: int):
-    conn = get_db_connection()
-    # Create table if not exists (lazy init)
+_checklist_table_ready = False
+
+def _ensure_checklist_table(conn):
+    # Create table if not exists (lazy init, once per process)
+    global _checklist_table_ready
+    if _checklist_table_ready:
+        return
     conn.execute("""
         CREATE TABLE IF NOT EXISTS ChecklistItems (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -183,288 +372,400 @@ def get_checklist(trip_id: int):
             FOREIGN KEY (trip_id) REFERENCES Trips (id)
         )
     """)
-    items = pd.read_sql_query("SELECT * FROM ChecklistItems WHERE trip_id = ?", conn, params=(trip_id,))
+    _checklist_table_ready = True
+
+@app.get("/api/trips/{trip_id}/checklist", response_class=ORJSONResponse)
+def get_checklist(trip_id: int):
+    conn = get_db_connection()
+    _ensure_checklist_table(conn)
+    # NEW: Includes progress percentage (WanderDog feature)
+    result = _fetch_checklist(conn, trip_id)
     conn.close()
-    
-    # NEW: Calculate progress percentage (WanderDog feature)
-    result = items.to_dict(orient='records')
-    if len(result) > 0:
-        completed = sum(1 for item in result if item['is_completed'])
-        progress = int((completed / len(result)) * 100)
-        return {"items": result, "progress": progress, "total": len(result), "completed": completed}
-    return {"items": [], "progress": 0, "total": 0, "completed": 0}
+    return ORJSONResponse(result)
 
 @app.post("/api/trips/{trip_id}/checklist")
 def add_checklist_item(trip_id: int, item: ChecklistItemCreate):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO ChecklistItems (trip_id, task) VALUES (?, ?)", (trip_id, item.task))
-    conn.commit()
-    new_id = cur.lastrowid
-    conn.close()
-    return {"id": new_id, "trip_id": trip_id, "task": item.task, "is_completed": False}
+    new_id = run_write(lambda conn: conn.execute(
+        "INSERT INTO ChecklistItems (trip_id, task) VALUES (?, ?)", (trip_id, item.task)
+    ).lastrowid)
+    created = {"id": new_id, "trip_id": trip_id, "task": item.task, "is_completed": False}
+    trip_feed.publish(trip_id, "checklist.created", created)
+    return created
 
 @app.put("/api/checklist/{item_id}")
 def update_checklist_item(item_id: int, item: ChecklistItemUpdate):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE ChecklistItems SET is_completed = ? WHERE id = ?", (item.is_completed, item_id))
-    conn.commit()
-    conn.close()
+    row = run_write(lambda conn: conn.execute(
+        "UPDATE ChecklistItems SET is_completed = ? WHERE id = ? RETURNING trip_id", (item.is_completed, item_id)
+    ).fetchone())
+    if row is not None:
+        trip_feed.publish(row[0], "checklist.updated", {"id": item_id, "is_completed": item.is_completed})
     return {"message": "Updated"}
 
 @app.delete("/api/checklist/{item_id}")
 def delete_checklist_item(item_id: int):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM ChecklistItems WHERE id = ?", (item_id,))
-    conn.commit()
-    conn.close()
+    row = run_write(lambda conn: conn.execute(
+        "DELETE FROM ChecklistItems WHERE id = ? RETURNING trip_id", (item_id,)
+    ).fetchone())
+    if row is not None:
+        trip_feed.publish(row[0], "checklist.deleted", {"id": item_id})
     return {"message": "Deleted"}
 
 # NEW: Export itinerary (WanderDog feature)
-@app.get("/api/trips/{trip_id}/export")
+@app.get("/api/trips/{trip_id}/export", response_class=ORJSONResponse)
 def export_itinerary(trip_id: int, format: str = "json"):
     conn = get_db_connection()
     
     # Get trip details
-    trip_df = pd.read_sql_query("SELECT * FROM Trips WHERE id = ?", conn, params=(trip_id,))
-    if trip_df.empty:
+    trip_data = fetch_one(conn, "SELECT * FROM Trips WHERE id = ?", (trip_id,))
+    if trip_data is None:
         conn.close()
         raise HTTPException(status_code=404, detail="Trip not found")
     
     # Get itinerary items
-    items_df = pd.read_sql_query("SELECT * FROM ItineraryItems WHERE trip_id = ? ORDER BY day, start_time", conn, params=(trip_id,))
+    item_cols, item_rows = fetch_tuples(conn, "SELECT * FROM ItineraryItems WHERE trip_id = ? ORDER BY day, start_time", (trip_id,))
+    
+    if format == "csv":
+        conn.close()
+        # Return CSV format
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        writer.writerow(item_cols)
+        writer.writerows(item_rows)
+        return Response(content=buf.getvalue(), media_type="text/csv", headers={"Content-Disposition": f"attachment; filename=trip_{trip_id}_itinerary.csv"})
     
     # Get checklist
-    checklist_df = pd.read_sql_query("SELECT * FROM ChecklistItems WHERE trip_id = ?", conn, params=(trip_id,))
+    _ensure_checklist_table(conn)
+    checklist = fetch_dicts(conn, "SELECT * FROM ChecklistItems WHERE trip_id = ?", (trip_id,))
     
     conn.close()
     
-    trip_data = trip_df.to_dict(orient='records')[0]
-    
     export_data = {
         "trip": trip_data,
-        "itinerary": items_df.to_dict(orient='records'),
-        "checklist": checklist_df.to_dict(orient='records') if not checklist_df.empty else [],
+        "itinerary": [dict(zip(item_cols, row)) for row in item_rows],
+        "checklist": checklist,
         "exported_at": datetime.utcnow().isoformat()
     }
     
-    if format == "csv":
-        # Return CSV format
-        csv_data = items_df.to_csv(index=False)
-        return Response(content=csv_data, media_type="text/csv", headers={"Content-Disposition": f"attachment; filename=trip_{trip_id}_itinerary.csv"})
-    
-    return export_data
+    return ORJSONResponse(export_data)
 
 # NEW: Surprise Me - Random Destination (using NumPy)
 @app.get("/api/surprise-destination")
-def get_surprise_destination():
-    conn = get_db_connection()
-    cities_df = pd.read_sql_query("SELECT DISTINCT City FROM TravelDatasetImported", conn)
-    conn.close()
-    
-    if cities_df.empty:
+def get_surprise_destination(weight: str = "balanced", region: str = "any", kid_friendly: bool = False):
+    if weight not in surprise.WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"weight must be one of {', '.join(surprise.WEIGHTS)}")
+    if region not in surprise.REGIONS:
+        raise HTTPException(status_code=400, detail=f"region must be one of {', '.join(surprise.REGIONS)}")
+
+    # Alias table per (weight, filter), built once per catalog generation
+    catalog = places_catalog.get()
+    alias, cities = surprise.sampler(catalog, weight, region, kid_friendly)
+    if alias.size == 0:
         return {"city": "Paris", "message": "How about Paris? 🎉"}
-    
-    # Use NumPy random choice
-    random_city = np.random.choice(cities_df['City'].values)
-    
+
+    code = int(cities[alias.draw(surprise.rng())])
+    random_city = catalog.vocab["City"][code]
+    top = catalog.records(surprise.city_stats(catalog).top.get(code, []))
+
     return {
         "city": random_city,
         "message": f"How about {random_city}? 🎉",
-        "emoji": "🎲"
+        "emoji": "🎲",
+        "top_places": [
+            {key: place[key] for key in ("id", "Name", "Type", "Google_review_rating")} for place in top
+        ],
     }
 
 # --- Data & Recommendations ---
 
-@app.get("/api/filters")
-def get_filters():
+_filters_cache = FiltersCache()
+
+def _load_filters():
     conn = get_db_connection()
-    # Get unique values for filters
-    df = pd.read_sql_query("SELECT DISTINCT City, State, Type, Significance, Best_Time_to_visit FROM TravelDatasetImported", conn)
-    
-    # Get city coordinates (approximate center)
-    city_coords = pd.read_sql_query("SELECT City, AVG(Latitude) as lat, AVG(Longitude) as lon FROM TravelDatasetImported GROUP BY City", conn)
-    
+    if not filters.materialized(conn):
+        # Databases that predate materialization: build the tables once from the live catalog
+        filters.materialize(conn)
+        conn.commit()
+    payload = filters.load_payload(conn)
     conn.close()
-    
-    city_data = city_coords.to_dict(orient='records')
-    
-    return {
-        "cities": sorted(df['City'].dropna().unique().tolist()),
-        "city_data": city_data,
-        "states": sorted(df['State'].dropna().unique().tolist()),
-        "types": sorted(df['Type'].dropna().unique().tolist()),
-        "significance": sorted(df['Significance'].dropna().unique().tolist()),
-        "best_times": sorted(df['Best_Time_to_visit'].dropna().unique().tolist())
-    }
+    return payload
 
-@app.post("/api/recommendations")
+@app.get("/api/filters")
+def get_filters(if_none_match: Optional[str] = Header(None), accept_encoding: Optional[str] = Header(None)):
+    # Serialized once per catalog generation; most page loads revalidate to a 304
+    entry = _filters_cache.get(places_catalog.get().generation, _load_filters)
+    gzipped = bool(accept_encoding) and "gzip" in accept_encoding.lower()
+    headers = {"ETag": entry.gzip_etag if gzipped else entry.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if entry.matches(if_none_match):
+        return Response(status_code=304, headers=headers)
+    if gzipped:
+        return Response(entry.gzipped, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+def _destination_mask(catalog, destination):
+    """Rows whose City or State matches `destination`, case-insensitively, or its closest spelling"""
+    mask = catalog.isin("City", [destination], casefold=True) | catalog.isin("State", [destination], casefold=True)
+    if not mask.any():
+        # Misspelled destination ("Dilli", "Pariss"): resolve against known cities/states
+        resolved = resolve_destination(catalog, destination)
+        if resolved is not None:
+            mask = catalog.isin("City", [resolved]) | catalog.isin("State", [resolved])
+    return mask
+
+def _by_rating(catalog, positions):
+    """`positions` ordered by Google rating, best first, unrated last"""
+    ratings = catalog.numeric["Google_review_rating"][positions]
+    return positions[np.argsort(-np.nan_to_num(ratings, nan=-np.inf), kind="stable")]
+
+@app.post("/api/recommendations", response_class=ORJSONResponse)
 def get_recommendations(req: RecommendationRequest):
-    conn = get_db_connection()
-    df = pd.read_sql_query("SELECT * FROM TravelDatasetImported", conn)
-    conn.close()
+    catalog = places_catalog.get()
     
     # 1. Filter by Destination (City or State)
-    # Check if destination matches City or State
-    mask = (df['City'].str.lower() == req.destination.lower()) | (df['State'].str.lower() == req.destination.lower())
-    filtered = df[mask].copy()
+    mask = _destination_mask(catalog, req.destination)
     
-    if filtered.empty:
+    if not mask.any():
         # Fallback: if no exact match, try partial match or return top rated overall
-        filtered = df.copy()
+        mask = np.ones(catalog.size, dtype=bool)
     
     # 2. Filter by Categories (Type)
     if req.categories:
-        filtered = filtered[filtered['Type'].isin(req.categories)]
+        mask &= catalog.isin("Type", req.categories)
         
     # 3. Filter by Significance
     if req.significance:
-        filtered = filtered[filtered['Significance'].isin(req.significance)]
+        mask &= catalog.isin("Significance", req.significance)
         
-    if filtered.empty:
-        return {"recommendations": []}
-
-    # 4. Compute Cost Estimate
+    positions = np.flatnonzero(mask)
+    if len(positions) == 0:
+        return ORJSONResponse({"recommendations": []})
+
+    # 4. Seasonality for the travel dates (kept as-is if nothing there is in season)
+    months = seasonality.travel_months(req.start_date, req.end_date)
+    if months is not None:
+        fits = seasonality.in_season(catalog, positions, months)
+        if fits.any():
+            positions = positions[fits]
+
+    fee = catalog.numeric["Entrance_Fee_INR"][positions]
+    rating = catalog.numeric["Google_review_rating"][positions]
+    hours = catalog.numeric["time_needed_to_visit_hrs"][positions]
+
+    # 5. Compute Cost Estimate
     # travel_mode_factor not passed in recommendation req, assuming average 1.0 for ranking
     travel_mode_factor = 1.0 
     
     # cost_estimate = Entrance_Fee_INR * (1 + 0.2 * (1 - normalized_rating/5)) * travel_mode_factor
-    filtered['cost_estimate'] = filtered['Entrance_Fee_INR'] * (1 + 0.2 * (1 - filtered['Google_review_rating']/5.0)) * travel_mode_factor
+    cost_estimate = fee * (1 + 0.2 * (1 - rating / 5.0)) * travel_mode_factor
     
     # day_multiplier = min(1.0, num_days / 3)
     day_multiplier = min(1.0, req.num_days / 3.0)
     
-    filtered['estimated_cost'] = np.round(filtered['cost_estimate'] * day_multiplier, 2)
+    estimated_cost = np.round(cost_estimate * day_multiplier, 2)
     
-    # 5. Compute Utility Score
+    # 6. Compute Utility Score
     # utility_score = (
     #   0.5 * (normalized_rating / 5.0) +
     #   0.3 * (min(1, budget / (estimated_cost + 1)) ) +
     #   0.2 * (1 / (1 + np.log1p(time_needed_to_visit_hrs)))
     # )
     
-    # Ensure numeric types
-    filtered['Google_review_rating'] = pd.to_numeric(filtered['Google_review_rating'])
-    filtered['time_needed_to_visit_hrs'] = pd.to_numeric(filtered['time_needed_to_visit_hrs'])
-    
-    # Normalize rating 0-5
-    min_r = filtered['Google_review_rating'].min()
-    max_r = filtered['Google_review_rating'].max()
-    if max_r > min_r:
-        filtered['normalized_rating'] = (filtered['Google_review_rating'] - min_r) / (max_r - min_r) * 5.0
-    else:
-        filtered['normalized_rating'] = 5.0
-
-    filtered['utility_score'] = (
-        0.5 * (filtered['normalized_rating'] / 5.0) +
-        0.3 * (np.minimum(1, req.budget / (filtered['estimated_cost'] + 1))) +
-        0.2 * (1 / (1 + np.log1p(filtered['time_needed_to_visit_hrs'])))
-    )
-    
-    # Sort and return top 15
-    top_n = filtered.sort_values(by='utility_score', ascending=False).head(15)
-    
-    return {"recommendations": top_n.to_dict(orient='records')}
+    # Normalize rating 0-5 (unrated places are ignored for the range)
+    normalized_rating = planner.normalized_ratings(rating)
+    utility_score = planner.utility_scores(normalized_rating, estimated_cost, hours, req.budget)
+    if months is not None:
+        utility_score = utility_score + seasonality.SEASON_BOOST * seasonality.seasonal(catalog, positions)
+
+    # 7. Personalization: places that co-occur with the user's past trip places
+    extra = {}
+    if req.user_id is not None:
+        conn = get_db_connection()
+        _ensure_personalization_tables(conn)
+        personal = personalization.personal_scores(conn, catalog, req.user_id, positions)
+        conn.close()
+        if personal.max() > 0:
+            personal = personal / personal.max()
+        utility_score = utility_score + personalization.PERSONAL_WEIGHT * personal
+        extra["personal_score"] = personal
+    
+    # Sort and return top 15 (places whose score can't be computed go last)
+    top = np.argsort(-np.nan_to_num(utility_score, nan=-np.inf), kind="stable")[:15]
+    
+    extra = {name: values[top] for name, values in extra.items()}
+    return ORJSONResponse({"recommendations": catalog.records(positions[top], extra={
+        "cost_estimate": cost_estimate[top],
+        "estimated_cost": estimated_cost[top],
+        "normalized_rating": normalized_rating[top],
+        "utility_score": utility_score[top],
+        **extra,
+    })})
+
+_personalization_tables_ready = False
+
+def _ensure_personalization_tables(conn):
+    # Created lazily for databases that predate personalization (once per process)
+    global _personalization_tables_ready
+    if not _personalization_tables_ready:
+        personalization.ensure_schema(conn)
+        _personalization_tables_ready = True
 
 # --- Trip Builder ---
 
-@app.post("/api/trips/create")
-def create_trip(trip: TripCreate):
-    conn = get_db_connection()
-    df = pd.read_sql_query("SELECT * FROM TravelDatasetImported", conn)
-    
-    # 1. Select Places
+def _idempotent(scope, key, payload, response, handler):
+    """
+    Run `handler(record)` once per Idempotency-Key; replays are flagged with a response header.
+    `record` is None without a key (see IdempotencyStore.run for what it does otherwise).
+    """
+    if not key:
+        return handler(None)
+    result, replayed = idempotency.run(scope, key, payload.model_dump_json(), handler)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+def _stop_candidates(catalog, trip, destination, multi_city=False):
+    """Catalog positions to plan from at one destination: the user's picks there, or all of it"""
+    mask = _destination_mask(catalog, destination)
     if trip.selected_places:
-        selected_df = df[df['Name'].isin(trip.selected_places)].copy()
+        picked = np.zeros(catalog.size, dtype=bool)
+        picked[catalog.positions("Name", trip.selected_places)] = True
+        # A single-destination trip keeps picks from anywhere, as before
+        mask = mask & picked if multi_city else picked
+    positions = np.flatnonzero(mask)
+    # Leave out places that are out of season on the travel dates, unless that leaves nothing
+    fits = seasonality.in_season(catalog, positions, seasonality.travel_months(trip.start_date, trip.end_date))
+    return positions[fits] if fits.any() else positions
+
+def _shared(shared, key, build):
+    """`build()` memoized in `shared` (a dict spanning the variants of one scenario request), if any"""
+    if shared is None:
+        return build()
+    if key not in shared:
+        shared[key] = build()
+    return shared[key]
+
+def _resolve_node(catalog, graph, stop):
+    node = graph.node(stop)
+    if node is None:
+        resolved = resolve_destination(catalog, stop)
+        node = graph.node(resolved) if resolved else None
+    return node
+
+MAX_TRIP_DAYS = 365
+
+def _plan_trip(catalog, trip, shared=None):
+    """
+    (itinerary items, transit estimate, route legs, destination label) for a trip request.
+    Writes nothing; `shared` lets several variants of one trip reuse candidates and legs.
+    """
+    if trip.num_days < 1:
+        raise HTTPException(status_code=400, detail="num_days must be at least 1")
+    if trip.num_days > MAX_TRIP_DAYS:
+        raise HTTPException(status_code=400, detail=f"num_days must be at most {MAX_TRIP_DAYS}")
+    t_factor = planner.mode_factor(trip.travel_mode)
+    transit_estimate = planner.transit_cost(t_factor, trip.num_days)
+    stops = list(dict.fromkeys(d.strip() for d in trip.destinations if d.strip())) or [trip.destination]
+
+    if len(stops) == 1:
+        # Choose what fits both the budget (after transit) and the trip's hours, then fill the days
+        candidates = _shared(shared, ("candidates", stops[0], False), lambda: _stop_candidates(catalog, trip, stops[0]))
+        if len(candidates) == 0:
+            raise HTTPException(status_code=400, detail="No places found for this trip")
+        items = planner.plan_places(catalog, candidates, trip.budget - transit_estimate, trip.num_days, t_factor)
+        if not items:
+            raise HTTPException(status_code=400, detail=f"Budget of ₹{trip.budget} doesn't cover any places after transit (₹{transit_estimate:.2f})")
+        return items, transit_estimate, [], stops[0]
+
+    if len(stops) > citygraph.MAX_DESTINATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {citygraph.MAX_DESTINATIONS} destinations per trip")
+    if trip.num_days < len(stops):
+        raise HTTPException(status_code=400, detail="A multi-city trip needs at least one day per destination")
+
+    graph = city_graph(catalog)
+    nodes = []
+    for stop in stops:
+        node = _shared(shared, ("node", stop), lambda: _resolve_node(catalog, graph, stop))
+        if node is None:
+            raise HTTPException(status_code=400, detail=f"Unknown destination: {stop}")
+        nodes.append(node)
+
+    # 1. City order: as given, or the least total travel time (leaving from the origin when it's known)
+    origin = graph.node(trip.origin) if trip.origin else None
+    graph_nodes = nodes + ([origin] if origin is not None else [])
+    km, hours, fares = _shared(shared, ("legs", tuple(graph_nodes), trip.travel_mode.lower()),
+                               lambda: graph.legs(graph_nodes, trip.travel_mode))
+    if trip.keep_order:
+        order = list(range(len(stops)))
     else:
-        # Use recommendation logic if no places selected
-        # (Simplified reuse of logic above or call internal function)
-        # For now, let's assume user selects places or we pick top 5 from destination
-        mask = (df['City'].str.lower() == trip.destination.lower()) | (df['State'].str.lower() == trip.destination.lower())
-        selected_df = df[mask].sort_values(by='Google_review_rating', ascending=False).head(5).copy()
+        order = _shared(shared, ("route", tuple(graph_nodes), trip.travel_mode.lower()),
+                        lambda: citygraph.plan_route(hours, start=len(stops) if origin is not None else None))
+
+    # 2. Days per city by marginal value, after one each (travel days count against the arrival city)
+    leg_fares = sum(fares[a, b] for a, b in zip(order, order[1:]))
+    budget_left = trip.budget - transit_estimate - leg_fares
+    arrivals = [0.0] + [citygraph.daytime_hours(hours[a, b], planner.MAX_HOURS_PER_DAY) for a, b in zip(order, order[1:])]
+    candidates = [_shared(shared, ("candidates", stops[i], True), lambda i=i: _stop_candidates(catalog, trip, stops[i], multi_city=True))
+                  for i in order]
+    values = [planner.day_values(catalog, c, budget_left, t_factor, trip.num_days, arrival)
+              for c, arrival in zip(candidates, arrivals)]
+    days = citygraph.allocate_days(values, trip.num_days)
+
+    # 3. Each city's days with the per-place planner; unspent budget carries on to later cities
+    items, route, first_day, days_left = [], [], 1, trip.num_days
+    for n, (i, stop_days, arrival) in enumerate(zip(order, days, arrivals)):
+        if n > 0:
+            prev = order[n - 1]
+            route.append({
+                "day": first_day, "from": stops[prev], "to": stops[i],
+                "distance_km": round(float(km[prev, i]), 1), "hours": round(float(hours[prev, i]), 1),
+                "estimated_cost": round(float(fares[prev, i]), 2),
+            })
+        share = budget_left * stop_days / days_left
+        planned = planner.plan_places(catalog, candidates[n], share, stop_days, t_factor, first_day, arrival)
+        budget_left -= sum(item['estimated_cost'] for item in planned)
+        items.extend(planned)
+        first_day += stop_days
+        days_left -= stop_days
+
+    if not items:
+        raise HTTPException(status_code=400, detail=f"Budget of ₹{trip.budget} doesn't cover any places after transit (₹{transit_estimate + leg_fares:.2f})")
+    return items, transit_estimate + leg_fares, route, " → ".join(stops[i] for i in order)
 
-    if selected_df.empty:
-        conn.close()
-        raise HTTPException(status_code=400, detail="No places found for this trip")
+@app.post("/api/trips/create")
+def create_trip(trip: TripCreate, response: Response, idempotency_key: Optional[str] = Header(None)):
+    return _idempotent("trips.create", idempotency_key, trip, response, lambda record: _create_trip(trip))
 
-    # 2. Greedy Fill Algorithm for Itinerary
-    # Sort by rating (proxy for utility here if not computed)
-    selected_df = selected_df.sort_values(by='Google_review_rating', ascending=False)
-    
-    itinerary_items = []
-    current_day = 1
-    day_time_used = 0
-    MAX_HOURS_PER_DAY = 8
+def _create_trip(trip: TripCreate):
+    catalog = places_catalog.get()
     
-    # Travel mode factor
-    mode_map = {'flight': 1.4, 'train': 1.0, 'road': 0.9, 'bus': 0.8, 'car': 1.2}
-    t_factor = mode_map.get(trip.travel_mode.lower(), 1.0)
-    
-    total_est_cost = 0
-    
-    for _, place in selected_df.iterrows():
-        duration = float(place['time_needed_to_visit_hrs'])
-        if duration <= 0: duration = 1.0
-        
-        if day_time_used + duration > MAX_HOURS_PER_DAY:
-            current_day += 1
-            day_time_used = 0
-            
-        if current_day > trip.num_days:
-            break # Trip full
-            
-        # Time arithmetic (Start 9:00 AM)
-        start_hour = 9 + day_time_used
-        end_hour = start_hour + duration
-        
-        start_time = f"{int(start_hour):02d}:{(start_hour%1)*60:02.0f}"
-        end_time = f"{int(end_hour):02d}:{(end_hour%1)*60:02.0f}"
-        
-        # Cost
-        fee = float(place['Entrance_Fee_INR'])
-        rating = float(place['Google_review_rating'])
-        # Cost formula
-        cost = fee * (1 + 0.2 * (1 - rating/5.0)) * t_factor
-        total_est_cost += cost
-        
-        itinerary_items.append({
-            "day": current_day,
-            "place_name": place['Name'],
-            "start_time": start_time,
-            "end_time": end_time,
-            "notes": f"Type: {place['Type']}",
-            "estimated_cost": round(cost, 2)
-        })
-        
-        day_time_used += duration
+    itinerary_items, transit_estimate, route, destination = _plan_trip(catalog, trip)
 
-    # Transit estimate
-    transit_estimate = 500 * t_factor * trip.num_days # Base 500 INR per day transit
+    total_est_cost = sum(item['estimated_cost'] for item in itinerary_items)
     total_trip_cost = total_est_cost + transit_estimate
     
     # 3. Save to DB
+    conn = get_db_connection()
+    _ensure_personalization_tables(conn)
     cur = conn.cursor()
     
-    # Generate HTML table
-    itinerary_df = pd.DataFrame(itinerary_items)
-    html_table = itinerary_df.to_html(classes='table table-sm', index=False)
+    # Generate HTML table (one <tbody> per day, so edits can re-render just their day)
+    html_table = replan.render_table(itinerary_items)
     
     # Insert with start_date and end_date
     cur.execute("""
         INSERT INTO Trips (user_id, origin, destination, category, num_days, budget, travel_mode, itinerary_html, total_cost, created_at, start_date, end_date)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (trip.user_id, trip.origin, trip.destination, ",".join(trip.categories), trip.num_days, trip.budget, trip.travel_mode, html_table, total_trip_cost, datetime.utcnow().isoformat(), trip.start_date, trip.end_date))
+    """, (trip.user_id, trip.origin, destination, ",".join(trip.categories), trip.num_days, trip.budget, trip.travel_mode, html_table, total_trip_cost, datetime.utcnow().isoformat(), trip.start_date, trip.end_date))
     
     trip_id = cur.lastrowid
     
     # Save Items
-    for item in itinerary_items:
-        cur.execute("""
-            INSERT INTO ItineraryItems (trip_id, day, place_name, start_time, end_time, notes, estimated_cost)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (trip_id, item['day'], item['place_name'], item['start_time'], item['end_time'], item['notes'], item['estimated_cost']))
+    _insert_itinerary_rows(cur, [
+        (trip_id, item['day'], item['place_name'], item['start_time'], item['end_time'], item['notes'], item['estimated_cost'])
+        for item in itinerary_items
+    ])
+
+    # Keep the co-occurrence model current (same transaction as the trip)
+    personalization.record_trip(cur, trip.user_id, [item['place_name'] for item in itinerary_items])
         
     conn.commit()
     
@@ -473,7 +774,7 @@ def create_trip(trip: TripCreate):
     user_row = cur.fetchone()
     if user_row:
         email_body = f"""
-        <h2>Trip Confirmed: {trip.destination}</h2>
+        <h2>Trip Confirmed: {destination}</h2>
         <p><strong>Dates:</strong> {trip.start_date} to {trip.end_date} ({trip.num_days} days)</p>
         <p><strong>Budget:</strong> ₹{trip.budget}</p>
         <p><strong>Total Estimated Cost:</strong> ₹{total_trip_cost:.2f}</p>
@@ -483,7 +784,7 @@ def create_trip(trip: TripCreate):
         <br>
         <p>Safe Travels!</p>
         """
-        send_itinerary_email(user_row['email'], f"Your Trip to {trip.destination}", email_body)
+        send_itinerary_email(user_row['email'], f"Your Trip to {destination}", email_body)
     
     conn.close()
     
@@ -491,15 +792,77 @@ def create_trip(trip: TripCreate):
         "trip_id": trip_id,
         "total_cost": total_trip_cost,
         "itinerary": itinerary_items,
+        "route": route,
         "html": html_table
     }
 
-@app.get("/api/trips/user/{user_id}")
+MAX_SCENARIOS = 24
+
+def _scenario_summary(trip, items, transit_estimate, route, destination):
+    place_cost = sum(item['estimated_cost'] for item in items)
+    hours = sum(planner.parse_clock(item['end_time']) - planner.parse_clock(item['start_time']) for item in items)
+    available = trip.num_days * planner.MAX_HOURS_PER_DAY
+    return {
+        "feasible": True,
+        "destination": destination,
+        "total_cost": round(place_cost + transit_estimate, 2),
+        "place_cost": round(place_cost, 2),
+        "transit_cost": round(transit_estimate, 2),
+        "budget_left": round(trip.budget - place_cost - transit_estimate, 2),
+        "places": len(items),
+        "days_used": len({item['day'] for item in items}),
+        "visit_hours": round(hours, 1),
+        "coverage": round(hours / available, 3) if available else 0.0,
+        "legs": len(route),
+    }
+
+@app.post("/api/trips/plan/scenarios", response_class=ORJSONResponse)
+def plan_trip_scenarios(req: ScenarioRequest):
+    """Plan variants of one trip side by side; nothing is saved and no email is sent"""
+    unknown = set(req.grid) - (set(TripScenario.model_fields) - {"name"})
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown grid fields: {', '.join(sorted(unknown))}")
+    variants = list(req.variations)
+    if req.grid:
+        keys = list(req.grid)
+        variants += [TripScenario(**dict(zip(keys, values))) for values in itertools.product(*req.grid.values())]
+    if not variants:
+        variants = [TripScenario(name="base")]
+    if len(variants) > MAX_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SCENARIOS} scenarios per request")
+
+    catalog = places_catalog.get()
+    shared = {}     # candidates, graph nodes and legs computed once for all variants
+    scenarios = []
+    for n, variant in enumerate(variants):
+        changes = variant.model_dump(exclude={"name"}, exclude_none=True)
+        trip = req.base.model_copy(update=changes)
+        summary = {"name": variant.name or ", ".join(f"{k}={v}" for k, v in changes.items()) or "base",
+                   "params": {"num_days": trip.num_days, "budget": trip.budget, "travel_mode": trip.travel_mode,
+                              "destinations": trip.destinations or [trip.destination]}}
+        try:
+            items, transit_estimate, route, destination = _plan_trip(catalog, trip, shared)
+        except HTTPException as e:
+            summary.update(feasible=False, error=e.detail)
+        else:
+            summary.update(_scenario_summary(trip, items, transit_estimate, route, destination))
+            if req.include_itinerary:
+                summary.update(itinerary=items, route=route)
+        scenarios.append(summary)
+
+    feasible = [s for s in scenarios if s["feasible"]]
+    return ORJSONResponse({
+        "scenarios": scenarios,
+        "cheapest": min(feasible, key=lambda s: s["total_cost"])["name"] if feasible else None,
+        "most_coverage": max(feasible, key=lambda s: (s["visit_hours"], -s["total_cost"]))["name"] if feasible else None,
+    })
+
+@app.get("/api/trips/user/{user_id}", response_class=ORJSONResponse)
 def get_user_trips(user_id: int):
     conn = get_db_connection()
-    trips = pd.read_sql_query("SELECT * FROM Trips WHERE user_id = ?", conn, params=(user_id,))
+    trips = fetch_dicts(conn, "SELECT * FROM Trips WHERE user_id = ?", (user_id,))
     conn.close()
-    return trips.to_dict(orient='records')
+    return ORJSONResponse(trips)
 
 @app.delete("/api/trips/{trip_id}")
 def delete_trip(trip_id: int):
@@ -519,6 +882,7 @@ def delete_trip(trip_id: int):
     cur.execute("DELETE FROM ItineraryItems WHERE trip_id = ?", (trip_id,))
     cur.execute("DELETE FROM Trips WHERE id = ?", (trip_id,))
     conn.commit()
+    trip_feed.publish(trip_id, "trip.deleted", {"id": trip_id})
     
     # Send cancellation email
     cur.execute("SELECT email FROM Users WHERE id = ?", (trip['user_id'],))
@@ -533,9 +897,36 @@ def delete_trip(trip_id: int):
     conn.close()
     return {"message": "Trip deleted successfully"}
 
-@app.get("/api/places")
+def _to_number(value, default):
+    """Coerce a loosely-typed catalog value to float, like pd.to_numeric(errors='coerce').fillna()"""
+    if value is None:
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return default if number != number else number
+
+@app.get("/api/places", response_class=ORJSONResponse)
 def get_places(city: str, activity: str = None, kid_friendly: bool = None, max_duration: float = None):
     conn = get_db_connection()
+    places = _query_places(conn, city, activity, kid_friendly, max_duration)
+    if not places:
+        # Unknown spelling of a known city: retry with the closest match
+        resolved = resolve_destination(places_catalog.get(), city)
+        if resolved is not None and resolved.lower() != city.lower():
+            places = _query_places(conn, resolved, activity, kid_friendly, max_duration)
+    conn.close()
+        
+    # Clean up data for frontend
+    for place in places:
+        place['Google_review_rating'] = _to_number(place['Google_review_rating'], 0)
+        place['Entrance_Fee_INR'] = _to_number(place['Entrance_Fee_INR'], 0)
+        place['time_needed_to_visit_hrs'] = _to_number(place['time_needed_to_visit_hrs'], 1)
+    
+    return ORJSONResponse(places)
+
+def _query_places(conn, city, activity, kid_friendly, max_duration):
     sql = "SELECT * FROM TravelDatasetImported WHERE City = ? COLLATE NOCASE"
     params = [city]
 
@@ -549,43 +940,121 @@ def get_places(city: str, activity: str = None, kid_friendly: bool = None, max_d
         sql += " AND time_needed_to_visit_hrs <= ?"
         params.append(max_duration)
 
-    df = pd.read_sql_query(sql, conn, params=params)
+    return fetch_dicts(conn, sql, params)
+
+@app.get("/api/places/facets", response_class=ORJSONResponse)
+def get_place_facets(
+    city: Optional[str] = None,
+    types: List[str] = Query([], alias="type"),
+    significance: List[str] = Query([]),
+    activity: List[str] = Query([]),
+    kid_friendly: Optional[bool] = None,
+    max_duration: Optional[float] = None,
+):
+    """Result count for the current filters, and for each other filter value if it were picked"""
+    catalog = places_catalog.get()
+    index = facet_index(catalog)
+    scope = facets.pack(_destination_mask(catalog, city) if city else np.ones(catalog.size, dtype=bool))
+
+    selections = {}
+    for facet, values in (("type", types), ("significance", significance), ("activity", activity)):
+        if values and facet in index.bits:
+            selections[facet] = index.selection(facet, values)
+    if kid_friendly is not None and "kid_friendly" in index.bits:
+        selections["kid_friendly"] = index.selection("kid_friendly", ["Yes" if kid_friendly else "No"])
+    if max_duration is not None:
+        selections[facets.DURATION_FACET] = facets.pack(catalog.numeric["time_needed_to_visit_hrs"] <= max_duration)
+
+    total, counts = index.counts(scope, selections)
+    return ORJSONResponse({"total": total, "facets": counts})
+
+MAX_SIMILAR_PLACES = 50
+
+@app.get("/api/places/{place_id}/similar", response_class=ORJSONResponse)
+def get_similar_places(place_id: int, k: int = 10, city: Optional[str] = None):
+    """Places most like `place_id` by description, activities, food and type (cosine over TF-IDF)"""
+    catalog = places_catalog.get()
+    positions = catalog.positions_of_ids([place_id])
+    if len(positions) == 0:
+        raise HTTPException(status_code=404, detail="Place not found")
+    position = int(positions[0])
+    k = max(1, min(k, MAX_SIMILAR_PLACES))
+
+    mask = catalog.isin("City", [city], casefold=True) if city else None
+    similar, scores = tfidf_index(catalog).similar(position, k, mask)
+    return ORJSONResponse({
+        "place": catalog.records([position])[0],
+        "similar": catalog.records(similar, extra={"similarity": scores}),
+    })
+
+# --- Search ---
+
+MAX_SEARCH_RESULTS = 100
+
+_search_index_ready = False
+
+def _ensure_search_index(conn):
+    # Databases imported before search existed get their index built once
+    global _search_index_ready
+    if _search_index_ready:
+        return
+    if not search_index_exists(conn):
+        run_write(rebuild_search_index)
+    _search_index_ready = True
+
+@app.get("/api/search", response_class=ORJSONResponse)
+def search_places(q: str, limit: int = 20):
+    """Full-text place search over names, cities, states, descriptions, activities and food"""
+    tokens = words(q)
+    if not tokens:
+        return ORJSONResponse({"query": q, "corrected": None, "results": []})
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+
+    catalog = places_catalog.get()
+    conn = get_db_connection()
+    _ensure_search_index(conn)
+    ids = search_ids(conn, tokens, limit)
+    corrected = None
+    if not ids:
+        # Nothing matched: retry with typos corrected against the indexed vocabulary
+        fixed = correct_tokens(term_index(catalog, conn), tokens)
+        if fixed is not None:
+            ids = search_ids(conn, fixed, limit)
+            corrected = " ".join(fixed) if ids else None
     conn.close()
-    
-    if df.empty:
-        return []
-        
-    # Clean up data for frontend
-    df['Google_review_rating'] = pd.to_numeric(df['Google_review_rating'], errors='coerce').fillna(0)
-    df['Entrance_Fee_INR'] = pd.to_numeric(df['Entrance_Fee_INR'], errors='coerce').fillna(0)
-    df['time_needed_to_visit_hrs'] = pd.to_numeric(df['time_needed_to_visit_hrs'], errors='coerce').fillna(1)
-    
-    return df.to_dict(orient='records')
+
+    return ORJSONResponse({
+        "query": q,
+        "corrected": corrected,
+        "results": catalog.records(catalog.positions_of_ids(ids)),
+    })
 
 # --- Expenses ---
 
 @app.post("/api/expenses")
-def add_expense(exp: ExpenseCreate):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO Expenses (trip_id, user_id, category, amount, currency, date, note, payer, cleared)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (exp.trip_id, exp.user_id, exp.category, exp.amount, exp.currency, exp.date, exp.note, exp.payer, exp.cleared))
-    conn.commit()
-    new_id = cur.lastrowid
-    conn.close()
-    return {"message": "Expense added", "id": new_id}
-
-@app.get("/api/trips/{trip_id}/expenses")
+def add_expense(exp: ExpenseCreate, response: Response, idempotency_key: Optional[str] = Header(None)):
+    return _idempotent("expenses.add", idempotency_key, exp, response, lambda record: _add_expense(exp, record))
+
+def _add_expense(exp: ExpenseCreate, record=None):
+    def apply(conn):
+        new_id = conn.execute(EXPENSE_INSERT_SQL, (
+            exp.trip_id, exp.user_id, exp.category, exp.amount, exp.currency, exp.date, exp.note, exp.payer, exp.cleared
+        )).lastrowid
+        result = {"message": "Expense added", "id": new_id}
+        if record is not None:
+            # The key commits together with the expense
+            record(conn, result)
+        return result
+    result = run_write(apply)
+    trip_feed.publish(exp.trip_id, "expense.created", {"id": result["id"], **exp.model_dump()})
+    return result
+
+@app.get("/api/trips/{trip_id}/expenses", response_class=ORJSONResponse)
 def get_trip_expenses(trip_id: int):
     conn = get_db_connection()
-    expenses_df = pd.read_sql_query(
-        "SELECT * FROM Expenses WHERE trip_id = ? ORDER BY date DESC",
-        conn, params=(trip_id,)
-    )
+    expenses = _fetch_expenses(conn, trip_id)
     conn.close()
-    return expenses_df.to_dict(orient='records')
+    return ORJSONResponse(expenses)
 
 @app.get("/api/trips/{trip_id}/actually-spent")
 def get_actually_spent(trip_id: int):
@@ -623,16 +1092,13 @@ def get_actually_spent(trip_id: int):
     flight_fees = np.sum(travel_cost_array * day_multiplier)
     
     # Get all expenses
-    expenses_df = pd.read_sql_query(
-        "SELECT amount FROM Expenses WHERE trip_id = ?",
-        conn, params=(trip_id,)
-    )
+    _, amount_rows = fetch_tuples(conn, "SELECT amount FROM Expenses WHERE trip_id = ?", (trip_id,))
     conn.close()
     
     # Use NumPy to sum expenses
-    if not expenses_df.empty:
-        expenses_array = np.array(expenses_df['amount'].values, dtype=float)
-        total_expenses = np.sum(expenses_array)
+    if amount_rows:
+        expenses_array = np.array([row[0] for row in amount_rows], dtype=float)
+        total_expenses = np.nansum(expenses_array)
     else:
         total_expenses = 0.0
     
@@ -658,27 +1124,24 @@ def clear_trip_expenses(trip_id: int):
     deleted_count = cur.rowcount
     conn.commit()
     conn.close()
+    if deleted_count:
+        trip_feed.publish(trip_id, "expenses.cleared", {"count": deleted_count})
     return {"message": f"Cleared {deleted_count} expenses", "count": deleted_count}
 
 @app.delete("/api/expenses/{expense_id}")
 def delete_expense(expense_id: int):
     """Delete a single expense by ID"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM Expenses WHERE id = ?", (expense_id,))
-    deleted_count = cur.rowcount
-    conn.commit()
-    conn.close()
-    if deleted_count == 0:
+    row = run_write(lambda conn: conn.execute(
+        "DELETE FROM Expenses WHERE id = ? RETURNING trip_id", (expense_id,)
+    ).fetchone())
+    if row is None:
         raise HTTPException(status_code=404, detail="Expense not found")
+    trip_feed.publish(row[0], "expense.deleted", {"id": expense_id})
     return {"message": "Expense deleted", "id": expense_id}
 
 @app.patch("/api/expenses/{expense_id}")
 def update_expense(expense_id: int, data: dict):
     """Update expense fields (e.g., mark as cleared)"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     # Build dynamic UPDATE query based on provided fields
     allowed_fields = ['cleared', 'note', 'amount', 'category', 'date', 'payer']
     updates = []
@@ -693,16 +1156,14 @@ def update_expense(expense_id: int, data: dict):
         raise HTTPException(status_code=400, detail="No valid fields to update")
     
     values.append(expense_id)
-    query = f"UPDATE Expenses SET {', '.join(updates)} WHERE id = ?"
+    query = f"UPDATE Expenses SET {', '.join(updates)} WHERE id = ? RETURNING trip_id"
     
-    cur.execute(query, values)
-    updated_count = cur.rowcount
-    conn.commit()
-    conn.close()
+    row = run_write(lambda conn: conn.execute(query, values).fetchone())
     
-    if updated_count == 0:
+    if row is None:
         raise HTTPException(status_code=404, detail="Expense not found")
     
+    trip_feed.publish(row[0], "expense.updated", {"id": expense_id, **{f: data[f] for f in allowed_fields if f in data}})
     return {"message": "Expense updated", "id": expense_id}
 
 # --- Trip Members ---
@@ -735,6 +1196,7 @@ def add_trip_member(member: TripMemberCreate):
     conn.commit()
     member_id = cur.lastrowid
     conn.close()
+    trip_feed.publish(member.trip_id, "member.added", {"id": member_id, "name": member.name, "email": member.email})
     
     # Send email invite
     email_body = f"""
@@ -754,32 +1216,56 @@ def add_trip_member(member: TripMemberCreate):
     
     return {"message": "Member added successfully", "id": member_id, "name": member.name, "email": member.email}
 
-@app.get("/api/trips/{trip_id}/members")
+@app.get("/api/trips/{trip_id}/members", response_class=ORJSONResponse)
 def get_trip_members(trip_id: int):
     """Get all members for a trip"""
     conn = get_db_connection()
-    members_df = pd.read_sql_query(
-        "SELECT * FROM TripMembers WHERE trip_id = ? ORDER BY added_at",
-        conn, params=(trip_id,)
-    )
+    members = _fetch_members(conn, trip_id)
     conn.close()
-    return members_df.to_dict(orient='records')
+    return ORJSONResponse(members)
 
 @app.delete("/api/trip-members/{member_id}")
 def delete_trip_member(member_id: int):
     """Remove a member from a trip"""
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("DELETE FROM TripMembers WHERE id = ?", (member_id,))
-    deleted_count = cur.rowcount
+    row = cur.execute("DELETE FROM TripMembers WHERE id = ? RETURNING trip_id", (member_id,)).fetchone()
     conn.commit()
     conn.close()
     
-    if deleted_count == 0:
+    if row is None:
         raise HTTPException(status_code=404, detail="Member not found")
     
+    trip_feed.publish(row[0], "member.removed", {"id": member_id})
+    
     return {"message": "Member removed successfully"}
 
+# --- Trip Change Feed ---
+
+def _trip_exists(trip_id):
+    conn = get_db_connection()
+    row = conn.execute("SELECT 1 FROM Trips WHERE id = ?", (trip_id,)).fetchone()
+    conn.close()
+    return row is not None
+
+@app.get("/api/trips/{trip_id}/events")
+async def trip_events(trip_id: int, request: Request, after: Optional[str] = None, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-sent events for a trip's expenses, members, itinerary and checklist.
+    EventSource resends Last-Event-ID on reconnect; `after` sets it for the first connection.
+    A "reset" event means the missed changes are gone and the trip should be refetched.
+    """
+    if not await run_in_threadpool(_trip_exists, trip_id):
+        raise HTTPException(status_code=404, detail="Trip not found")
+    # Catch up on the other workers' log first, so nothing written from here on is missed
+    await run_in_threadpool(trip_feed.poll, True)
+    subscription, missed = trip_feed.subscribe(trip_id, last_event_id or after)
+    return StreamingResponse(
+        changefeed.stream(subscription, missed, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 # --- Session Validation ---
 @app.get("/api/auth/validate")
@@ -807,116 +1293,360 @@ def validate_session(request: Request):
     }
 
 # --- Itinerary Management ---
-@app.get("/api/itinerary/{trip_id}")
+@app.get("/api/itinerary/{trip_id}", response_class=ORJSONResponse)
 def get_itinerary_items(trip_id: int):
     """Get all itinerary items for a trip, enriched with lat/lon"""
     conn = get_db_connection()
-    query = """
-        SELECT ii.*, td.Latitude, td.Longitude, td.Type
-        FROM ItineraryItems ii
-        LEFT JOIN TravelDatasetImported td ON ii.place_name = td.Name
-        WHERE ii.trip_id = ?
-        ORDER BY ii.day, ii.start_time
-    """
-    items = pd.read_sql_query(query, conn, params=(trip_id,))
+    items = _fetch_itinerary(conn, trip_id)
     conn.close()
-    return items.to_dict(orient='records')
+    return ORJSONResponse(items)
+
+def _replanned(cur, touched, mutate, anchors=None, order=None):
+    """
+    Run `mutate()` and then re-plan only the (trip, day) pairs in `touched`, in the same transaction.
+    `anchors(result)` names the items whose times the edit set (they keep them); `order` maps item
+    ids to the position the edit gave them. Returns mutate's result and the touched days' items,
+    to publish once the write commits.
+    """
+    before = replan.day_costs(cur, touched)
+    result = mutate()
+    replan.replan(cur, touched, before, anchors(result) if anchors else (), order)
+    return result, _day_items(cur, touched)
+
+def _day_items(cur, touched):
+    """{trip_id: {"days": [...], "items": [...]}}: the current rows of each touched day"""
+    changes = {}
+    for trip_id, days in touched.items():
+        items = []
+        for day in days:
+            rows = cur.execute(
+                "SELECT id, trip_id, day, place_name, start_time, end_time, notes, estimated_cost FROM ItineraryItems "
+                "WHERE trip_id = ? AND day IS ? ORDER BY start_time, id", (trip_id, day)
+            ).fetchall()
+            items.extend(dict(row) for row in rows)
+        changes[trip_id] = {"days": sorted(days, key=lambda d: (d is None, d or 0)), "items": items}
+    return changes
+
+def _publish_days(changes):
+    # A day listed without items was emptied; clients replace each listed day wholesale
+    for trip_id, change in changes.items():
+        trip_feed.publish(trip_id, "itinerary.changed", change)
 
 @app.put("/api/itinerary/{item_id}")
 def update_itinerary_item(item_id: int, item: dict):
-    """Update an itinerary item"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        UPDATE ItineraryItems 
-        SET day = ?, place_name = ?, start_time = ?, end_time = ?, notes = ?, estimated_cost = ?
-        WHERE id = ?
-    """, (item.get('day'), item.get('place_name'), item.get('start_time'), 
-          item.get('end_time'), item.get('notes'), item.get('estimated_cost'), item_id))
-    
-    conn.commit()
-    conn.close()
+    """Update an itinerary item; the old and new day are rescheduled"""
+    def apply(conn):
+        cur = conn.cursor()
+        touched = replan.touched_days(cur, [item_id])
+        for trip_id in list(touched):
+            replan.merge(touched, trip_id, item.get('day'))
+        # Times sent with the update are kept; the rest of the day moves around them
+        explicit = {item_id} if replan.timed(item.get('start_time'), item.get('end_time')) else set()
+        return _replanned(cur, touched, lambda: cur.execute("""
+            UPDATE ItineraryItems 
+            SET day = ?, place_name = ?, start_time = ?, end_time = ?, notes = ?, estimated_cost = ?
+            WHERE id = ?
+        """, (item.get('day'), item.get('place_name'), item.get('start_time'), 
+              item.get('end_time'), item.get('notes'), item.get('estimated_cost'), item_id)),
+            anchors=lambda _: explicit)
+    _, changes = run_write(apply)
+    _publish_days(changes)
     return {"message": "Item updated successfully"}
 
 @app.delete("/api/itinerary/{item_id}")
 def delete_itinerary_item(item_id: int):
-    """Delete an itinerary item"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM ItineraryItems WHERE id = ?", (item_id,))
-    conn.commit()
-    conn.close()
+    """Delete an itinerary item; the rest of its day moves up"""
+    def apply(conn):
+        cur = conn.cursor()
+        return _replanned(cur, replan.touched_days(cur, [item_id]),
+                          lambda: cur.execute("DELETE FROM ItineraryItems WHERE id = ?", (item_id,)))
+    _, changes = run_write(apply)
+    _publish_days(changes)
     return {"message": "Item deleted successfully"}
 
 @app.post("/api/itinerary")
 def add_itinerary_item(item: dict):
-    """Add a new itinerary item"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        INSERT INTO ItineraryItems (trip_id, day, place_name, start_time, end_time, notes, estimated_cost)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (item.get('trip_id'), item.get('day'), item.get('place_name'), 
-          item.get('start_time'), item.get('end_time'), item.get('notes'), item.get('estimated_cost')))
-    
-    conn.commit()
-    item_id = cur.lastrowid
-    conn.close()
+    """Add a new itinerary item; its day is rescheduled around it"""
+    def apply(conn):
+        cur = conn.cursor()
+        touched = replan.merge({}, item.get('trip_id'), item.get('day'))
+        timed = replan.timed(item.get('start_time'), item.get('end_time'))
+        return _replanned(cur, touched, lambda: cur.execute(ITINERARY_INSERT_SQL, (
+            item.get('trip_id'), item.get('day'), item.get('place_name'), 
+            item.get('start_time'), item.get('end_time'), item.get('notes'), item.get('estimated_cost')
+        )).lastrowid, anchors=lambda new_id: {new_id} if timed else set())
+    item_id, changes = run_write(apply)
+    _publish_days(changes)
     return {"message": "Item added successfully", "id": item_id}
 
-# --- Places with Coordinates ---
+# --- Bulk Writes ---
 
-@app.get("/api/places")
-def get_places(city: str, activity: str = None, kid_friendly: bool = None, max_duration: float = None):
-    conn = get_db_connection()
-    sql = "SELECT * FROM TravelDatasetImported WHERE City = ? COLLATE NOCASE"
-    params = [city]
+MAX_BULK_ITEMS = 500
 
-    if activity:
-        sql += " AND Activity_Type = ?"
-        params.append(activity)
-    if kid_friendly is not None:
-        sql += " AND Kid_Friendly = ?"
-        params.append('Yes' if kid_friendly else 'No')
-    if max_duration:
-        sql += " AND time_needed_to_visit_hrs <= ?"
-        params.append(max_duration)
+ITINERARY_COLUMNS = ("day", "place_name", "start_time", "end_time", "notes", "estimated_cost")
 
-    df = pd.read_sql_query(sql, conn, params=params)
-    conn.close()
-    
-    if df.empty:
+ITINERARY_INSERT_SQL = """
+    INSERT INTO ItineraryItems (trip_id, day, place_name, start_time, end_time, notes, estimated_cost)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+EXPENSE_INSERT_SQL = """
+    INSERT INTO Expenses (trip_id, user_id, category, amount, currency, date, note, payer, cleared)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _insert_rows(cur, sql, rows):
+    """
+    executemany() an INSERT and return the new row ids.
+    Relies on AUTOINCREMENT handing out consecutive ids inside one write transaction.
+    """
+    if not rows:
         return []
-        
-    # Clean up data for frontend
-    df['Google_review_rating'] = pd.to_numeric(df['Google_review_rating'], errors='coerce').fillna(0)
-    df['Entrance_Fee_INR'] = pd.to_numeric(df['Entrance_Fee_INR'], errors='coerce').fillna(0)
-    df['time_needed_to_visit_hrs'] = pd.to_numeric(df['time_needed_to_visit_hrs'], errors='coerce').fillna(1)
-    
-    return df.to_dict(orient='records')
+    cur.executemany(sql, rows)
+    last_id = cur.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return list(range(last_id - len(rows) + 1, last_id + 1))
+
+def _insert_itinerary_rows(cur, rows):
+    return _insert_rows(cur, ITINERARY_INSERT_SQL, rows)
+
+def _existing_ids(cur, table, ids):
+    """{id: trip_id} for the rows of `table` that exist"""
+    if not ids:
+        return {}
+    placeholders = ",".join("?" * len(ids))
+    cur.execute(f"SELECT id, trip_id FROM {table} WHERE id IN ({placeholders})", list(ids))
+    return {row[0]: row[1] for row in cur.fetchall()}
+
+def _run_bulk(table, insert_sql, insert_rows, updates, delete_ids, touched=None, event=None, anchors=None, order=None):
+    """
+    Apply inserts, updates and deletes for one table in a single write intent.
+    `updates` is a list of (id, {column: value}); rows sharing a column set go through one executemany.
+    `touched(cur)`, if given, names the itinerary days to re-plan once the batch is applied; those days
+    are then published to the trip feed (`anchors` and `order` are passed on to _replanned). Otherwise
+    `event`, if given, is published per trip with the ids inserted, updated and deleted.
+    Returns per-item outcomes in request order (inserts, then updates, then deletes).
+    """
+    total = len(insert_rows) + len(updates) + len(delete_ids)
+    if total > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_ITEMS} items per bulk request")
+
+    def apply(conn):
+        cur = conn.cursor()
+        if touched is not None:
+            return _replanned(cur, touched(cur), lambda: mutate(cur), anchors, order)
+        return mutate(cur), {}
+
+    def mutate(cur):
+        new_ids = _insert_rows(cur, insert_sql, insert_rows)
+
+        found = _existing_ids(cur, table, [item_id for item_id, _ in updates] + list(delete_ids))
+
+        groups = {}
+        for item_id, fields in updates:
+            if item_id in found and fields:
+                groups.setdefault(tuple(fields), []).append(tuple(fields.values()) + (item_id,))
+        for columns, rows in groups.items():
+            assignments = ", ".join(f"{col} = ?" for col in columns)
+            cur.executemany(f"UPDATE {table} SET {assignments} WHERE id = ?", rows)
+
+        doomed = [(item_id,) for item_id in delete_ids if item_id in found]
+        cur.executemany(f"DELETE FROM {table} WHERE id = ?", doomed)
+        return new_ids, found
+
+    # The whole batch is a single intent, so it commits (or rolls back) atomically
+    (new_ids, found), changes = run_write(apply)
+    _publish_days(changes)
+
+    results = [{"op": "insert", "index": i, "id": new_id, "status": "ok"} for i, new_id in enumerate(new_ids)]
+    for i, (item_id, fields) in enumerate(updates):
+        if item_id not in found:
+            status = "not_found"
+        else:
+            status = "ok" if fields else "unchanged"
+        results.append({"op": "update", "index": i, "id": item_id, "status": status})
+    for i, item_id in enumerate(delete_ids):
+        results.append({"op": "delete", "index": i, "id": item_id, "status": "ok" if item_id in found else "not_found"})
+
+    if event:
+        by_trip = {}
+        def note(trip_id, op, item_id):
+            by_trip.setdefault(trip_id, {"inserted": [], "updated": [], "deleted": []})[op].append(item_id)
+        for row, new_id in zip(insert_rows, new_ids):
+            note(row[0], "inserted", new_id)
+        for item_id, fields in updates:
+            if fields and item_id in found:
+                note(found[item_id], "updated", item_id)
+        for item_id in delete_ids:
+            if item_id in found:
+                note(found[item_id], "deleted", item_id)
+        for trip_id, ids in by_trip.items():
+            trip_feed.publish(trip_id, event, ids)
+
+    applied = sum(1 for r in results if r["status"] == "ok")
+    return {"applied": applied, "failed": len(results) - applied, "results": results}
+
+@app.post("/api/expenses/bulk")
+def bulk_expenses(req: ExpenseBulkRequest):
+    """Insert, update and delete many expenses in one transaction"""
+    insert_rows = [
+        (e.trip_id, e.user_id, e.category, e.amount, e.currency, e.date, e.note, e.payer, e.cleared)
+        for e in req.insert
+    ]
+    updates = [(u.id, u.model_dump(exclude={'id'}, exclude_none=True)) for u in req.update]
+    return _run_bulk("Expenses", EXPENSE_INSERT_SQL, insert_rows, updates, req.delete, event="expenses.changed")
+
+@app.post("/api/itinerary/bulk")
+def bulk_itinerary(req: ItineraryBulkRequest):
+    """Insert, update and delete many itinerary items in one transaction (e.g. after a drag-and-drop reorder)"""
+    insert_rows = [
+        (i.trip_id, i.day, i.place_name, i.start_time, i.end_time, i.notes, i.estimated_cost)
+        for i in req.insert
+    ]
+    # Same full-row semantics as PUT /api/itinerary/{item_id}
+    updates = [(u.id, {col: getattr(u, col) for col in ITINERARY_COLUMNS}) for u in req.update]
+
+    # A reorder sends every item in its new order, with the old times: the days are packed in
+    # request order, and only times the batch actually changes (or gives new items) are kept
+    order = {u.id: position for position, u in enumerate(req.update)}
+    retimed = set()
+
+    def touched(cur):
+        # Days the batch writes to, plus the days updated and deleted rows currently sit on
+        days = replan.touched_days(cur, [u.id for u in req.update] + list(req.delete))
+        for row in insert_rows:
+            replan.merge(days, row[0], row[1])
+        for u in req.update:
+            for trip_id, day, start_time, end_time in cur.execute(
+                "SELECT trip_id, ?, start_time, end_time FROM ItineraryItems WHERE id = ?", (u.day, u.id)
+            ).fetchall():
+                replan.merge(days, trip_id, day)
+                if (u.start_time, u.end_time) != (start_time, end_time) and replan.timed(u.start_time, u.end_time):
+                    retimed.add(u.id)
+        return days
+
+    def anchors(result):
+        new_ids, _ = result
+        return retimed | {new_id for new_id, row in zip(new_ids, insert_rows) if replan.timed(row[3], row[4])}
+
+    return _run_bulk("ItineraryItems", ITINERARY_INSERT_SQL, insert_rows, updates, req.delete, touched,
+                     anchors=anchors, order=order)
+
+# --- Trip Overview ---
+
+OVERVIEW_SECTIONS = ("trip", "itinerary", "expenses", "actually_spent", "members", "checklist")
+
+ITINERARY_QUERY = """
+    SELECT ii.*, td.Latitude, td.Longitude, td.Type
+    FROM ItineraryItems ii
+    LEFT JOIN TravelDatasetImported td ON ii.place_name = td.Name
+    WHERE ii.trip_id = ?
+    ORDER BY ii.day, ii.start_time
+"""
+
+def _fetch_itinerary(conn, trip_id):
+    return fetch_dicts(conn, ITINERARY_QUERY, (trip_id,))
+
+def _fetch_expenses(conn, trip_id):
+    return fetch_dicts(conn, "SELECT * FROM Expenses WHERE trip_id = ? ORDER BY date DESC", (trip_id,))
+
+def _fetch_members(conn, trip_id):
+    return fetch_dicts(conn, "SELECT * FROM TripMembers WHERE trip_id = ? ORDER BY added_at", (trip_id,))
+
+def _fetch_checklist(conn, trip_id):
+    items = fetch_dicts(conn, "SELECT * FROM ChecklistItems WHERE trip_id = ?", (trip_id,))
+    completed = sum(1 for item in items if item['is_completed'])
+    progress = int((completed / len(items)) * 100) if items else 0
+    return {"items": items, "progress": progress, "total": len(items), "completed": completed}
+
+def _compute_actually_spent(travel_mode, num_days, expense_amounts):
+    """Same formula as /actually-spent, fed from already-fetched rows"""
+    mode_costs = {'flight': 5000, 'train': 2000, 'road': 1500, 'bus': 1000, 'car': 3000}
+    base_travel_cost = mode_costs.get((travel_mode or '').lower(), 2000)
+    flight_fees = base_travel_cost * (1 + ((num_days or 1) - 1) * 0.1)
+    total_expenses = float(np.sum(np.array(expense_amounts, dtype=float))) if expense_amounts else 0.0
+    return {
+        "actually_spent": round(float(flight_fees + total_expenses), 2),
+        "flight_fees": round(float(flight_fees), 2),
+        "expenses_total": round(total_expenses, 2),
+        "breakdown": {
+            "travel_mode": travel_mode,
+            "num_days": num_days,
+            "base_travel_cost": base_travel_cost
+        }
+    }
+
+@app.get("/api/trips/{trip_id}/overview", response_class=ORJSONResponse)
+def get_trip_overview(trip_id: int, include: Optional[str] = None):
+    """
+    Everything the trip details page needs in one roundtrip.
+    `include` is a comma-separated subset of OVERVIEW_SECTIONS (default: all).
+    """
+    if include:
+        sections = {s.strip() for s in include.split(",") if s.strip()}
+        unknown = sections.difference(OVERVIEW_SECTIONS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown overview sections: {', '.join(sorted(unknown))}")
+    else:
+        sections = set(OVERVIEW_SECTIONS)
+
+    conn = get_db_connection()
+    if "checklist" in sections:
+        _ensure_checklist_table(conn)
+
+    # One read transaction so every section sees the same snapshot
+    conn.execute("BEGIN")
+    try:
+        trip_row = fetch_one(conn, "SELECT * FROM Trips WHERE id = ?", (trip_id,))
+        if trip_row is None:
+            raise HTTPException(status_code=404, detail="Trip not found")
+
+        result = {}
+        if "trip" in sections:
+            result["trip"] = trip_row
+        if "itinerary" in sections:
+            result["itinerary"] = _fetch_itinerary(conn, trip_id)
+        if "expenses" in sections or "actually_spent" in sections:
+            expenses = _fetch_expenses(conn, trip_id)
+            if "expenses" in sections:
+                result["expenses"] = expenses
+            if "actually_spent" in sections:
+                result["actually_spent"] = _compute_actually_spent(
+                    trip_row['travel_mode'], trip_row['num_days'],
+                    [e['amount'] for e in expenses if e['amount'] is not None]
+                )
+        if "members" in sections:
+            result["members"] = _fetch_members(conn, trip_id)
+        if "checklist" in sections:
+            result["checklist"] = _fetch_checklist(conn, trip_id)
+    finally:
+        conn.rollback()
+        conn.close()
+
+    return ORJSONResponse(result)
+
+# --- Places with Coordinates ---
 
-@app.get("/api/places/coordinates")
+@app.get("/api/places/coordinates", response_class=ORJSONResponse)
 def get_places_with_coordinates(city: str = None):
     """Get places with latitude and longitude for mapping"""
     conn = get_db_connection()
     
     if city:
         query = "SELECT * FROM TravelDatasetImported WHERE City = ? COLLATE NOCASE"
-        df = pd.read_sql_query(query, conn, params=(city,))
+        places = fetch_dicts(conn, query, (city,))
     else:
-        df = pd.read_sql_query("SELECT * FROM TravelDatasetImported LIMIT 100", conn)
+        places = fetch_dicts(conn, "SELECT * FROM TravelDatasetImported LIMIT 100")
     
     conn.close()
     
     # Add sample coordinates if not in database (for demo purposes)
     # In production, these should come from the database
-    if 'Latitude' not in df.columns:
-        df['Latitude'] = 28.6139 + (df.index * 0.01)
-        df['Longitude'] = 77.2090 + (df.index * 0.01)
+    if places and 'Latitude' not in places[0]:
+        for i, place in enumerate(places):
+            place['Latitude'] = 28.6139 + (i * 0.01)
+            place['Longitude'] = 77.2090 + (i * 0.01)
     
-    return df.to_dict(orient='records')
+    return ORJSONResponse(places)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,286 @@
+"""
+Minimal Prometheus-style instrumentation.
+
+Counters, gauges and histograms live in a process-wide registry and are
+rendered in the Prometheus text exposition format at /metrics. HTTP
+requests are measured by an ASGI middleware, SQL statements by a
+sqlite3 connection/cursor factory that times every execute and fetch
+against a normalized form of the statement.
+"""
+import bisect
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{v}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in sorted(items):
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, amount, *labelvalues):
+        index = bisect.bisect_left(self.buckets, amount)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                # [per-bucket counts..., +Inf count], sum
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += amount
+
+    def count(self, *labelvalues):
+        state = self._values.get(labelvalues)
+        return sum(state[0]) if state else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(k, (list(v[0]), v[1])) for k, v in self._values.items()]
+        for labelvalues, (counts, total) in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _labels(self.labelnames, labelvalues, (("le", _number(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render_latest():
+    """All registered metrics in Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# --- Shared metrics ---
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+SQL_LATENCY = Histogram("sqlite_query_duration_seconds", "SQLite statement time (execute + fetch) by normalized statement", ("statement",), buckets=SQL_BUCKETS)
+EMAIL_SENDS = Counter("email_sends_total", "Outgoing emails by result", ("result",))
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+WRITER_QUEUE_WAIT = Histogram("sqlite_writer_queue_wait_seconds", "Time a write intent waited for the group-commit writer", buckets=SQL_BUCKETS)
+WRITER_BATCH_SIZE = Histogram("sqlite_writer_batch_size", "Write intents per group commit", buckets=(1, 2, 4, 8, 16, 32, 64))
+ADMISSION_DECISIONS = Counter("admission_decisions_total", "Admission decisions by route and result (admitted, queued, rate_limited, shed, timeout)", ("route", "result"))
+ADMISSION_IN_FLIGHT = Gauge("admission_in_flight", "Admitted requests running per rate-limited route", ("route",))
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Requests waiting for a concurrency slot per route", ("route",))
+ADMISSION_QUEUE_WAIT = Histogram("admission_queue_wait_seconds", "Time queued requests waited for a concurrency slot", ("route",))
+ADMISSION_CLIENTS = Gauge("admission_tracked_clients", "Clients holding a token bucket per route", ("route",))
+CATALOG_GENERATION = Gauge("catalog_generation", "Place catalog generation currently served by this process")
+
+
+# --- HTTP ---
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: latency histogram, status counter and in-flight gauge per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            # The router records the matched route on the scope; use its template to keep labels bounded
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_LATENCY.observe(elapsed, method, path)
+            HTTP_REQUESTS.inc(method, path, str(status[0]))
+
+
+# --- SQL ---
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Collapse literals, IN-lists and whitespace so one statement shape maps to one label"""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    sql = _IN_LIST.sub("(?)", sql)
+    return sql[:200]
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Times each statement from execute through its last fetch and observes it once: when the rows
+    are exhausted (fetchall, an empty fetch, the end of iteration), on the next execute, on close,
+    or when the cursor is dropped. Statements without a result set are observed right after execute.
+    """
+    _statement = None
+    _elapsed = 0.0
+
+    def _flush(self):
+        if self._statement is not None:
+            SQL_LATENCY.observe(self._elapsed, self._statement)
+        self._statement = None
+        self._elapsed = 0.0
+
+    def _timed(self, call, *args):
+        start = time.perf_counter()
+        try:
+            result = call(*args)
+        except BaseException:
+            # Errors and StopIteration end the statement
+            self._elapsed += time.perf_counter() - start
+            self._flush()
+            raise
+        self._elapsed += time.perf_counter() - start
+        return result
+
+    def _run(self, call, sql, parameters):
+        self._flush()
+        self._statement = normalize_sql(sql)
+        result = self._timed(call, sql, parameters)
+        if self.description is None:
+            self._flush()
+        return result
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._flush()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self._flush()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._flush()
+        return rows
+
+    def __next__(self):
+        return self._timed(super().__next__)
+
+    def close(self):
+        self._flush()
+        super().close()
+
+    def __del__(self):
+        self._flush()
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection factory whose cursors report statement timings to SQL_LATENCY"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,122 @@
+"""
+Personalized ranking from trip history.
+
+Three tables, all keyed by place name (what ItineraryItems records):
+  PlacePopularity     trips that included each place
+  PlaceCooccurrence   trips that included both places (stored in both directions)
+  UserPlaceAffinity   per-user preference vector: trips of that user that included the place
+
+scripts/build_cooccurrence.py rebuilds them from all itineraries;
+record_trip() folds in each new trip as it is created. A candidate's
+personal score is sum_i affinity(user, i) * cooc(i, j) / sqrt(pop(i) * pop(j)),
+i.e. the user's history multiplied by a cosine-normalised item-item matrix.
+"""
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS PlacePopularity (
+        place_name TEXT PRIMARY KEY,
+        trips INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS PlaceCooccurrence (
+        place_a TEXT NOT NULL,
+        place_b TEXT NOT NULL,
+        trips INTEGER NOT NULL,
+        PRIMARY KEY (place_a, place_b)
+    );
+    CREATE TABLE IF NOT EXISTS UserPlaceAffinity (
+        user_id INTEGER NOT NULL,
+        place_name TEXT NOT NULL,
+        trips INTEGER NOT NULL,
+        PRIMARY KEY (user_id, place_name)
+    );
+"""
+
+# Share of utility_score given to the personal term when a user_id is supplied
+PERSONAL_WEIGHT = 0.25
+
+TRIP_PLACES = "SELECT DISTINCT trip_id, place_name FROM ItineraryItems WHERE place_name IS NOT NULL"
+
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA)
+
+
+def rebuild(conn):
+    """Recompute all three tables from ItineraryItems; caller commits"""
+    conn.execute("DELETE FROM PlacePopularity")
+    conn.execute("DELETE FROM PlaceCooccurrence")
+    conn.execute("DELETE FROM UserPlaceAffinity")
+    conn.execute(f"""
+        INSERT INTO PlacePopularity (place_name, trips)
+        SELECT place_name, COUNT(*) FROM ({TRIP_PLACES}) GROUP BY place_name
+    """)
+    conn.execute(f"""
+        INSERT INTO PlaceCooccurrence (place_a, place_b, trips)
+        SELECT a.place_name, b.place_name, COUNT(*)
+        FROM ({TRIP_PLACES}) a JOIN ({TRIP_PLACES}) b
+          ON a.trip_id = b.trip_id AND a.place_name <> b.place_name
+        GROUP BY a.place_name, b.place_name
+    """)
+    conn.execute(f"""
+        INSERT INTO UserPlaceAffinity (user_id, place_name, trips)
+        SELECT t.user_id, tp.place_name, COUNT(*)
+        FROM ({TRIP_PLACES}) tp JOIN Trips t ON t.id = tp.trip_id
+        GROUP BY t.user_id, tp.place_name
+    """)
+
+
+def record_trip(conn, user_id, place_names):
+    """Incrementally add one new trip's places; runs in the trip's own transaction"""
+    names = sorted({n for n in place_names if n})
+    if not names:
+        return
+    conn.executemany(
+        "INSERT INTO PlacePopularity (place_name, trips) VALUES (?, 1) "
+        "ON CONFLICT(place_name) DO UPDATE SET trips = trips + 1",
+        [(n,) for n in names]
+    )
+    conn.executemany(
+        "INSERT INTO PlaceCooccurrence (place_a, place_b, trips) VALUES (?, ?, 1) "
+        "ON CONFLICT(place_a, place_b) DO UPDATE SET trips = trips + 1",
+        [(a, b) for a in names for b in names if a != b]
+    )
+    conn.executemany(
+        "INSERT INTO UserPlaceAffinity (user_id, place_name, trips) VALUES (?, ?, 1) "
+        "ON CONFLICT(user_id, place_name) DO UPDATE SET trips = trips + 1",
+        [(user_id, n) for n in names]
+    )
+
+
+def personal_scores(conn, catalog, user_id, positions):
+    """Personal score for each catalog position in `positions` (zeros for users without history)"""
+    cur = conn.cursor()
+    cur.row_factory = None
+    rows = cur.execute("""
+        SELECT c.place_b, u.trips, c.trips, pa.trips, pb.trips
+        FROM UserPlaceAffinity u
+        JOIN PlaceCooccurrence c ON c.place_a = u.place_name
+        JOIN PlacePopularity pa ON pa.place_name = c.place_a
+        JOIN PlacePopularity pb ON pb.place_name = c.place_b
+        WHERE u.user_id = ?
+    """, (user_id,)).fetchall()
+    scores = np.zeros(len(positions))
+    if not rows:
+        return scores
+
+    names, affinity, together, pop_a, pop_b = zip(*rows)
+    weights = np.array(affinity, dtype=float) * np.array(together, dtype=float) / np.sqrt(
+        np.array(pop_a, dtype=float) * np.array(pop_b, dtype=float))
+    places = catalog.first_positions("Name", names)
+    known = places >= 0
+    # Sum contributions per place, then look the candidates up in the (small) sorted result
+    touched, inverse = np.unique(places[known], return_inverse=True)
+    totals = np.bincount(inverse, weights=weights[known])
+    if len(touched) == 0:
+        return scores
+    slots = np.minimum(np.searchsorted(touched, positions), len(touched) - 1)
+    hit = touched[slots] == positions
+    scores[hit] = totals[slots[hit]]
+    return scores
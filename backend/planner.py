@@ -0,0 +1,237 @@
+"""
+Trip planning: which places to visit, and on which day.
+
+choose_places() is a 0/1 knapsack with two capacities, the money left after
+transit and the hours available (num_days x MAX_HOURS_PER_DAY). Costs are
+bucketed (rounded up, so a chosen set never exceeds the real budget) and
+durations counted in half hours; the DP table is budget x hours and each
+place is folded in with one vectorised shift-and-max over the whole table.
+If the DP overruns its time cap the choice falls back to a greedy pass by
+utility per unit of resource used.
+
+schedule() then packs the chosen places into days, first fit in rating
+order, each day starting at 09:00 (later on a day that begins with travel)
+and running morning places before evening ones.
+"""
+import time
+
+from lazy import lazy_import
+import seasonality
+
+np = lazy_import("numpy")
+
+MAX_HOURS_PER_DAY = 8
+DAY_START_HOUR = 9
+TRANSIT_PER_DAY = 500       # base INR per day of local transit
+MODE_FACTORS = {'flight': 1.4, 'train': 1.0, 'road': 0.9, 'bus': 0.8, 'car': 1.2}
+
+HOUR_STEP = 0.5             # DP resolution for visit durations
+BUDGET_STEPS = 256          # DP resolution for money
+MAX_CANDIDATES = 300        # highest-utility places considered by the DP
+TIME_LIMIT = 0.25           # seconds before falling back to greedy
+
+
+def mode_factor(travel_mode):
+    return MODE_FACTORS.get((travel_mode or "").lower(), 1.0)
+
+
+def transit_cost(t_factor, num_days):
+    return TRANSIT_PER_DAY * t_factor * num_days
+
+
+def visit_hours(hours):
+    """Visit durations with missing or non-positive values treated as one hour"""
+    hours = np.nan_to_num(np.asarray(hours, dtype=float), nan=0.0)
+    return np.where(hours > 0, hours, 1.0)
+
+
+def place_costs(fee, rating, t_factor):
+    """Entrance fee adjusted for rating and travel mode; missing values count as zero"""
+    fee = np.nan_to_num(np.asarray(fee, dtype=float))
+    rating = np.nan_to_num(np.asarray(rating, dtype=float))
+    return fee * (1 + 0.2 * (1 - rating / 5.0)) * t_factor
+
+
+def normalized_ratings(rating):
+    """Ratings stretched to 0-5 over their own range (unrated places are ignored for the range)"""
+    if np.isnan(rating).all():
+        min_r = max_r = 0.0
+    else:
+        min_r, max_r = np.nanmin(rating), np.nanmax(rating)
+    if max_r > min_r:
+        return (rating - min_r) / (max_r - min_r) * 5.0
+    return np.full(len(rating), 5.0)
+
+
+def utility_scores(normalized_rating, estimated_cost, hours, budget):
+    return (
+        0.5 * (normalized_rating / 5.0) +
+        0.3 * (np.minimum(1, budget / (estimated_cost + 1))) +
+        0.2 * (1 / (1 + np.log1p(hours)))
+    )
+
+
+def _greedy(utility, cost, hours, budget, max_hours):
+    """Best utility per share of budget and hours first, skipping what no longer fits"""
+    share = cost / max(budget, 1e-9) + hours / max_hours
+    order = np.argsort(-(utility / np.maximum(share, 1e-9)), kind="stable")
+    chosen, spent, used = [], 0.0, 0.0
+    for i in order.tolist():
+        if spent + cost[i] <= budget and used + hours[i] <= max_hours:
+            chosen.append(i)
+            spent += cost[i]
+            used += hours[i]
+    return np.array(sorted(chosen), dtype=np.int64)
+
+
+def choose_places(utility, cost, hours, budget, max_hours, time_limit=TIME_LIMIT, max_item_hours=None):
+    """
+    Indices of the subset maximising total utility with sum(cost) <= budget and sum(hours) <= max_hours.
+    Places longer than `max_item_hours` (the longest day, when hours are pooled over days) are left out.
+    """
+    utility = np.nan_to_num(np.asarray(utility, dtype=float), nan=0.0)
+    cost = np.asarray(cost, dtype=float)
+    hours = np.asarray(hours, dtype=float)
+    fits = (utility > 0) & (cost <= budget) & (hours <= max_hours)
+    if max_item_hours is not None:
+        fits &= hours <= max_item_hours
+    candidates = np.flatnonzero(fits)
+    if len(candidates) == 0 or budget < 0:
+        return np.empty(0, dtype=np.int64)
+
+    hour_units = np.ceil(hours[candidates] / HOUR_STEP - 1e-9).astype(np.int64)
+    # Hours beyond what all candidates together take can never be used, so the table stops there
+    n_hours = min(int(max_hours / HOUR_STEP + 1e-9), int(hour_units.sum()))
+    if budget > 0:
+        step = budget / BUDGET_STEPS
+        n_budget = BUDGET_STEPS
+        cost_units = np.ceil(cost[candidates] / step - 1e-9).astype(np.int64)
+    else:
+        n_budget = 0
+        cost_units = np.zeros(len(candidates), dtype=np.int64)
+
+    # best[b, h]: max utility using at most b budget units and h half hours
+    started = time.perf_counter()
+    best = np.zeros((n_budget + 1, n_hours + 1))
+    taken = []
+    greedy = lambda: candidates[_greedy(utility[candidates], cost[candidates], hours[candidates], budget, max_hours)]
+    for i, (c, h) in enumerate(zip(cost_units.tolist(), hour_units.tolist())):
+        if time.perf_counter() - started > time_limit:
+            return greedy()
+        with_item = best[:n_budget + 1 - c, :n_hours + 1 - h] + utility[candidates[i]]
+        take = with_item > best[c:, h:]
+        best[c:, h:] = np.where(take, with_item, best[c:, h:])
+        taken.append(take)
+
+    # Walk back from the full capacities
+    chosen, b, h = [], n_budget, n_hours
+    for i in range(len(candidates) - 1, -1, -1):
+        if time.perf_counter() - started > time_limit:
+            return greedy()
+        c, t = cost_units[i], hour_units[i]
+        if b >= c and h >= t and taken[i][b - c, h - t]:
+            chosen.append(candidates[i])
+            b -= c
+            h -= t
+    return np.array(sorted(chosen), dtype=np.int64)
+
+
+def clock(hour):
+    """Hours since midnight as HH:MM (9.5 -> 09:30)"""
+    return f"{int(hour):02d}:{(hour % 1) * 60:02.0f}"
+
+
+def parse_clock(text):
+    """HH:MM as hours since midnight (09:30 -> 9.5); None if it isn't a time"""
+    try:
+        hours, minutes = str(text).split(":")[:2]
+        return int(hours) + int(minutes) / 60
+    except (TypeError, ValueError):
+        return None
+
+
+def day_hours(num_days, arrival_hours=0.0):
+    """Sightseeing hours per day; travelling in eats into the first day"""
+    hours = [float(MAX_HOURS_PER_DAY)] * num_days
+    if hours:
+        hours[0] = max(0.0, hours[0] - arrival_hours)
+    return hours
+
+
+def schedule(durations, capacities, ranks=None):
+    """
+    (day, start, end) per duration, days chosen first fit in the given order; None for
+    what doesn't fit. Within a day visits run in `ranks` order (e.g. morning places first).
+    """
+    used = [MAX_HOURS_PER_DAY - c for c in capacities]
+    days = []
+    for duration in durations:
+        day = next((d for d in range(len(used)) if used[d] + duration <= MAX_HOURS_PER_DAY), None)
+        if day is not None:
+            used[day] += duration
+        days.append(day)
+
+    clock = [DAY_START_HOUR + MAX_HOURS_PER_DAY - c for c in capacities]
+    slots = [None] * len(durations)
+    ranks = ranks if ranks is not None else [0] * len(durations)
+    for i in sorted((i for i, day in enumerate(days) if day is not None), key=lambda i: ranks[i]):
+        day = days[i]
+        slots[i] = (day + 1, clock[day], clock[day] + durations[i])
+        clock[day] += durations[i]
+    return slots
+
+
+def itinerary(places, durations, costs, capacities, first_day=1, ranks=None):
+    """Itinerary item dicts for catalog records `places`, ordered by day then start time"""
+    scheduled = []
+    for place, duration, cost, slot in zip(places, durations, costs, schedule(durations, capacities, ranks)):
+        if slot is None:
+            continue
+        day, start, end = slot
+        scheduled.append((day, start, {
+            "day": day + first_day - 1,
+            "place_name": place['Name'],
+            "start_time": clock(start),
+            "end_time": clock(end),
+            "notes": f"Type: {place['Type']}",
+            "estimated_cost": round(float(cost), 2),
+        }))
+    scheduled.sort(key=lambda entry: entry[:2])
+    return [item for _, _, item in scheduled]
+
+
+def _candidates(catalog, positions, budget, t_factor):
+    rating = catalog.numeric["Google_review_rating"][positions]
+    hours = visit_hours(catalog.numeric["time_needed_to_visit_hrs"][positions])
+    cost = place_costs(catalog.numeric["Entrance_Fee_INR"][positions], rating, t_factor)
+    utility = utility_scores(np.nan_to_num(normalized_ratings(rating)), cost, hours, max(budget, 0.0))
+    return rating, hours, cost, utility
+
+
+def day_values(catalog, positions, budget, t_factor, max_days, arrival_hours=0.0):
+    """Utility gained from each extra day at a stop: its places, best first, in day-sized chunks"""
+    _, hours, _, utility = _candidates(catalog, positions, budget, t_factor)
+    order = np.argsort(-np.nan_to_num(utility, nan=0.0), kind="stable")
+    before = arrival_hours + np.cumsum(hours[order]) - hours[order]
+    day = (before // MAX_HOURS_PER_DAY).astype(np.int64)
+    keep = day < max_days
+    return np.bincount(day[keep], weights=np.nan_to_num(utility[order][keep]), minlength=max_days).tolist()
+
+
+def plan_places(catalog, positions, budget, num_days, t_factor, first_day=1, arrival_hours=0.0):
+    """Choose among catalog `positions` within `budget` and the days' hours, then schedule them"""
+    rating, hours, cost, utility = _candidates(catalog, positions, budget, t_factor)
+    capacities = day_hours(num_days, arrival_hours)
+
+    if len(positions) > MAX_CANDIDATES:
+        pool = np.argpartition(-np.nan_to_num(utility, nan=-np.inf), MAX_CANDIDATES)[:MAX_CANDIDATES]
+    else:
+        pool = np.arange(len(positions))
+    # A place has to fit in one day, or schedule() would drop it after it displaced others
+    chosen = pool[choose_places(utility[pool], cost[pool], hours[pool], budget, sum(capacities),
+                                max_item_hours=max(capacities, default=0.0))]
+
+    # Best rated first, so first fit puts the highlights early in the trip
+    chosen = chosen[np.argsort(-np.nan_to_num(rating[chosen], nan=-np.inf), kind="stable")]
+    return itinerary(catalog.records(positions[chosen]), hours[chosen].tolist(), cost[chosen].tolist(),
+                     capacities, first_day, seasonality.daypart_rank(catalog, positions[chosen]).tolist())
@@ -0,0 +1,250 @@
+"""
+Opt-in request profiling.
+
+A request is profiled when it carries `X-Profile: cprofile|sample` together
+with a valid `X-Admin-Token`, or when it is picked by PROFILE_SAMPLE_RATE
+(optionally limited to PROFILE_PATHS prefixes). The endpoint body is
+profiled in the thread that actually runs it, either with cProfile
+(downloadable as a .pstats file) or with a stack sampler (downloadable as
+speedscope JSON). The last PROFILE_BUFFER_SIZE profiles are kept in memory.
+"""
+import asyncio
+import cProfile
+import io
+import itertools
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+
+from fastapi.routing import APIRoute
+
+MODES = ("cprofile", "sample")
+SAMPLE_INTERVAL = 0.002  # seconds between stack samples
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+SAMPLE_MODE = os.getenv("PROFILE_MODE", "cprofile")
+SAMPLE_PATHS = tuple(p for p in os.getenv("PROFILE_PATHS", "").split(",") if p)
+BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
+
+_active = ContextVar("profiling_session", default=None)
+_profiles = deque(maxlen=BUFFER_SIZE)
+_ids = itertools.count(1)
+
+
+class _StackSampler:
+    """Samples one thread's Python stack on a timer and aggregates identical stacks"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                key = tuple(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+
+class Session:
+    def __init__(self, mode, method, path):
+        self.mode = mode
+        self.method = method
+        self.path = path
+        self.result = None
+        self.duration = 0.0
+
+    def start(self):
+        self._started = time.perf_counter()
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._profiler = _StackSampler(threading.get_ident())
+            self._profiler.start()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self._started
+        if self.mode == "cprofile":
+            self._profiler.disable()
+            self._profiler.create_stats()
+            self.result = self._profiler.stats
+        else:
+            self._profiler.stop()
+            self.result = self._profiler.stacks
+
+
+def _wrap(endpoint):
+    """Profile the endpoint body when the current request has an active session"""
+    if asyncio.iscoroutinefunction(endpoint):
+        @wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            session = _active.get()
+            if session is None:
+                return await endpoint(*args, **kwargs)
+            session.start()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                session.stop()
+    else:
+        # Sync endpoints run in the threadpool; the context var is copied into that thread
+        @wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            session = _active.get()
+            if session is None:
+                return endpoint(*args, **kwargs)
+            session.start()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                session.stop()
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """Route class that makes every endpoint profileable; set as app.router.route_class"""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _wrap(endpoint), **kwargs)
+
+
+def is_admin(token):
+    return bool(ADMIN_TOKEN) and token == ADMIN_TOKEN
+
+
+def _choose_mode(scope):
+    headers = dict(scope["headers"])
+    requested = headers.get(b"x-profile")
+    if requested is not None:
+        mode = requested.decode("latin-1").strip().lower() or "cprofile"
+        token = headers.get(b"x-admin-token", b"").decode("latin-1")
+        if mode in MODES and is_admin(token):
+            return mode
+        return None
+    if SAMPLE_RATE > 0 and (not SAMPLE_PATHS or scope["path"].startswith(SAMPLE_PATHS)):
+        if random.random() < SAMPLE_RATE:
+            return SAMPLE_MODE
+    return None
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware that opens a profiling session for selected requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = _choose_mode(scope)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = Session(mode, scope["method"], scope["path"])
+        profile_id = next(_ids)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and session.result is not None:
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", str(profile_id).encode())]
+            await send(message)
+
+        token = _active.set(session)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _active.reset(token)
+            if session.result is not None:
+                _profiles.append({
+                    "id": profile_id,
+                    "method": session.method,
+                    "path": session.path,
+                    "mode": session.mode,
+                    "duration_ms": round(session.duration * 1000, 3),
+                    "created_at": datetime.utcnow().isoformat(),
+                    "data": session.result,
+                })
+
+
+# --- Export ---
+
+def list_profiles():
+    return [{k: v for k, v in p.items() if k != "data"} for p in reversed(_profiles)]
+
+
+def get_profile(profile_id):
+    for p in _profiles:
+        if p["id"] == profile_id:
+            return p
+    return None
+
+
+def to_pstats(profile):
+    """cProfile stats in the marshal format read by pstats.Stats / snakeviz"""
+    return marshal.dumps(profile["data"])
+
+
+def to_text(profile, limit=40):
+    out = io.StringIO()
+    stats = pstats.Stats(stream=out)
+    stats.stats = profile["data"]
+    stats.get_top_level_stats()
+    stats.sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+def to_speedscope(profile):
+    """Sampled stacks in speedscope's file format (https://www.speedscope.app)"""
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, count in profile["data"].items():
+        sample = []
+        for name, filename, line in stack:
+            key = (name, filename, line)
+            if key not in index:
+                index[key] = len(frames)
+                frames.append({"name": name, "file": filename, "line": line})
+            sample.append(index[key])
+        samples.append(sample)
+        weights.append(count * SAMPLE_INTERVAL)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": f"{profile['method']} {profile['path']}",
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+        "name": f"{profile['method']} {profile['path']} #{profile['id']}",
+        "exporter": "voyago-profiling",
+    }
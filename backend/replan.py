@@ -0,0 +1,179 @@
+"""
+Incremental re-planning after itinerary edits.
+
+An edit (update, delete, add, or a bulk batch) touches a few (trip, day)
+pairs. Inside the edit's own write transaction only those days are
+rescheduled. Items whose times the edit set explicitly ("anchors") keep
+them; the others keep their durations and are packed back to back from
+the day's start around the anchors, in the order the edit gave (a bulk
+reorder) or else by their current start time. The trip's
+total_cost moves by the difference between the touched days' costs before
+and after, and itinerary_html is patched in place: the table has one
+<tbody data-day="N"> per day, so only the touched days' bodies are
+re-rendered. Trips whose HTML predates the per-day bodies are re-rendered
+in full once.
+"""
+import html
+import re
+
+import planner
+
+ITINERARY_HTML_COLUMNS = ("day", "place_name", "start_time", "end_time", "notes", "estimated_cost")
+
+_TABLE_HEAD = (
+    '<table border="1" class="dataframe table table-sm">\n'
+    '  <thead>\n'
+    '    <tr style="text-align: right;">\n'
+    + "".join(f"      <th>{column}</th>\n" for column in ITINERARY_HTML_COLUMNS)
+    + '    </tr>\n'
+    '  </thead>\n'
+)
+_DAY_BODY = re.compile(r'  <tbody data-day="(\d+)">\n.*?  </tbody>\n', re.DOTALL)
+
+
+def _cell(column, value):
+    if value is None:
+        return "None"
+    if column == "estimated_cost":
+        return f"{float(value):.2f}"
+    return html.escape(str(value))
+
+
+def render_day(day, items):
+    """One day's <tbody> (empty string for a day without items)"""
+    if not items:
+        return ""
+    rows = "".join(
+        "    <tr>\n" + "".join(f"      <td>{_cell(c, item[c])}</td>\n" for c in ITINERARY_HTML_COLUMNS) + "    </tr>\n"
+        for item in items
+    )
+    return f'  <tbody data-day="{day}">\n{rows}  </tbody>\n'
+
+
+def render_table(items):
+    """The itinerary table stored in Trips.itinerary_html and mailed to the traveller"""
+    days = {}
+    for item in items:
+        days.setdefault(item["day"], []).append(item)
+    bodies = "".join(render_day(day, days[day]) for day in sorted(days, key=lambda d: (d is None, d or 0)))
+    return _TABLE_HEAD + bodies + "</table>"
+
+
+def patch_table(table_html, day_bodies):
+    """Replace (or insert, or drop) the <tbody> of each day in `day_bodies`; None if the table can't be patched"""
+    if not table_html or not table_html.startswith(_TABLE_HEAD):
+        return None
+    bodies = {int(m.group(1)): m.group(0) for m in _DAY_BODY.finditer(table_html)}
+    rest = _DAY_BODY.sub("", table_html[len(_TABLE_HEAD):])
+    if rest != "</table>":
+        return None
+    bodies.update(day_bodies)
+    return _TABLE_HEAD + "".join(bodies[day] for day in sorted(bodies)) + "</table>"
+
+
+def touched_days(cur, item_ids):
+    """{trip_id: {day, ...}} for existing itinerary items"""
+    touched = {}
+    ids = list(item_ids)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        rows = cur.execute(
+            f"SELECT trip_id, day FROM ItineraryItems WHERE id IN ({','.join('?' * len(chunk))})", chunk
+        ).fetchall()
+        for trip_id, day in rows:
+            touched.setdefault(trip_id, set()).add(day)
+    return touched
+
+
+def merge(touched, trip_id, day):
+    if trip_id is not None:
+        touched.setdefault(trip_id, set()).add(day)
+    return touched
+
+
+def day_costs(cur, touched):
+    """Sum of estimated_cost per touched (trip, day)"""
+    costs = {}
+    for trip_id, days in touched.items():
+        for day in days:
+            row = cur.execute(
+                "SELECT COALESCE(SUM(estimated_cost), 0) FROM ItineraryItems WHERE trip_id = ? AND day IS ?",
+                (trip_id, day)
+            ).fetchone()
+            costs[trip_id, day] = row[0]
+    return costs
+
+
+def timed(start_time, end_time):
+    """Whether an item's start and end are real times with the end after the start"""
+    start, end = planner.parse_clock(start_time), planner.parse_clock(end_time)
+    return start is not None and end is not None and end > start
+
+
+def _reschedule_day(cur, trip_id, day, anchors=(), order=None):
+    rows = cur.execute(
+        "SELECT id, day, place_name, start_time, end_time, notes, estimated_cost FROM ItineraryItems "
+        "WHERE trip_id = ? AND day IS ? ORDER BY start_time, id",
+        (trip_id, day)
+    ).fetchall()
+    items = [dict(zip(("id",) + ITINERARY_HTML_COLUMNS, row)) for row in rows]
+    if order:
+        # Items the edit ordered come first, in that order; the rest follow by start time
+        items.sort(key=lambda item: order.get(item["id"], len(order)))
+
+    fixed = {item["id"] for item in items if item["id"] in anchors and timed(item["start_time"], item["end_time"])}
+    blocked = sorted((planner.parse_clock(item["start_time"]), planner.parse_clock(item["end_time"]))
+                     for item in items if item["id"] in fixed)
+    starts = [planner.parse_clock(item["start_time"]) for item in items]
+    known = [s for item, s in zip(items, starts) if s is not None and item["id"] not in fixed]
+    # Pack from 09:00, or from an earlier start the traveller chose
+    clock = min([planner.DAY_START_HOUR] + known)
+    changed = []
+    for item, start in zip(items, starts):
+        if item["id"] in fixed:
+            continue
+        end = planner.parse_clock(item["end_time"])
+        duration = end - start if start is not None and end is not None and end > start else 1.0
+        for block_start, block_end in blocked:
+            # Step over anchored items instead of overlapping them
+            if clock < block_end and clock + duration > block_start:
+                clock = block_end
+        start_time, end_time = planner.clock(clock), planner.clock(clock + duration)
+        if (start_time, end_time) != (item["start_time"], item["end_time"]):
+            item["start_time"], item["end_time"] = start_time, end_time
+            changed.append((start_time, end_time, item["id"]))
+        clock += duration
+    cur.executemany("UPDATE ItineraryItems SET start_time = ?, end_time = ? WHERE id = ?", changed)
+    items.sort(key=lambda item: (planner.parse_clock(item["start_time"]) or 0.0, item["id"]))
+    return items
+
+
+def replan(cur, touched, costs_before, anchors=(), order=None):
+    """
+    Reschedule the touched days and bring each touched trip's total_cost and itinerary_html up to date.
+    `anchors` are item ids whose times were set by the edit; `order` maps item ids to their new position.
+    """
+    costs_after = day_costs(cur, touched)
+    for trip_id, days in touched.items():
+        day_bodies = {}
+        for day in days:
+            items = _reschedule_day(cur, trip_id, day, anchors, order)
+            if day is not None:
+                day_bodies[day] = render_day(day, items)
+
+        delta = sum(costs_after[trip_id, day] - costs_before.get((trip_id, day), 0) for day in days)
+        row = cur.execute("SELECT itinerary_html FROM Trips WHERE id = ?", (trip_id,)).fetchone()
+        if row is None:
+            continue
+        table_html = patch_table(row[0], day_bodies) if None not in days else None
+        if table_html is None:
+            # Legacy (or unpatchable) table: render the whole itinerary once in the per-day layout
+            rows = cur.execute(
+                "SELECT day, place_name, start_time, end_time, notes, estimated_cost FROM ItineraryItems "
+                "WHERE trip_id = ? ORDER BY day, start_time, id", (trip_id,)
+            ).fetchall()
+            table_html = render_table([dict(zip(ITINERARY_HTML_COLUMNS, r)) for r in rows])
+        cur.execute(
+            "UPDATE Trips SET total_cost = COALESCE(total_cost, 0) + ?, itinerary_html = ? WHERE id = ?",
+            (delta, table_html, trip_id)
+        )
@@ -0,0 +1,362 @@
+"""
+Endpoint benchmark with a reproducible load profile.
+
+Drives the real app either in-process (ASGI transport, no network) or
+against a local uvicorn server, with a weighted mix of requests issued by
+closed-loop workers. Reports throughput and p50/p95/p99 per endpoint,
+writes the results as JSON and, given a baseline, exits non-zero when a
+run regresses past the threshold. The run works on a throwaway copy of
+--db, so benchmark users, trips and expenses never reach the real one.
+
+Run from the backend directory:
+    python scripts/benchmark.py --mode inprocess --duration 10 --concurrency 8
+    python scripts/benchmark.py --mode server --save-baseline
+    python scripts/benchmark.py --mode server --baseline bench_baseline.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DEFAULT_MIX = "recommendations=4,trip_create=1,expense_write=3,validate=3,places=4"
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "bench_baseline.json")
+BENCH_EMAIL = "bench@voyago.local"
+
+# Keep benchmark traffic from sending real email: point SMTP at a closed local port
+BENCH_ENV = {"SMTP_SERVER": "127.0.0.1", "SMTP_PORT": "9"}
+
+
+# --- Scenarios: each returns (method, url, request kwargs) ---
+
+def _recommendations(rng, ctx):
+    return "POST", "/api/recommendations", {"json": {
+        "destination": rng.choice(ctx["cities"]),
+        "categories": rng.sample(ctx["types"], k=min(len(ctx["types"]), rng.randint(0, 2))),
+        "significance": [],
+        "budget": rng.choice([2000, 5000, 10000, 50000]),
+        "num_days": rng.randint(1, 5),
+        "preferences": [],
+    }}
+
+
+def _trip_create(rng, ctx):
+    return "POST", "/api/trips/create", {"json": {
+        "user_id": ctx["user_id"],
+        "origin": "Bench",
+        "destination": rng.choice(ctx["cities"]),
+        "categories": [],
+        "num_days": rng.randint(1, 4),
+        "budget": rng.choice([5000, 20000]),
+        "travel_mode": rng.choice(["flight", "train", "road", "bus", "car"]),
+        "start_date": "2026-01-01",
+        "end_date": "2026-01-05",
+    }}
+
+
+def _expense_write(rng, ctx):
+    return "POST", "/api/expenses", {"json": {
+        "trip_id": ctx["trip_id"],
+        "user_id": ctx["user_id"],
+        "category": rng.choice(["Food", "Transport", "Tickets", "Shopping"]),
+        "amount": round(rng.uniform(50, 5000), 2),
+        "currency": "INR",
+        "date": "2026-01-02",
+        "payer": "Bench",
+    }}
+
+
+def _validate(rng, ctx):
+    return "GET", "/api/auth/validate", {"headers": {"Cookie": f"session_user={ctx['user_id']}"}}
+
+
+def _places(rng, ctx):
+    return "GET", "/api/places", {"params": {"city": rng.choice(ctx["cities"])}}
+
+
+SCENARIOS = {
+    "recommendations": _recommendations,
+    "trip_create": _trip_create,
+    "expense_write": _expense_write,
+    "validate": _validate,
+    "places": _places,
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}'. Choose from: {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# --- Setup ---
+
+def copy_database(db_path, directory):
+    """Consistent copy of `db_path` (WAL included) in `directory`; returns its path"""
+    copy_path = os.path.join(directory, os.path.basename(db_path))
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(copy_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return copy_path
+
+def prepare_fixtures(db_path):
+    """Ensure a benchmark user and trip exist; returns the ids the scenarios need"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM Users WHERE email = ?", (BENCH_EMAIL,))
+        row = cur.fetchone()
+        if row:
+            user_id = row[0]
+        else:
+            cur.execute(
+                "INSERT INTO Users (full_name, email, password_hash, created_at) VALUES (?, ?, ?, ?)",
+                ("Bench User", BENCH_EMAIL, "!", datetime.utcnow().isoformat())
+            )
+            user_id = cur.lastrowid
+        cur.execute("SELECT id FROM Trips WHERE user_id = ? ORDER BY id LIMIT 1", (user_id,))
+        row = cur.fetchone()
+        if row:
+            trip_id = row[0]
+        else:
+            cur.execute(
+                "INSERT INTO Trips (user_id, origin, destination, num_days, budget, travel_mode, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, "Bench", "Bench", 3, 10000, "train", datetime.utcnow().isoformat())
+            )
+            trip_id = cur.lastrowid
+        cur.execute("SELECT DISTINCT City FROM TravelDatasetImported WHERE City IS NOT NULL")
+        cities = sorted(r[0] for r in cur.fetchall())
+        cur.execute("SELECT DISTINCT Type FROM TravelDatasetImported WHERE Type IS NOT NULL")
+        types = sorted(r[0] for r in cur.fetchall())
+        conn.commit()
+    finally:
+        conn.close()
+    if not cities:
+        raise SystemExit("TravelDatasetImported is empty; import a dataset first")
+    return {"user_id": user_id, "trip_id": trip_id, "cities": cities, "types": types}
+
+
+# --- Load generation ---
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+async def _worker(client, worker_id, seed, mix, ctx, stop_at, record_from, samples):
+    rng = random.Random(seed * 1000 + worker_id)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    while time.perf_counter() < stop_at:
+        name = rng.choices(names, weights)[0]
+        method, url, kwargs = SCENARIOS[name](rng, ctx)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        end = time.perf_counter()
+        if start >= record_from:
+            samples.append((name, end - start, ok))
+
+
+async def run_load(client, mix, ctx, duration, concurrency, seed, warmup):
+    samples = []
+    started = time.perf_counter()
+    record_from = started + warmup
+    stop_at = record_from + duration
+    await asyncio.gather(*(
+        _worker(client, i, seed, mix, ctx, stop_at, record_from, samples)
+        for i in range(concurrency)
+    ))
+    return samples, time.perf_counter() - record_from
+
+
+def summarize(samples, elapsed):
+    by_name = {}
+    for name, latency, ok in samples:
+        by_name.setdefault(name, []).append((latency, ok))
+
+    endpoints = {}
+    for name, entries in sorted(by_name.items()):
+        latencies = sorted(l for l, _ in entries)
+        endpoints[name] = {
+            "count": len(entries),
+            "errors": sum(1 for _, ok in entries if not ok),
+            "throughput_rps": round(len(entries) / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        }
+    return {
+        "total": {
+            "requests": len(samples),
+            "errors": sum(1 for _, _, ok in samples if not ok),
+            "throughput_rps": round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        },
+        "endpoints": endpoints,
+    }
+
+
+def compare(result, baseline, threshold):
+    """List regressions: p95 latency up, or throughput down, by more than `threshold` (a fraction)"""
+    regressions = []
+    for name, base in baseline.get("endpoints", {}).items():
+        current = result["endpoints"].get(name)
+        if current is None:
+            continue
+        if base["p95_ms"] > 0 and current["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if base["throughput_rps"] > 0 and current["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}: {current['throughput_rps']} req/s vs baseline {base['throughput_rps']} req/s")
+    return regressions
+
+
+# --- Targets ---
+
+async def bench_inprocess(mix, ctx, args, db_path):
+    import httpx
+    import main as app_main
+    previous = app_main.DB_PATH
+    app_main.use_database(db_path)
+    try:
+        transport = httpx.ASGITransport(app=app_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run_load(client, mix, ctx, args.duration, args.concurrency, args.seed, args.warmup)
+    finally:
+        app_main.use_database(previous)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def bench_server(mix, ctx, args, db_path):
+    import httpx
+    port = args.port or _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env={**os.environ, **BENCH_ENV, "VOYAGO_DB_PATH": db_path},
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/api/filters")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise SystemExit("uvicorn did not come up")
+            return await run_load(client, mix, ctx, args.duration, args.concurrency, args.seed, args.warmup)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inprocess", "server"), default="inprocess")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=1.0, help="unmeasured seconds before recording")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted scenarios, e.g. places=3,validate=1")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=0, help="server mode: port (default: any free port)")
+    parser.add_argument("--workers", type=int, default=1, help="server mode: uvicorn worker processes")
+    parser.add_argument("--db", default=os.path.join(BACKEND_DIR, "voyago_lite.db"))
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="compare against this results file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed regression as a fraction")
+    parser.add_argument("--save-baseline", action="store_true", help=f"also write results to {DEFAULT_BASELINE}")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    with tempfile.TemporaryDirectory(prefix="voyago-bench-") as workdir:
+        db_path = copy_database(args.db, workdir)
+        ctx = prepare_fixtures(db_path)
+
+        if args.mode == "inprocess":
+            saved_env = {name: os.environ.get(name) for name in BENCH_ENV}
+            os.environ.update(BENCH_ENV)
+            try:
+                samples, elapsed = asyncio.run(bench_inprocess(mix, ctx, args, db_path))
+            finally:
+                for name, value in saved_env.items():
+                    if value is None:
+                        os.environ.pop(name, None)
+                    else:
+                        os.environ[name] = value
+        else:
+            samples, elapsed = asyncio.run(bench_server(mix, ctx, args, db_path))
+
+    result = {
+        "meta": {
+            "mode": args.mode,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "workers": args.workers if args.mode == "server" else None,
+            "mix": mix,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.utcnow().isoformat(),
+        },
+        **summarize(samples, elapsed),
+    }
+
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, "w") as f:
+            json.dump(result, f, indent=2)
+
+    print(f"{'endpoint':<18}{'count':>8}{'err':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, s in result["endpoints"].items():
+        print(f"{name:<18}{s['count']:>8}{s['errors']:>6}{s['throughput_rps']:>10}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}")
+    print(f"total: {result['total']['requests']} requests, {result['total']['throughput_rps']} req/s -> {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
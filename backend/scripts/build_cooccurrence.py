@@ -0,0 +1,45 @@
+"""
+Rebuild the personalization model (place popularity, place co-occurrence and
+per-user place affinity) from every itinerary in the database.
+
+New trips update the model incrementally as they are created; run this
+offline to recompute it from scratch, e.g. after bulk imports or edits.
+
+Run from the backend directory:
+    python scripts/build_cooccurrence.py
+    python scripts/build_cooccurrence.py --db synthetic.db
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import personalization
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the place co-occurrence model from trip history")
+    parser.add_argument("--db", default="voyago_lite.db")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(args.db, timeout=30)
+    try:
+        personalization.ensure_schema(conn)
+        # One write transaction: the API keeps reading the previous model until commit
+        conn.execute("BEGIN IMMEDIATE")
+        personalization.rebuild(conn)
+        conn.commit()
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ("PlacePopularity", "PlaceCooccurrence", "UserPlaceAffinity")}
+    finally:
+        conn.close()
+    print(f"Rebuilt personalization model in {time.perf_counter() - started:.1f}s: "
+          + ", ".join(f"{n:,} {table}" for table, n in counts.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,391 @@
+"""
+Seeded synthetic dataset generator for capacity tests and benchmarks.
+
+Writes a TravelDatasetImported catalog with the same schema the importers
+produce, plus Users, Trips, ItineraryItems, Expenses and TripMembers with
+realistic fan-out, straight into a SQLite database. The real cities from
+the bundled CSVs come first in popularity order and are padded with
+generated ones; places per city follow a Zipf distribution and place types
+follow the real dataset's mix, with coordinates scattered around the city
+centre. The same seed always produces the same database.
+
+Run from the backend directory:
+    python scripts/generate_synthetic.py --db synthetic.db --places 100000 --users 20000
+    python scripts/generate_synthetic.py --db synthetic.db --places 10000000 --users 1000000 --seed 7
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+import bcrypt
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from catalog import publish
+
+DATA_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "data")
+SCHEMA_PATH = os.path.join(BACKEND_DIR, "db_init.sql")
+
+CHUNK_SIZE = 50_000
+CITY_ZIPF = 1.1            # skew of places per city
+TYPE_ZIPF = 0.9            # skew of place types beyond the real mix
+COORD_SPREAD = 0.06        # degrees of scatter around a city centre
+SYNTHETIC_PASSWORD = "password123"
+
+PLACE_COLUMNS = (
+    "Zone", "State", "City", "Name", "Type", "Establishment_Year", "time_needed_to_visit_hrs",
+    "Google_review_rating", "Entrance_Fee_INR", "Airport_with_50km_Radius", "Weekly_Off",
+    "Significance", "DSLR_Allowed", "Number_of_google_review_in_lakhs", "Best_Time_to_visit",
+    "Latitude", "Longitude", "Description", "Activities", "Nearby_Hotels", "Food_Options",
+    "Kid_Friendly", "Activity_Type", "imported_at",
+)
+
+ZONES = ("Northern", "Southern", "Eastern", "Western", "Central", "North Eastern")
+TYPES = (
+    "Temple", "Fort", "Beach", "Monument", "Palace", "Lake", "Museum", "Park", "Landmark",
+    "Waterfall", "National Park", "Market", "Garden", "Church", "Mosque", "Hill Station",
+    "Zoo", "Tomb", "Viewpoint", "Cave", "Dam", "Island", "Wildlife Sanctuary", "Theme Park",
+)
+ACTIVITY_TYPE = {
+    "Temple": "Religious", "Church": "Religious", "Mosque": "Religious", "Tomb": "Historical",
+    "Fort": "Historical", "Monument": "Historical", "Palace": "Historical", "Museum": "Cultural",
+    "Market": "Cultural", "Landmark": "Cultural", "Beach": "Relaxation", "Lake": "Relaxation",
+    "Park": "Relaxation", "Garden": "Relaxation", "Island": "Relaxation", "Dam": "Nature",
+    "Waterfall": "Nature", "Hill Station": "Nature", "Viewpoint": "Nature", "Cave": "Adventure",
+    "National Park": "Nature", "Zoo": "Nature", "Wildlife Sanctuary": "Nature", "Theme Park": "Adventure",
+}
+SIGNIFICANCE = ("Historical", "Nature", "Religious", "Recreational", "Cultural", "Scenic",
+                "Architectural", "Wildlife", "Entertainment", "Spiritual", "Adventure")
+BEST_TIME = ("All", "Morning", "Afternoon", "Evening", "October-March", "November-February",
+             "March-June", "July-September", "Year-round", "Winter", "Summer", "Monsoon")
+WEEKLY_OFF = (None, None, None, None, "Monday", "Tuesday", "Friday", "Sunday")
+ACTIVITIES = ("Photography", "Heritage Walk", "Boat Ride", "Evening Walks", "Picnics", "Trekking",
+              "Shopping", "Light Show", "Nature Walks", "Bird Watching", "Street Food", "Museum Visit",
+              "Sunset Views", "Cycling", "Swimming", "Meditation")
+FOODS = ("Street Food", "Multi-cuisine", "Cafe", "Seafood", "North Indian", "South Indian",
+         "Vegetarian", "Fine Dining", "Food Court", "Bakery")
+HOTELS = ("Grand", "Residency", "Palace", "Inn", "Regency", "Heritage", "Comfort", "Plaza")
+SYLLABLES = ("ka", "ra", "pur", "ma", "la", "na", "ban", "gar", "vi", "sha", "ta", "dha",
+             "ko", "li", "ne", "si", "ha", "ja", "bad", "nag", "ti", "ru", "dev", "al")
+
+EXPENSE_CATEGORIES = ("Food", "Transport", "Accommodation", "Tickets", "Shopping", "Other")
+TRAVEL_MODES = ("flight", "train", "road", "bus", "car")
+FIRST_NAMES = ("Aarav", "Diya", "Vihaan", "Ananya", "Arjun", "Isha", "Kabir", "Meera", "Rohan",
+               "Saanvi", "Aditya", "Priya", "Karan", "Nisha", "Dev", "Riya", "Sam", "Alex")
+LAST_NAMES = ("Sharma", "Patel", "Iyer", "Reddy", "Singh", "Gupta", "Nair", "Das", "Khan",
+              "Mehta", "Rao", "Joshi", "Kapoor", "Bose", "Menon", "Verma")
+
+# India's bounding box, used to place generated cities
+LAT_RANGE = (8.0, 34.0)
+LON_RANGE = (68.5, 96.5)
+
+
+def zipf_weights(n, s):
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+def load_seed_cities():
+    """Real (city, state, zone, lat, lon) rows from the bundled CSVs, most-visited first"""
+    cities = {}
+    with open(os.path.join(DATA_DIR, "expanded_travel_dataset.csv"), newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                lat, lon = float(row["Latitude"]), float(row["Longitude"])
+            except (TypeError, ValueError):
+                continue
+            entry = cities.setdefault(row["City"], [row["State"], row["Zone"] or None, 0.0, 0.0, 0])
+            entry[2] += lat
+            entry[3] += lon
+            entry[4] += 1
+    international = os.path.join(BACKEND_DIR, "data", "international_cities.csv")
+    if os.path.exists(international):
+        with open(international, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                entry = cities.setdefault(row["City"], [row["State"], None, 0.0, 0.0, 0])
+                entry[2] += float(row["Latitude"])
+                entry[3] += float(row["Longitude"])
+                entry[4] += 1
+    ranked = sorted(cities.items(), key=lambda item: -item[1][4])
+    return [(city, state, zone, lat / n, lon / n) for city, (state, zone, lat, lon, n) in ranked]
+
+
+def build_cities(rng, count):
+    """City table as parallel arrays: names, states, zones, centre lat/lon"""
+    seeded = load_seed_cities()[:count]
+    names = [c[0] for c in seeded]
+    states = [c[1] for c in seeded]
+    zones = [c[2] for c in seeded]
+    lats = [c[3] for c in seeded]
+    lons = [c[4] for c in seeded]
+    used = set(names)
+    while len(names) < count:
+        parts = rng.choice(SYLLABLES, size=rng.integers(2, 4))
+        name = "".join(parts).capitalize()
+        if name in used:
+            name = f"{name} {len(names)}"
+        used.add(name)
+        names.append(name)
+        states.append(f"{name[:3].upper()} State")
+        zones.append(ZONES[int(rng.integers(len(ZONES)))])
+        lats.append(float(rng.uniform(*LAT_RANGE)))
+        lons.append(float(rng.uniform(*LON_RANGE)))
+    return {
+        "name": np.array(names, dtype=object),
+        "state": np.array(states, dtype=object),
+        "zone": np.array(zones, dtype=object),
+        "lat": np.array(lats),
+        "lon": np.array(lons),
+    }
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        conn.executescript(f.read())
+    # Columns added by later migrations (start.sh / migrate_expenses.py) that the app relies on
+    for table, column, decl in (("Trips", "start_date", "TEXT"), ("Trips", "end_date", "TEXT"),
+                                ("Expenses", "payer", "TEXT DEFAULT 'Unknown'"),
+                                ("Expenses", "cleared", "BOOLEAN DEFAULT 0")):
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    # Bulk-load settings: no rollback journal or fsync until the load is done
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    return conn
+
+
+def next_id(conn, table):
+    return conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").fetchone()[0]
+
+
+def bulk_insert(conn, table, columns, rows):
+    placeholders = ", ".join("?" for _ in columns)
+    conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+
+def generate_places(conn, rng, cities, count, chunk_size):
+    """Insert `count` places; returns (city index, type index, entrance fee) per place id offset"""
+    city_p = zipf_weights(len(cities["name"]), CITY_ZIPF)
+    type_p = zipf_weights(len(TYPES), TYPE_ZIPF)
+    imported_at = datetime.utcnow().isoformat()
+    first_id = next_id(conn, "TravelDatasetImported")
+    place_city = np.empty(count, dtype=np.int32)
+    place_type = np.empty(count, dtype=np.int16)
+    place_fee = np.empty(count, dtype=np.float32)
+
+    for start in range(0, count, chunk_size):
+        n = min(chunk_size, count - start)
+        city = rng.choice(len(city_p), size=n, p=city_p).astype(np.int32)
+        kind = rng.choice(len(type_p), size=n, p=type_p).astype(np.int16)
+        lat = np.round(cities["lat"][city] + rng.normal(0, COORD_SPREAD, n), 4)
+        lon = np.round(cities["lon"][city] + rng.normal(0, COORD_SPREAD, n), 4)
+        rating = np.round(np.clip(rng.normal(4.35, 0.25, n), 1.0, 5.0), 1)
+        fee = np.where(rng.random(n) < 0.4, 0.0, np.round(rng.lognormal(4.0, 1.1, n), -1))
+        hours = rng.choice([0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0], size=n, p=[.1, .25, .2, .2, .13, .08, .04])
+        reviews = np.round(rng.lognormal(-1.5, 1.2, n), 2)
+        year = rng.integers(300, 2015, n)
+        significance = rng.integers(len(SIGNIFICANCE), size=n)
+        best_time = rng.integers(len(BEST_TIME), size=n)
+        weekly_off = rng.integers(len(WEEKLY_OFF), size=n)
+        acts = rng.integers(len(ACTIVITIES), size=(n, 3))
+        foods = rng.integers(len(FOODS), size=(n, 2))
+        hotel = rng.integers(len(HOTELS), size=n)
+        flags = rng.random((n, 3))
+
+        place_city[start:start + n] = city
+        place_type[start:start + n] = kind
+        place_fee[start:start + n] = fee
+
+        rows = []
+        for i in range(n):
+            c, t = city[i], kind[i]
+            city_name, type_name = cities["name"][c], TYPES[t]
+            rows.append((
+                first_id + start + i,
+                cities["zone"][c], cities["state"][c], city_name,
+                place_name(city_name, type_name, start + i), type_name, str(year[i]),
+                float(hours[i]), float(rating[i]), float(fee[i]),
+                "Yes" if flags[i, 0] < 0.7 else "No", WEEKLY_OFF[weekly_off[i]],
+                SIGNIFICANCE[significance[i]], "Yes" if flags[i, 1] < 0.85 else "No",
+                float(reviews[i]), BEST_TIME[best_time[i]], float(lat[i]), float(lon[i]),
+                f"A popular {type_name.lower()} in {city_name}",
+                "|".join(dict.fromkeys(ACTIVITIES[a] for a in acts[i])),
+                f"{city_name} {HOTELS[hotel[i]]}|Hotel {HOTELS[(hotel[i] + 1) % len(HOTELS)]}",
+                "|".join(dict.fromkeys(FOODS[f] for f in foods[i])),
+                "Yes" if flags[i, 2] < 0.8 else "No", ACTIVITY_TYPE[type_name], imported_at,
+            ))
+        conn.execute("BEGIN")
+        bulk_insert(conn, "TravelDatasetImported", ("id",) + PLACE_COLUMNS, rows)
+        conn.execute("COMMIT")
+        print(f"  places {start + n:,}/{count:,}", end="\r", flush=True)
+    print()
+    return place_city, place_type, place_fee
+
+
+def place_name(city_name, type_name, index):
+    return f"{city_name} {type_name} {index + 1}"
+
+
+def generate_users(conn, rng, count, chunk_size):
+    # bcrypt is deliberately slow, so every synthetic user shares one hash
+    password_hash = bcrypt.hashpw(SYNTHETIC_PASSWORD.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    first_id = next_id(conn, "Users")
+    now = datetime.utcnow()
+    for start in range(0, count, chunk_size):
+        n = min(chunk_size, count - start)
+        first = rng.integers(len(FIRST_NAMES), size=n)
+        last = rng.integers(len(LAST_NAMES), size=n)
+        age = rng.integers(0, 730, size=n)
+        rows = [(
+            first_id + start + i,
+            f"{FIRST_NAMES[first[i]]} {LAST_NAMES[last[i]]}",
+            f"user{first_id + start + i}@synthetic.voyago",
+            password_hash,
+            (now - timedelta(days=int(age[i]))).isoformat(),
+        ) for i in range(n)]
+        conn.execute("BEGIN")
+        bulk_insert(conn, "Users", ("id", "full_name", "email", "password_hash", "created_at"), rows)
+        conn.execute("COMMIT")
+    return first_id
+
+
+def generate_trips(conn, rng, cities, places, first_user, users, trips_per_user, chunk_size):
+    """Trips per user are geometric; items, expenses and members per trip are Poisson"""
+    place_city, place_type, place_fee = places
+    # Places grouped by city so a trip's items can be drawn from its destination
+    by_city = np.argsort(place_city, kind="stable")
+    city_start = np.searchsorted(place_city[by_city], np.arange(len(cities["name"])))
+    city_count = np.bincount(place_city, minlength=len(cities["name"]))
+    # Trips go where the places are
+    city_p = city_count / city_count.sum()
+
+    trip_id = next_id(conn, "Trips")
+    item_id = next_id(conn, "ItineraryItems")
+    expense_id = next_id(conn, "Expenses")
+    member_id = next_id(conn, "TripMembers")
+    totals = {"trips": 0, "items": 0, "expenses": 0, "members": 0}
+    now = datetime.utcnow()
+
+    for start in range(0, users, chunk_size):
+        n_users = min(chunk_size, users - start)
+        per_user = rng.geometric(1.0 / (trips_per_user + 1), size=n_users) - 1
+        owners = np.repeat(np.arange(first_user + start, first_user + start + n_users), per_user)
+        n = len(owners)
+        if n == 0:
+            continue
+        dest = rng.choice(len(city_p), size=n, p=city_p)
+        origin = rng.integers(len(city_p), size=n)
+        days = rng.integers(1, 8, size=n)
+        budget = np.round(rng.lognormal(9.6, 0.7, n), -2)
+        mode = rng.integers(len(TRAVEL_MODES), size=n)
+        created = rng.integers(0, 365, size=n)
+        lead = rng.integers(1, 120, size=n)
+        ids = np.arange(trip_id, trip_id + n)
+
+        items, expenses, members, trips = [], [], [], []
+        item_counts = np.minimum(rng.poisson(2.5 * days), city_count[dest])
+        expense_counts = rng.poisson(1.5 * days)
+        member_counts = rng.poisson(1.2, size=n)
+        for i in range(n):
+            c = dest[i]
+            created_at = now - timedelta(days=int(created[i]))
+            start_date = (created_at + timedelta(days=int(lead[i]))).date()
+            total_cost = 0.0
+            if item_counts[i]:
+                picks = by_city[city_start[c] + rng.choice(city_count[c], size=item_counts[i], replace=False)]
+                for j, p in enumerate(picks):
+                    cost = float(place_fee[p])
+                    total_cost += cost
+                    hour = 9 + 2 * (j % 4)
+                    items.append((item_id, int(ids[i]), j // 4 + 1,
+                                  place_name(cities["name"][c], TYPES[place_type[p]], int(p)),
+                                  f"{hour:02d}:00", f"{hour + 2:02d}:00", None, cost))
+                    item_id += 1
+            for _ in range(expense_counts[i]):
+                expenses.append((expense_id, int(ids[i]), int(owners[i]),
+                                 EXPENSE_CATEGORIES[int(rng.integers(len(EXPENSE_CATEGORIES)))],
+                                 float(np.round(rng.lognormal(6.5, 1.0), 2)), "INR",
+                                 (start_date + timedelta(days=int(rng.integers(days[i])))).isoformat(),
+                                 None, "You", int(rng.random() < 0.5)))
+                expense_id += 1
+            for k in range(member_counts[i]):
+                first, last = FIRST_NAMES[int(rng.integers(len(FIRST_NAMES)))], LAST_NAMES[int(rng.integers(len(LAST_NAMES)))]
+                members.append((member_id, int(ids[i]), f"{first} {last}",
+                                f"{first.lower()}.{last.lower()}{member_id}@synthetic.voyago",
+                                created_at.isoformat()))
+                member_id += 1
+            trips.append((int(ids[i]), int(owners[i]), cities["name"][origin[i]], cities["name"][c],
+                          TYPES[int(rng.integers(len(TYPES)))], int(days[i]), float(budget[i]),
+                          TRAVEL_MODES[mode[i]], None, round(total_cost, 2),
+                          created_at.isoformat(), created_at.isoformat(), start_date.isoformat(),
+                          (start_date + timedelta(days=int(days[i]) - 1)).isoformat()))
+        trip_id += n
+
+        conn.execute("BEGIN")
+        bulk_insert(conn, "Trips", ("id", "user_id", "origin", "destination", "category", "num_days", "budget",
+                                    "travel_mode", "itinerary_html", "total_cost", "created_at", "updated_at",
+                                    "start_date", "end_date"), trips)
+        bulk_insert(conn, "ItineraryItems", ("id", "trip_id", "day", "place_name", "start_time", "end_time",
+                                             "notes", "estimated_cost"), items)
+        bulk_insert(conn, "Expenses", ("id", "trip_id", "user_id", "category", "amount", "currency", "date",
+                                       "note", "payer", "cleared"), expenses)
+        bulk_insert(conn, "TripMembers", ("id", "trip_id", "name", "email", "added_at"), members)
+        conn.execute("COMMIT")
+        totals["trips"] += len(trips)
+        totals["items"] += len(items)
+        totals["expenses"] += len(expenses)
+        totals["members"] += len(members)
+        print(f"  trips {totals['trips']:,}", end="\r", flush=True)
+    print()
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic Voyago database at scale")
+    parser.add_argument("--db", default="synthetic.db", help="SQLite file to write (created if missing)")
+    parser.add_argument("--places", type=int, default=10_000)
+    parser.add_argument("--cities", type=int, default=None,
+                        help="Number of cities (default grows with the catalog, ~sqrt(places))")
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--trips-per-user", type=float, default=2.0, help="Mean trips per user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    n_cities = args.cities or max(61, int(np.sqrt(args.places)))
+    started = time.perf_counter()
+    conn = connect(args.db)
+    try:
+        cities = build_cities(rng, n_cities)
+        print(f"Generating {args.places:,} places across {n_cities:,} cities")
+        places = generate_places(conn, rng, cities, args.places, args.chunk_size)
+        print(f"Generating {args.users:,} users")
+        first_user = generate_users(conn, rng, args.users, args.chunk_size)
+        totals = generate_trips(conn, rng, cities, places, first_user, args.users,
+                                args.trips_per_user, max(1, args.chunk_size // 10))
+        conn.execute("ANALYZE")
+        # Back to normal durability before the catalog swap
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.execute("PRAGMA synchronous=FULL")
+        # The catalog table was filled in place; publish it so running APIs pick it up
+        generation, directory = publish(conn, args.db, staging=False)
+    finally:
+        conn.close()
+    print(f"Published catalog generation {generation} (snapshot: {directory})")
+    print(f"Wrote {args.places:,} places, {args.users:,} users, {totals['trips']:,} trips, "
+          f"{totals['items']:,} itinerary items, {totals['expenses']:,} expenses and "
+          f"{totals['members']:,} members to {args.db} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
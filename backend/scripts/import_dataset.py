@@ -1,8 +1,12 @@
 import sqlite3
 import pandas as pd
 import os
+import sys
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from catalog import STAGING_TABLE, publish
+
 DB_PATH = "voyago_lite.db"
 CSV_PATH = "../data/expanded_travel_dataset.csv"
 
@@ -14,14 +18,13 @@ def import_data():
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
 
-    # Create table if not exists (schema should match db_init.sql)
-    # We rely on db_init.sql having been run or we can alter table here if needed.
-    # But for simplicity, let's assume the table exists or we drop and recreate.
+    # Load into a staging table (schema should match db_init.sql); publish() swaps it in
+    # atomically, so the API never sees a half-imported catalog.
     
-    cur.execute("DROP TABLE IF EXISTS TravelDatasetImported")
+    cur.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
     
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS TravelDatasetImported (
+    cur.execute(f"""
+    CREATE TABLE {STAGING_TABLE} (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       Zone TEXT,
       State TEXT,
@@ -46,7 +49,9 @@ def import_data():
       Food_Options TEXT,
       Kid_Friendly TEXT,
       Activity_Type TEXT,
-      imported_at TEXT
+      imported_at TEXT,
+      Best_Month_Mask INTEGER,
+      Best_Daypart_Mask INTEGER
     );
     """)
 
@@ -72,11 +77,13 @@ def import_data():
     df['imported_at'] = datetime.utcnow().isoformat()
 
     # Insert data
-    df.to_sql('TravelDatasetImported', conn, if_exists='append', index=False)
+    df.to_sql(STAGING_TABLE, conn, if_exists='append', index=False)
     
     conn.commit()
+    generation, directory = publish(conn, DB_PATH)
     conn.close()
     print(f"Successfully imported {len(df)} records.")
+    print(f"Published catalog generation {generation} (snapshot: {directory})")
 
 if __name__ == "__main__":
     import_data()
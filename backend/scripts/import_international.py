@@ -1,9 +1,13 @@
 import pandas as pd
 import sqlite3
 import os
+import sys
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+from catalog import STAGING_TABLE, create_staging, publish
+
 DB_PATH = os.path.join(BASE_DIR, "voyago_lite.db")
 CSV_PATH = os.path.join(BASE_DIR, "data", "international_cities.csv")
 
@@ -22,10 +26,18 @@ def import_international_cities():
         # Add any missing columns with default values if necessary
         # For now, we assume the CSV matches the required columns for the app logic
         
+        # The CSV spells one column differently from the table
+        df = df.rename(columns={"Number_of_google_reviews_in_lakhs": "Number_of_google_review_in_lakhs"})
+
+        # Append to a copy of the catalog and publish it as a new generation,
+        # so running workers switch over without a restart
         print("Appending data to TravelDatasetImported table...")
-        df.to_sql("TravelDatasetImported", conn, if_exists="append", index=False)
+        create_staging(conn, copy_rows=True)
+        df.to_sql(STAGING_TABLE, conn, if_exists="append", index=False)
+        generation, directory = publish(conn, DB_PATH)
         
         print(f"Successfully added {len(df)} international places!")
+        print(f"Published catalog generation {generation} (snapshot: {directory})")
         
     except Exception as e:
         print(f"Error importing data: {e}")
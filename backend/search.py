@@ -0,0 +1,163 @@
+"""
+Place search: SQLite FTS5 for full-text matching plus an in-memory trigram
+index for typo tolerance.
+
+PlaceSearch is an external-content FTS5 table over the catalog's text
+columns, rebuilt whenever a catalog generation is published. Query words
+that match nothing are corrected against the index's own vocabulary, and
+free-text destinations ("Dilli", "Pariss") are resolved against the known
+cities and states, by trigram candidate lookup followed by edit distance.
+"""
+import re
+from collections import Counter
+
+SEARCH_TABLE = "PlaceSearch"
+SEARCH_COLUMNS = ("Name", "City", "State", "Description", "Activities", "Food_Options")
+# bm25 weights, in SEARCH_COLUMNS order: names and places count more than prose
+SEARCH_WEIGHTS = (10.0, 6.0, 4.0, 1.0, 1.5, 1.0)
+
+SEARCH_SCHEMA = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        {", ".join(SEARCH_COLUMNS)},
+        content='TravelDatasetImported', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+"""
+VOCAB_SCHEMA = f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE}Vocab USING fts5vocab({SEARCH_TABLE}, 'row')"
+
+MIN_SIMILARITY = 0.55       # 1 - edit distance / length; "dilli" -> "delhi" is 0.6
+CANDIDATES = 50             # trigram-overlap candidates checked with edit distance
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def rebuild_search_index(conn):
+    """(Re)build PlaceSearch from the live catalog table; run inside the publishing transaction"""
+    conn.execute(SEARCH_SCHEMA)
+    conn.execute(VOCAB_SCHEMA)
+    conn.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+def search_index_exists(conn):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (SEARCH_TABLE,)).fetchone()
+    return row is not None
+
+
+def words(text):
+    return _WORD.findall(text.lower())
+
+
+def match_expression(tokens):
+    """FTS5 MATCH string: every word must match, the last one as a prefix (search-as-you-type)"""
+    quoted = ['"' + t.replace('"', '""') + '"' for t in tokens]
+    if quoted:
+        quoted[-1] += "*"
+    return " AND ".join(quoted)
+
+
+def search_ids(conn, tokens, limit):
+    """Catalog ids matching all `tokens`, best bm25 rank first"""
+    weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+    rows = conn.execute(
+        f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH ? "
+        f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT ?",
+        (match_expression(tokens), limit)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def search_terms(conn):
+    return [row[0] for row in conn.execute(f"SELECT term FROM {SEARCH_TABLE}Vocab")]
+
+
+# --- Fuzzy matching ---
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, giving up (returning limit + 1) once it must exceed `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    """Trigram inverted index over a fixed vocabulary, ranked by edit distance"""
+
+    def __init__(self, terms):
+        self.terms = list(dict.fromkeys(terms))
+        self._folded = [t.lower() for t in self.terms]
+        self._known = set(self._folded)
+        self._postings = {}
+        for i, term in enumerate(self._folded):
+            for gram in trigrams(term):
+                self._postings.setdefault(gram, []).append(i)
+
+    def __contains__(self, word):
+        return word.lower() in self._known
+
+    def lookup(self, word, limit=1):
+        """Up to `limit` (term, similarity) pairs for `word`, most similar first"""
+        word = word.lower()
+        if not word:
+            return []
+        overlap = Counter()
+        for gram in trigrams(word):
+            overlap.update(self._postings.get(gram, ()))
+        max_distance = int(len(word) * (1 - MIN_SIMILARITY))
+        scored = []
+        for i, shared in overlap.most_common(CANDIDATES):
+            term = self._folded[i]
+            distance = edit_distance(word, term, max_distance)
+            if distance <= max_distance:
+                similarity = 1 - distance / max(len(word), len(term))
+                if similarity >= MIN_SIMILARITY:
+                    # Ties go to terms with the same first letter (rarely the mistyped one), then more shared trigrams
+                    scored.append((similarity, term[0] == word[0], shared, -len(term), self.terms[i]))
+        scored.sort(reverse=True)
+        return [(entry[-1], entry[0]) for entry in scored[:limit]]
+
+
+def destination_index(catalog):
+    """FuzzyIndex over the catalog's cities and states, built once per catalog generation"""
+    def build():
+        return FuzzyIndex(catalog.vocab["City"] + catalog.vocab["State"])
+    return catalog.derived("destination_index", build)
+
+
+def term_index(catalog, conn):
+    """FuzzyIndex over the FTS vocabulary, built once per catalog generation"""
+    return catalog.derived("search_term_index", lambda: FuzzyIndex(search_terms(conn)))
+
+
+def resolve_destination(catalog, text):
+    """Closest known city or state for a misspelled destination, or None"""
+    matches = destination_index(catalog).lookup(text.strip())
+    return matches[0][0] if matches else None
+
+
+def correct_tokens(index, tokens):
+    """Replace words the index doesn't know with their closest term; None if nothing changed"""
+    corrected, changed = [], False
+    for token in tokens:
+        if token in index:
+            corrected.append(token)
+            continue
+        match = index.lookup(token)
+        if match:
+            corrected.append(match[0][0].lower())
+            changed = True
+        else:
+            corrected.append(token)
+    return corrected if changed else None
@@ -0,0 +1,142 @@
+"""
+Structured seasonality parsed from the free-text Best_Time_to_visit.
+
+Each place gets two integer bitmasks, filled in by publish() for every
+import:
+  Best_Month_Mask     bit m set for months the place is worth visiting (bit 0 = January)
+  Best_Daypart_Mask   MORNING | AFTERNOON | EVENING | NIGHT
+
+"April-October", "Oct-Mar" and "November to February" are month ranges
+(wrapping the year end), "Winter"/"Summer"/"Monsoon" are Indian seasons,
+"Morning"/"Evening" constrain the time of day only, and anything else
+("Year-round", "All", "Adventure") constrains nothing. A trip's dates become
+a month mask too, so "in season" is one vectorised bitwise AND.
+"""
+import re
+from datetime import date
+from functools import lru_cache
+
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+MONTH_COLUMN = "Best_Month_Mask"
+DAYPART_COLUMN = "Best_Daypart_Mask"
+
+ALL_MONTHS = (1 << 12) - 1
+MORNING, AFTERNOON, EVENING, NIGHT = 1, 2, 4, 8
+ALL_DAYPARTS = MORNING | AFTERNOON | EVENING | NIGHT
+
+SEASON_BOOST = 0.1          # utility added to places whose season the trip falls in
+
+MONTHS = {name: i for i, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"))}
+SEASONS = {
+    "winter": (10, 1),      # November-February
+    "summer": (2, 5),       # March-June
+    "monsoon": (6, 8),      # July-September
+    "spring": (1, 3),
+    "autumn": (8, 10),
+}
+DAYPARTS = {
+    "morning": MORNING, "sunrise": MORNING, "dawn": MORNING,
+    "afternoon": AFTERNOON, "noon": AFTERNOON, "midday": AFTERNOON,
+    "evening": EVENING, "sunset": EVENING, "dusk": EVENING,
+    "night": NIGHT,
+}
+
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*"
+_RANGE = re.compile(_MONTH + r"\s*(?:-|–|to|till|until)\s*" + _MONTH)
+_SINGLE = re.compile(r"\b" + _MONTH + r"\b")
+
+
+def month_range(first, last):
+    """Mask for months first..last inclusive (0-based), wrapping past December"""
+    mask, m = 0, first
+    while True:
+        mask |= 1 << m
+        if m == last:
+            return mask
+        m = (m + 1) % 12
+
+
+@lru_cache(maxsize=None)
+def parse(text):
+    """(month mask, daypart mask) for a Best_Time_to_visit value"""
+    if not text:
+        return ALL_MONTHS, ALL_DAYPARTS
+    text = text.lower()
+    months = 0
+    for first, last in _RANGE.findall(text):
+        months |= month_range(MONTHS[first], MONTHS[last])
+    if not months:
+        for name in _SINGLE.findall(text):
+            months |= 1 << MONTHS[name]
+    for season, (first, last) in SEASONS.items():
+        if re.search(r"\b" + season + r"\b", text):
+            months |= month_range(first, last)
+    dayparts = 0
+    for word, bit in DAYPARTS.items():
+        if re.search(r"\b" + word, text):
+            dayparts |= bit
+    return months or ALL_MONTHS, dayparts or ALL_DAYPARTS
+
+
+def annotate(conn, table):
+    """Add the mask columns to `table` if needed and fill them for every row"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for column in (MONTH_COLUMN, DAYPART_COLUMN):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+    conn.create_function("season_months", 1, lambda text: parse(text)[0], deterministic=True)
+    conn.create_function("season_dayparts", 1, lambda text: parse(text)[1], deterministic=True)
+    conn.execute(f"""
+        UPDATE {table} SET {MONTH_COLUMN} = season_months(Best_Time_to_visit),
+                           {DAYPART_COLUMN} = season_dayparts(Best_Time_to_visit)
+    """)
+
+
+def _to_date(value):
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except (TypeError, ValueError):
+        return None
+
+
+def travel_months(start_date, end_date=None):
+    """Month mask covering a trip's dates; None if they can't be read"""
+    start = _to_date(start_date)
+    if start is None:
+        return None
+    end = _to_date(end_date) or start
+    if end < start:
+        start, end = end, start
+    if (end.year - start.year) * 12 + end.month - start.month >= 11:
+        return ALL_MONTHS
+    return month_range(start.month - 1, end.month - 1)
+
+
+def in_season(catalog, positions, months):
+    """Which of `positions` are worth visiting in `months` (everything, for catalogs without masks)"""
+    if months is None or MONTH_COLUMN not in catalog.integers:
+        return np.ones(len(positions), dtype=bool)
+    masks = catalog.integers[MONTH_COLUMN][positions]
+    # 0 is a row that was never annotated
+    return ((masks & months) != 0) | (masks == 0)
+
+
+def seasonal(catalog, positions):
+    """Places with a stated season (not year-round)"""
+    if MONTH_COLUMN not in catalog.integers:
+        return np.zeros(len(positions), dtype=bool)
+    masks = catalog.integers[MONTH_COLUMN][positions]
+    return (masks != ALL_MONTHS) & (masks != 0)
+
+
+def daypart_rank(catalog, positions):
+    """Where in the day a place belongs: 0 morning .. 3 night, 1 when it doesn't matter"""
+    if DAYPART_COLUMN not in catalog.integers:
+        return np.ones(len(positions), dtype=np.int64)
+    masks = np.asarray(catalog.integers[DAYPART_COLUMN][positions], dtype=np.int64)
+    earliest = np.log2(np.maximum(masks & -masks, 1)).astype(np.int64)
+    return np.where((masks == ALL_DAYPARTS) | (masks == 0), 1, earliest)
@@ -0,0 +1,72 @@
+"""
+Lean row serialization for the small OLTP reads behind most endpoints.
+
+Rows go straight from sqlite3 tuples to dicts (no pandas DataFrame per
+request) and responses are rendered with orjson, which also turns NaN
+into null and understands numpy scalars.
+"""
+import orjson
+from fastapi.responses import Response
+
+# SQL text -> column names, so repeated queries skip rebuilding them
+_columns_cache = {}
+
+
+def _columns(sql, cur):
+    cols = _columns_cache.get(sql)
+    desc = cur.description
+    if cols is None or len(cols) != len(desc):
+        cols = tuple(d[0] for d in desc)
+        _columns_cache[sql] = cols
+    return cols
+
+
+def _execute(conn, sql, params):
+    cur = conn.cursor()
+    # Plain tuples are much cheaper than sqlite3.Row for bulk mapping
+    cur.row_factory = None
+    cur.execute(sql, params)
+    return cur
+
+
+def fetch_tuples(conn, sql, params=()):
+    """Run a query and return (column_names, list_of_tuples)"""
+    cur = _execute(conn, sql, params)
+    rows = cur.fetchall()
+    return _columns(sql, cur), rows
+
+
+def fetch_dicts(conn, sql, params=()):
+    """Run a query and return its rows as a list of dicts"""
+    cur = _execute(conn, sql, params)
+    rows = cur.fetchall()
+    cols = _columns(sql, cur)
+    return [dict(zip(cols, row)) for row in rows]
+
+
+def fetch_one(conn, sql, params=()):
+    """Run a query and return the first row as a dict, or None"""
+    cur = _execute(conn, sql, params)
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return dict(zip(_columns(sql, cur), row))
+
+
+def _default(obj):
+    # numpy scalars that slipped through (e.g. np.float64 from a reduction)
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONResponse(Response):
+    """JSON response rendered with orjson; return it directly to skip jsonable_encoder"""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
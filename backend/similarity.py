@@ -0,0 +1,162 @@
+"""
+"Places like this": content similarity over hashed TF-IDF vectors.
+
+Each place becomes a sparse vector of hashed features taken from its
+Description words, its pipe-separated Activities and Food_Options, and its
+Type, Significance and Activity_Type. Weights are sublinear TF x IDF and
+rows are L2-normalised, so a dot product is a cosine similarity. The matrix
+is kept both row-major (CSR, to read a place's vector) and column-major
+(CSC, so multiplying by one vector only touches the places that share a
+feature with it). It is built when a catalog snapshot is written and
+memory-mapped with the rest of the snapshot.
+"""
+import os
+import re
+import zlib
+
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+N_FEATURES = 1 << 18
+MAX_QUERY_FEATURES = 32     # heaviest features of the query vector that are scored
+
+# Field weights: structured attributes say more about "similar" than prose does
+TYPE_WEIGHT = 3.0
+LABEL_WEIGHT = 2.0
+LIST_WEIGHT = 1.5
+WORD_WEIGHT = 1.0
+
+ARRAYS = ("indptr", "indices", "data", "colptr", "csc_rows", "csc_data")
+
+_WORD = re.compile(r"[a-z]{3,}")
+STOPWORDS = frozenset((
+    "the", "and", "for", "with", "from", "that", "this", "are", "its", "was", "has", "into",
+    "one", "most", "also", "known", "famous", "popular", "place", "site", "located",
+))
+
+
+def _feature(token):
+    return zlib.crc32(token.encode("utf-8")) & (N_FEATURES - 1)
+
+
+def _place_features(description, activities, food, labels):
+    """Hashed feature -> raw weighted term frequency for one place"""
+    counts = {}
+
+    def add(token, weight):
+        f = _feature(token)
+        counts[f] = counts.get(f, 0.0) + weight
+
+    for token, weight in labels:
+        add(token, weight)
+    for column, text in (("act", activities), ("food", food)):
+        if text:
+            for item in text.split("|"):
+                item = item.strip().lower()
+                if item:
+                    add(f"{column}:{item}", LIST_WEIGHT)
+                    for word in _WORD.findall(item):
+                        add(word, WORD_WEIGHT)
+    if description:
+        for word in _WORD.findall(description.lower()):
+            if word not in STOPWORDS:
+                add(word, WORD_WEIGHT)
+    return counts
+
+
+class TfidfIndex:
+    def __init__(self, indptr, indices, data, colptr, csc_rows, csc_data):
+        self.indptr = indptr        # CSR: row pointers (n + 1)
+        self.indices = indices      # CSR: feature ids
+        self.data = data            # CSR: weights
+        self.colptr = colptr        # CSC: feature pointers (N_FEATURES + 1)
+        self.csc_rows = csc_rows    # CSC: row positions
+        self.csc_data = csc_data    # CSC: weights
+        self.size = len(indptr) - 1
+
+    def similar(self, position, k, mask=None):
+        """Top-k (positions, cosine scores) for the place at `position`, excluding itself"""
+        start, end = int(self.indptr[position]), int(self.indptr[position + 1])
+        features = np.asarray(self.indices[start:end])
+        weights = np.asarray(self.data[start:end], dtype=np.float64)
+        if len(features) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if len(features) > MAX_QUERY_FEATURES:
+            keep = np.argpartition(-weights, MAX_QUERY_FEATURES)[:MAX_QUERY_FEATURES]
+            features, weights = features[keep], weights[keep]
+
+        # Sparse matrix-vector product over the CSC columns the query touches
+        rows, values = [], []
+        for feature, weight in zip(features.tolist(), weights.tolist()):
+            lo, hi = int(self.colptr[feature]), int(self.colptr[feature + 1])
+            rows.append(self.csc_rows[lo:hi])
+            values.append(self.csc_data[lo:hi] * weight)
+        scores = np.bincount(np.concatenate(rows), weights=np.concatenate(values), minlength=self.size)
+
+        scores[position] = 0.0
+        if mask is not None:
+            scores[~mask] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return order, scores[order]
+
+    def save(self, directory):
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f"tfidf.{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, load):
+        """Load with `load(path)` (e.g. a memory-mapping loader); None if the snapshot has no index"""
+        paths = [os.path.join(directory, f"tfidf.{name}.npy") for name in ARRAYS]
+        if not all(os.path.exists(p) for p in paths):
+            return None
+        return cls(*(load(p) for p in paths))
+
+
+def build_index(catalog):
+    """Hashed TF-IDF matrix for every place in `catalog`"""
+    n = catalog.size
+    label_features = {}
+    for column, prefix, weight in (("Type", "type", TYPE_WEIGHT), ("Significance", "sig", LABEL_WEIGHT),
+                                   ("Activity_Type", "atype", LABEL_WEIGHT)):
+        if column in catalog.codes:
+            vocab = catalog.vocab[column]
+            label_features[column] = (catalog.codes[column].tolist(),
+                                      [(f"{prefix}:{v.strip().lower()}", weight) for v in vocab])
+
+    def text(column):
+        return iter(catalog.text[column]) if column in catalog.text else iter([None] * n)
+
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indices, tf = [], []
+    for pos, (description, activities, food) in enumerate(zip(text("Description"), text("Activities"), text("Food_Options"))):
+        labels = [vocab[codes[pos]] for codes, vocab in label_features.values() if codes[pos] >= 0]
+        counts = _place_features(description, activities, food, labels)
+        indices.extend(counts)
+        tf.extend(counts.values())
+        indptr[pos + 1] = len(indices)
+
+    indices = np.array(indices, dtype=np.int32)
+    # Sublinear TF; every weighted count is >= 1, so weights stay positive
+    data = 1.0 + np.log(np.array(tf, dtype=np.float64))
+    rows = np.repeat(np.arange(n, dtype=np.int32), np.diff(indptr))
+
+    df = np.bincount(indices, minlength=N_FEATURES)
+    idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+    data *= idf[indices]
+    norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=n))
+    data /= np.where(norms > 0, norms, 1.0)[rows]
+    data = data.astype(np.float32)
+
+    order = np.argsort(indices, kind="stable")
+    colptr = np.zeros(N_FEATURES + 1, dtype=np.int64)
+    np.cumsum(df, out=colptr[1:])
+    return TfidfIndex(indptr, indices, data, colptr, rows[order], data[order])
+
+
+def tfidf_index(catalog):
+    """The catalog's TF-IDF index: mapped from its snapshot, or built once per generation"""
+    return catalog.derived("tfidf", lambda: build_index(catalog))
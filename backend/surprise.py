@@ -0,0 +1,157 @@
+"""
+"Surprise me": weighted random destination in O(1) per draw.
+
+Per-city statistics (place count, review volume, mean rating, places in
+season this month, kid-friendly places, best places) are aggregated from
+the catalog's columns once per generation. For each combination of weight
+scheme and filter a Vose alias table is built from them and cached on the
+catalog, so a draw is one uniform index, one uniform float and a compare.
+"""
+from datetime import date
+
+from lazy import lazy_import
+import seasonality
+
+np = lazy_import("numpy")
+
+# Zones of the domestic dataset; international imports use anything else
+DOMESTIC_ZONES = ("Central", "Eastern", "North Eastern", "Northern", "Southern", "Western")
+REGIONS = ("any", "domestic", "international")
+TOP_PLACES = 3
+
+_rng = None
+
+
+def rng():
+    global _rng
+    if _rng is None:
+        _rng = np.random.default_rng()
+    return _rng
+
+
+def _review_volume(stats):
+    return stats["reviews"]
+
+
+def _rating(stats):
+    # Mean rating above a floor, so weak cities stay possible but rare
+    return np.maximum(stats["rating"] - 3.0, 0.1)
+
+
+def _seasonal(stats):
+    return stats["in_season"]
+
+
+def _balanced(stats):
+    return np.sqrt(stats["reviews"] + 0.1) * _rating(stats) * (0.5 + stats["in_season"] / np.maximum(stats["places"], 1))
+
+
+WEIGHTS = {
+    "uniform": lambda stats: np.ones(len(stats["places"])),
+    "popular": _review_volume,
+    "rated": _rating,
+    "seasonal": _seasonal,
+    "balanced": _balanced,
+}
+
+
+class AliasSampler:
+    """Vose's alias method: O(n) to build, O(1) per draw"""
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=float)
+        n = len(weights)
+        self.size = n
+        self.prob = np.ones(n)
+        self.alias = np.arange(n)
+        total = weights.sum()
+        if n == 0 or total <= 0:
+            return
+        scaled = weights * n / total
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s, g = small.pop(), large.pop()
+            self.prob[s], self.alias[s] = scaled[s], g
+            scaled[g] -= 1.0 - scaled[s]
+            (small if scaled[g] < 1.0 else large).append(g)
+        # Whatever is left is 1 up to rounding
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def draw(self, rng):
+        i = int(rng.integers(self.size))
+        return i if rng.random() < self.prob[i] else int(self.alias[i])
+
+
+class CityStats:
+    """Per-city aggregates over the catalog, indexed by City code"""
+
+    def __init__(self, catalog):
+        codes = np.asarray(catalog.codes["City"])
+        n = len(catalog.vocab["City"])
+        known = codes >= 0
+        city = codes[known]
+        positions = np.flatnonzero(known)
+
+        def total(values):
+            return np.bincount(city, weights=np.asarray(values, dtype=float)[known], minlength=n)
+
+        rating = catalog.numeric["Google_review_rating"]
+        rated = ~np.isnan(rating)
+        reviews = catalog.numeric["Number_of_google_review_in_lakhs"]
+        month = seasonality.month_range(date.today().month - 1, date.today().month - 1)
+
+        self.month = month
+        self.stats = {
+            "places": np.bincount(city, minlength=n).astype(float),
+            "reviews": total(np.nan_to_num(reviews)),
+            "rating": total(np.nan_to_num(rating)) / np.maximum(total(rated), 1),
+            "in_season": total(seasonality.in_season(catalog, np.arange(catalog.size), month)),
+        }
+        kid = catalog.isin("Kid_Friendly", ["yes"], casefold=True) if "Kid_Friendly" in catalog.codes else known & False
+        self.kid_friendly = total(kid) > 0
+        # A city is domestic when most of its places are in the domestic zones
+        domestic = catalog.isin("Zone", DOMESTIC_ZONES) if "Zone" in catalog.codes else known | True
+        self.domestic = total(domestic) > total(~domestic)
+
+        # Best places per city: order by city, then rating, and keep the first few of each run
+        order = positions[np.lexsort((-np.nan_to_num(rating[positions], nan=-1.0), city))]
+        order_city = codes[order]
+        starts = np.searchsorted(order_city, np.arange(n))
+        rank = np.arange(len(order)) - starts[order_city]
+        best = order[rank < TOP_PLACES]
+        self.top = {}
+        for position, code in zip(best.tolist(), codes[best].tolist()):
+            self.top.setdefault(code, []).append(position)
+
+    def eligible(self, region, kid_friendly):
+        mask = self.stats["places"] > 0
+        if region == "domestic":
+            mask &= self.domestic
+        elif region == "international":
+            mask &= ~self.domestic
+        if kid_friendly:
+            mask &= self.kid_friendly
+        return mask
+
+
+def city_stats(catalog):
+    """Per-city aggregates, rebuilt per generation (and when the month changes, for seasonality)"""
+    month = date.today().month
+    return catalog.derived(f"city_stats:{month}", lambda: CityStats(catalog))
+
+
+def sampler(catalog, weight, region, kid_friendly):
+    """(cached AliasSampler, City codes it draws from) for one weight scheme and filter"""
+    stats = city_stats(catalog)
+
+    def build():
+        cities = np.flatnonzero(stats.eligible(region, kid_friendly))
+        weights = WEIGHTS[weight](stats.stats)[cities]
+        # A scheme that rules everything out falls back to uniform rather than failing
+        if not (np.nan_to_num(weights) > 0).any():
+            weights = np.ones(len(cities))
+        return AliasSampler(np.nan_to_num(weights)), cities
+
+    return catalog.derived(f"surprise:{stats.month}:{weight}:{region}:{bool(kid_friendly)}", build)
@@ -1,8 +1,39 @@
+import asyncio
+import itertools
+import json
+import marshal
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
 from fastapi.testclient import TestClient
 from main import app
 
 client = TestClient(app)
 
+@pytest.fixture
+def app_db(tmp_path):
+    """Serve requests from a copy of the database, so tests that write leave the real one alone"""
+    import main
+    original = main.DB_PATH
+    copy_path = str(tmp_path / "voyago_test.db")
+    source, target = sqlite3.connect(original), sqlite3.connect(copy_path)
+    source.backup(target)
+    source.close()
+    target.close()
+    main.use_database(copy_path)
+    try:
+        yield copy_path
+    finally:
+        main.use_database(original)
+
 def test_read_main():
     response = client.get("/api/filters")
     assert response.status_code == 200
@@ -24,3 +55,615 @@ def test_recommendations():
     data = response.json()
     assert "recommendations" in data
     assert isinstance(data["recommendations"], list)
+
+def test_trip_overview(app_db):
+    from main import get_db_connection
+    conn = get_db_connection()
+    cur = conn.execute(
+        "INSERT INTO Trips (user_id, destination, num_days, budget, travel_mode) VALUES (?, ?, ?, ?, ?)",
+        (1, "Delhi", 2, 5000, "train")
+    )
+    trip_id = cur.lastrowid
+    conn.execute(
+        "INSERT INTO Expenses (trip_id, user_id, category, amount, currency, date, note) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (trip_id, 1, "Food", 250.0, "INR", "2025-01-01", "")
+    )
+    conn.commit()
+    conn.close()
+
+    response = client.get(f"/api/trips/{trip_id}/overview")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["trip"]["id"] == trip_id
+    assert len(data["expenses"]) == 1
+    assert data["actually_spent"]["expenses_total"] == 250.0
+    assert data["checklist"]["total"] == 0
+
+    response = client.get(f"/api/trips/{trip_id}/overview?include=members,itinerary")
+    assert set(response.json()) == {"members", "itinerary"}
+
+    assert client.get(f"/api/trips/{trip_id}/overview?include=bogus").status_code == 400
+    assert client.get("/api/trips/999999999/overview").status_code == 404
+
+def test_places_lean_rows():
+    response = client.get("/api/places", params={"city": "delhi"})
+    assert response.status_code == 200
+    places = response.json()
+    assert places and all(p["City"] == "Delhi" for p in places)
+    assert all(isinstance(p["Google_review_rating"], float) for p in places)
+
+def test_bulk_expenses(app_db):
+    payload = {
+        "insert": [
+            {"trip_id": 1, "user_id": 1, "category": "Food", "amount": 100, "currency": "INR", "date": "2025-01-01", "payer": "A"},
+            {"trip_id": 1, "user_id": 1, "category": "Taxi", "amount": 40, "currency": "INR", "date": "2025-01-02", "payer": "B"},
+        ],
+    }
+    response = client.post("/api/expenses/bulk", json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["applied"] == 2
+    first_id, second_id = [r["id"] for r in data["results"]]
+
+    response = client.post("/api/expenses/bulk", json={
+        "update": [{"id": first_id, "cleared": True}, {"id": 999999999, "amount": 1}],
+        "delete": [second_id],
+    })
+    data = response.json()
+    assert [r["status"] for r in data["results"]] == ["ok", "not_found", "ok"]
+    assert data["failed"] == 1
+
+def test_group_commit_writer(tmp_path):
+    from db_writer import GroupCommitWriter
+    writer = GroupCommitWriter(str(tmp_path / "writer.db"), max_delay=0.02)
+    writer.execute(lambda conn: conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v INTEGER)"))
+
+    def insert(v):
+        return writer.execute(lambda conn: conn.execute("INSERT INTO t (v) VALUES (?)", (v,)).lastrowid)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        ids = list(pool.map(insert, range(64)))
+    assert len(set(ids)) == 64
+    # Concurrent writes should have shared commits
+    assert writer.commits < 1 + 64
+
+    # A failing intent only rolls back itself
+    failed = writer.submit(lambda conn: conn.execute("INSERT INTO missing VALUES (1)"))
+    ok = writer.submit(lambda conn: conn.execute("INSERT INTO t (v) VALUES (-1)").lastrowid)
+    assert ok.result() > 0
+    assert failed.exception() is not None
+
+def test_get_writer_is_one_per_database(tmp_path):
+    # Asking for the writer of a database with another connection factory is an error
+    from db_writer import get_writer
+    from metrics import TimedConnection
+    shared = str(tmp_path / "shared.db")
+    assert get_writer(shared, factory=TimedConnection) is get_writer(shared, factory=TimedConnection)
+    with pytest.raises(ValueError):
+        get_writer(shared)
+
+def test_add_expense_idempotency_key(app_db):
+    payload = {"trip_id": 1, "user_id": 1, "category": "Food", "amount": 12.5, "currency": "INR", "date": "2025-01-03", "payer": "A"}
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+    first = client.post("/api/expenses", json=payload, headers=headers)
+    retry = client.post("/api/expenses", json=payload, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json()["id"] == first.json()["id"]
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+
+    conflict = client.post("/api/expenses", json={**payload, "amount": 99}, headers=headers)
+    assert conflict.status_code == 422
+
+    # Expired keys are misses in memory too, not only in the table
+    from main import get_db_connection, idempotency
+    from idempotency import KEY_TTL
+    ident = ("expenses.add", headers["Idempotency-Key"])
+    stale = (datetime.utcnow() - KEY_TTL * 2)
+    idempotency._lru[ident] = (idempotency._lru[ident][0], stale)
+    conn = get_db_connection()
+    conn.execute("UPDATE IdempotencyKeys SET created_at = ? WHERE scope = ? AND key = ?", (stale.isoformat(), *ident))
+    conn.commit()
+    conn.close()
+    again = client.post("/api/expenses", json=payload, headers=headers)
+    assert again.status_code == 200 and again.json()["id"] != first.json()["id"]
+    assert "Idempotent-Replayed" not in again.headers
+
+def test_metrics_endpoint():
+    client.get("/api/trips/1/expenses")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/trips/{trip_id}/expenses"}' in body
+    assert 'sqlite_query_duration_seconds_bucket{statement="SELECT * FROM Expenses WHERE trip_id = ? ORDER BY date DESC",le="+Inf"}' in body
+
+def test_timed_connection_observes_each_statement_once():
+    # One observation per statement, covering execute and every fetch (including iteration)
+    import metrics
+    conn = sqlite3.connect(":memory:", factory=metrics.TimedConnection)
+    conn.execute("CREATE TABLE timed_rows (v INTEGER)")
+    conn.executemany("INSERT INTO timed_rows (v) VALUES (?)", [(i,) for i in range(5)])
+    for sql, read in [("SELECT v FROM timed_rows WHERE v = 1", lambda cur: cur.fetchone()),
+                      ("SELECT v FROM timed_rows", lambda cur: list(cur)),
+                      ("SELECT v FROM timed_rows LIMIT 3", lambda cur: (cur.fetchmany(2), cur.fetchmany(2)))]:
+        statement = metrics.normalize_sql(sql)
+        before = metrics.SQL_LATENCY.count(statement)
+        cur = conn.cursor()
+        read(cur.execute(sql))
+        cur.close()
+        assert metrics.SQL_LATENCY.count(statement) == before + 1
+    conn.close()
+
+def test_profile_admin_request(monkeypatch):
+    import profiling
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    headers = {"X-Admin-Token": "secret"}
+
+    response = client.get("/api/filters", headers={**headers, "X-Profile": "cprofile"})
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+
+    listing = client.get("/api/admin/profiles", headers=headers).json()
+    assert listing[0]["id"] == int(profile_id) and listing[0]["path"] == "/api/filters"
+    stats = marshal.loads(client.get(f"/api/admin/profiles/{profile_id}", headers=headers).content)
+    assert any(func[2] == "get_filters" for func in stats)
+
+    response = client.get("/api/filters", headers={**headers, "X-Profile": "sample"})
+    speedscope = client.get(f"/api/admin/profiles/{response.headers['X-Profile-Id']}", headers=headers).json()
+    assert speedscope["profiles"][0]["type"] == "sampled"
+
+    # Without the admin token the header is ignored and the endpoints stay hidden
+    assert "X-Profile-Id" not in client.get("/api/filters", headers={"X-Profile": "cprofile"}).headers
+    assert client.get("/api/admin/profiles").status_code == 404
+
+def test_benchmark_report_and_regression_check(tmp_path):
+    import main
+    from scripts import benchmark
+    source = benchmark.copy_database(main.DB_PATH, str(tmp_path))
+    with sqlite3.connect(source) as conn:
+        conn.execute("DELETE FROM Users WHERE email = ?", (benchmark.BENCH_EMAIL,))
+    cwd = os.getcwd()
+    out = tmp_path / "bench.json"
+    code = benchmark.main([
+        "--duration", "0.5", "--warmup", "0", "--concurrency", "2",
+        "--mix", "places=1,validate=1", "--out", str(out), "--db", source,
+    ])
+    assert code == 0
+    # Fixtures went into a throwaway copy, and the process is left where it was
+    with sqlite3.connect(source) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM Users WHERE email = ?", (benchmark.BENCH_EMAIL,)).fetchone()[0] == 0
+    assert os.getcwd() == cwd and main.DB_PATH != source
+    result = json.loads(out.read_text())
+    assert set(result["endpoints"]) == {"places", "validate"}
+    assert {"p50_ms", "p95_ms", "p99_ms", "throughput_rps"} <= set(result["endpoints"]["places"])
+
+    slower = {"endpoints": {"places": {**result["endpoints"]["places"], "p95_ms": result["endpoints"]["places"]["p95_ms"] * 2}}}
+    assert benchmark.compare(slower, result, 0.2) != []
+    assert benchmark.compare(result, result, 0.2) == []
+
+def test_cold_import_stays_lean():
+    # Import-time report for `import main` (python -X importtime); heavy modules must load lazily
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=backend_dir, capture_output=True, text=True, timeout=60
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                timings[name.strip()] = int(cumulative)
+    slowest = sorted(timings.items(), key=lambda kv: -kv[1])[:10]
+    report = "\n".join(f"{us / 1000:9.1f} ms  {name}" for name, us in slowest)
+    print("\nslowest imports (cumulative):\n" + report)
+    for heavy in ("pandas", "numpy", "authlib"):
+        assert heavy not in timings, f"{heavy} is imported at startup\n{report}"
+    budget_ms = float(os.getenv("IMPORT_TIME_BUDGET_MS", "3000"))
+    assert timings["main"] / 1000 < budget_ms, report
+
+def test_catalog_snapshot_roundtrip(tmp_path):
+    import numpy as np
+    from catalog import load_catalog, load_snapshot, write_snapshot
+    from main import get_db_connection
+    conn = get_db_connection()
+    catalog = load_catalog(conn)
+    conn.close()
+
+    directory = str(tmp_path / "voyago.catalog")
+    write_snapshot(catalog, directory)
+    write_snapshot(catalog, directory)  # replacing an existing snapshot is a rename, not an overwrite
+    mapped = load_snapshot(directory)
+
+    assert isinstance(mapped.numeric["Google_review_rating"], np.memmap)
+    everything = np.arange(catalog.size)
+    assert mapped.records(everything) == catalog.records(everything)
+    assert mapped.distinct("City") == catalog.distinct("City")
+
+def test_catalog_generation_hot_swap(tmp_path):
+    from catalog import STAGING_TABLE, CatalogStore, create_staging, publish
+    db_path = str(tmp_path / "catalog.db")
+    conn = sqlite3.connect(db_path)
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db_init.sql")) as f:
+        conn.executescript(f.read())
+    conn.execute("INSERT INTO TravelDatasetImported (City, Name, Google_review_rating) VALUES ('Delhi', 'Old Fort', 4.1)")
+    conn.commit()
+
+    store = CatalogStore(db_path, check_interval=0)
+    old = store.get()
+    assert (old.generation, old.size) == (0, 1)
+
+    create_staging(conn, copy_rows=True)
+    conn.execute(f"INSERT INTO {STAGING_TABLE} (City, Name, Google_review_rating) VALUES ('Goa', 'Baga Beach', 4.4)")
+    generation, directory = publish(conn, db_path)
+    conn.close()
+    assert generation == 1
+
+    # The swap happens in the background; the old generation stays usable meanwhile
+    assert store.get() is old
+    deadline = time.time() + 5
+    while store.get().generation != 1 and time.time() < deadline:
+        time.sleep(0.01)
+    new = store.get()
+    assert new.generation == 1 and new.size == 2
+    assert new.distinct("City") == ["Delhi", "Goa"]
+    assert old.records([0])[0]["Name"] == "Old Fort"
+
+def test_search_and_typo_tolerance():
+    response = client.get("/api/search", params={"q": "india gate"})
+    assert response.status_code == 200
+    assert response.json()["results"][0]["Name"] == "India Gate"
+
+    # Misspelled words are corrected against the indexed vocabulary
+    data = client.get("/api/search", params={"q": "Dilli"}).json()
+    assert data["corrected"] == "delhi"
+    assert data["results"] and all(r["City"] == "Delhi" for r in data["results"])
+
+    # ... and misspelled destinations resolve instead of falling back to the whole catalog
+    payload = {"destination": "Dilli", "categories": [], "significance": [], "budget": 5000, "num_days": 2, "preferences": []}
+    recommendations = client.post("/api/recommendations", json=payload).json()["recommendations"]
+    assert recommendations and {r["City"] for r in recommendations} == {"Delhi"}
+
+def test_similar_places():
+    data = client.get("/api/places/1/similar", params={"k": 5}).json()
+    scores = [p["similarity"] for p in data["similar"]]
+    assert 0 < len(scores) <= 5 and scores == sorted(scores, reverse=True)
+    assert data["place"]["id"] not in {p["id"] for p in data["similar"]}
+
+    city = data["similar"][0]["City"]
+    in_city = client.get("/api/places/1/similar", params={"city": city.lower()}).json()["similar"]
+    assert in_city and {p["City"] for p in in_city} == {city}
+
+    assert client.get("/api/places/999999/similar").status_code == 404
+
+def test_personalized_recommendations(app_db):
+    import personalization
+    from main import get_db_connection
+    conn = get_db_connection()
+    personalization.ensure_schema(conn)
+    # Someone who visited India Gate also went to Red Fort; user 90001 has been to India Gate
+    personalization.record_trip(conn, 90002, ["India Gate", "Red Fort"])
+    personalization.record_trip(conn, 90001, ["India Gate"])
+    conn.commit()
+    conn.close()
+
+    payload = {"destination": "Delhi", "categories": [], "significance": [], "budget": 5000, "num_days": 2, "preferences": []}
+    plain = {r["Name"]: r for r in client.post("/api/recommendations", json=payload).json()["recommendations"]}
+    personal = {r["Name"]: r for r in client.post("/api/recommendations", json={**payload, "user_id": 90001}).json()["recommendations"]}
+
+    assert "personal_score" not in plain["Red Fort"]
+    assert 0 < personal["Red Fort"]["personal_score"] <= 1.0
+    assert personal["Red Fort"]["utility_score"] > plain["Red Fort"]["utility_score"]
+    for name, r in personal.items():
+        if r["personal_score"] == 0 and name in plain:
+            assert r["utility_score"] == plain[name]["utility_score"]
+
+def test_trip_plan_respects_budget_and_hours(app_db):
+    import numpy as np
+    import planner
+    # The DP matches brute force on a small instance
+    rng = np.random.default_rng(7)
+    utility, cost, hours = rng.random(10), rng.integers(0, 400, 10).astype(float), rng.integers(1, 8, 10) / 2
+    chosen = planner.choose_places(utility, cost, hours, 1000, 8)
+    best = max(utility[list(s)].sum() for r in range(11) for s in itertools.combinations(range(10), r)
+               if cost[list(s)].sum() <= 1000 and hours[list(s)].sum() <= 8)
+    assert cost[chosen].sum() <= 1000 and hours[chosen].sum() <= 8
+    assert utility[chosen].sum() >= best - 0.05
+    # Hours are pooled over the days, but a place longer than a day can't be scheduled, so it isn't chosen
+    chosen = planner.choose_places([1, .4, .4], [0, 0, 0], [10, 4, 4], 1000, 16, max_item_hours=8)
+    assert chosen.tolist() == [1, 2]
+    # The hour axis stops at the candidates' total, so a huge day count costs no more than a short trip
+    assert planner.choose_places(utility, cost, hours, 1000, 8 * 100000).tolist() == \
+        planner.choose_places(utility, cost, hours, 1000, hours.sum()).tolist()
+
+    payload = {"user_id": 1, "origin": "Mumbai", "destination": "Delhi", "categories": [], "num_days": 2,
+               "budget": 1500, "travel_mode": "train", "selected_places": [],
+               "start_date": "2025-03-01", "end_date": "2025-03-02"}
+    trip = client.post("/api/trips/create", json=payload).json()
+    assert trip["itinerary"] and trip["total_cost"] <= 1500
+    assert {item["day"] for item in trip["itinerary"]} <= {1, 2}
+
+    no_days = client.post("/api/trips/create", json={**payload, "num_days": 0})
+    assert no_days.status_code == 400 and no_days.json()["detail"] == "num_days must be at least 1"
+    too_long = client.post("/api/trips/create", json={**payload, "num_days": 100000})
+    assert too_long.status_code == 400 and too_long.json()["detail"] == "num_days must be at most 365"
+
+def test_multi_city_trip(app_db):
+    import numpy as np
+    import citygraph
+    # Held-Karp agrees with brute force on an open path from a fixed start
+    rng = np.random.default_rng(3)
+    hours = rng.random((7, 7)) * 10
+    order = citygraph.plan_route(hours, start=6)
+    def cost(o):
+        return hours[6, o[0]] + sum(hours[a, b] for a, b in zip(o, o[1:]))
+    assert abs(cost(order) - min(cost(p) for p in itertools.permutations(range(6)))) < 1e-9
+
+    payload = {"user_id": 1, "origin": "Delhi", "destination": "Delhi", "categories": [], "num_days": 5,
+               "budget": 20000, "travel_mode": "train", "selected_places": [],
+               "destinations": ["Mumbai", "Delhi", "Bangalore"], "start_date": "2025-03-01", "end_date": "2025-03-05"}
+    trip = client.post("/api/trips/create", json=payload).json()
+    # Leaves from the origin; Mumbai sits between Delhi and Bangalore
+    assert [leg["to"] for leg in trip["route"]] == ["Mumbai", "Bangalore"]
+    assert trip["route"][0]["from"] == "Delhi" and trip["route"][0]["distance_km"] > 0
+    assert {item["day"] for item in trip["itinerary"]} <= set(range(1, 6))
+    assert trip["total_cost"] <= 20000
+
+def test_filters_etag_and_gzip():
+    first = client.get("/api/filters", headers={"Accept-Encoding": "gzip"})
+    assert first.status_code == 200 and first.headers["content-encoding"] == "gzip"
+    etag = first.headers["etag"]
+    assert etag.startswith('"g')
+    data = first.json()
+    assert data["cities"] == sorted(data["cities"]) and {"City", "lat", "lon"} <= set(data["city_data"][0])
+
+    again = client.get("/api/filters", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert again.status_code == 304 and again.headers["etag"] == etag and not again.content
+    plain = client.get("/api/filters", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.json() == data
+    # Each content-coding has its own strong validator; either one revalidates
+    assert etag.endswith('-gz"') and plain.headers["etag"] == etag.replace('-gz"', '"')
+    assert client.get("/api/filters", headers={"If-None-Match": plain.headers["etag"], "Accept-Encoding": "gzip"}).status_code == 304
+
+def test_seasonality_masks(tmp_path, monkeypatch):
+    import numpy as np
+    import main
+    import seasonality
+    from catalog import CatalogStore, load_snapshot, publish
+    assert seasonality.parse("October-March")[0] == seasonality.month_range(9, 2)
+    assert seasonality.parse("Evening") == (seasonality.ALL_MONTHS, seasonality.EVENING)
+    assert seasonality.travel_months("2025-12-20", "2026-01-05") == (1 << 11) | 1
+
+    db_path = str(tmp_path / "catalog.db")
+    conn = sqlite3.connect(db_path)
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db_init.sql")) as f:
+        conn.executescript(f.read())
+    conn.executemany("INSERT INTO TravelDatasetImported (City, Name, Best_Time_to_visit, Google_review_rating, "
+                     "Entrance_Fee_INR, time_needed_to_visit_hrs) VALUES ('Goa', ?, ?, 4.5, 100, 2)",
+                     [("Baga Beach", "October-March"), ("Dudhsagar Falls", "Monsoon"), ("Fort Aguada", "Evening")])
+    conn.commit()
+    _, directory = publish(conn, db_path, staging=False)
+    conn.close()
+
+    catalog = load_snapshot(directory)
+    everything = np.arange(catalog.size)
+    december = seasonality.travel_months("2025-12-01")
+    assert seasonality.in_season(catalog, everything, december).tolist() == [True, False, True]
+    assert seasonality.daypart_rank(catalog, everything).tolist() == [1, 1, 2]
+
+    # Recommendations drop what is out of season on the travel dates and boost what is in season
+    monkeypatch.setattr(main, "places_catalog", CatalogStore(db_path))
+    payload = {"destination": "Goa", "categories": [], "significance": [], "budget": 5000, "num_days": 2,
+               "preferences": [], "start_date": "2025-12-01", "end_date": "2025-12-03"}
+    places = client.post("/api/recommendations", json=payload).json()["recommendations"]
+    assert [p["Name"] for p in places] == ["Baga Beach", "Fort Aguada"]
+    assert places[0]["utility_score"] == pytest.approx(places[1]["utility_score"] + seasonality.SEASON_BOOST)
+    july = client.post("/api/recommendations", json={**payload, "start_date": "2025-07-10", "end_date": "2025-07-12"})
+    assert [p["Name"] for p in july.json()["recommendations"]] == ["Dudhsagar Falls", "Fort Aguada"]
+
+def test_place_facets():
+    from main import get_db_connection
+    conn = get_db_connection()
+    rows = conn.execute("SELECT Type, Kid_Friendly, time_needed_to_visit_hrs FROM TravelDatasetImported WHERE City = 'Delhi'").fetchall()
+    conn.close()
+    data = client.get("/api/places/facets", params={"city": "Delhi"}).json()
+    assert data["total"] == len(rows)
+    for type_name in {r[0] for r in rows}:
+        assert data["facets"]["type"][type_name] == sum(1 for r in rows if r[0] == type_name)
+
+    # Picking a type narrows the other facets but not the type facet itself
+    picked = rows[0][0]
+    data = client.get("/api/places/facets", params={"city": "Delhi", "type": picked, "max_duration": 2}).json()
+    assert data["total"] == sum(1 for r in rows if r[0] == picked and r[2] is not None and r[2] <= 2)
+    assert data["facets"]["type"] == {t: sum(1 for r in rows if r[0] == t and r[2] is not None and r[2] <= 2) for t in {r[0] for r in rows}}
+    assert sum(data["facets"]["kid_friendly"].values()) == sum(1 for r in rows if r[0] == picked and r[1] and r[2] is not None and r[2] <= 2)
+
+def test_surprise_sampler():
+    import numpy as np
+    import surprise
+    sampler = surprise.AliasSampler([1.0, 0.0, 3.0])
+    rng = np.random.default_rng(0)
+    draws = np.bincount([sampler.draw(rng) for _ in range(4000)], minlength=3)
+    assert draws[1] == 0 and 0.7 < draws[2] / 4000 < 0.8
+
+    data = client.get("/api/surprise-destination", params={"weight": "popular", "region": "domestic"}).json()
+    assert data["city"] and len(data["top_places"]) <= surprise.TOP_PLACES
+    assert client.get("/api/surprise-destination", params={"weight": "nope"}).status_code == 400
+
+def test_itinerary_edits_replan_day(app_db):
+    from main import get_db_connection
+    payload = {"user_id": 1, "origin": "Mumbai", "destination": "Delhi", "categories": [], "num_days": 2,
+               "budget": 20000, "travel_mode": "train", "selected_places": [],
+               "start_date": "2025-03-01", "end_date": "2025-03-02"}
+    trip = client.post("/api/trips/create", json=payload).json()
+    trip_id = trip["trip_id"]
+
+    def state():
+        conn = get_db_connection()
+        items = [dict(r) for r in conn.execute(
+            "SELECT * FROM ItineraryItems WHERE trip_id = ? ORDER BY day, start_time", (trip_id,))]
+        row = conn.execute("SELECT total_cost, itinerary_html FROM Trips WHERE id = ?", (trip_id,)).fetchone()
+        conn.close()
+        return items, row["total_cost"], row["itinerary_html"]
+
+    items, total, _ = state()
+    first = [i for i in items if i["day"] == 1]
+    assert len(first) >= 2
+    # Dropping the day's first visit moves the rest up to 09:00 and takes its cost off the trip
+    assert client.delete(f"/api/itinerary/{first[0]['id']}").status_code == 200
+    items, new_total, html = state()
+    assert [i for i in items if i["day"] == 1][0]["start_time"] == "09:00"
+    assert abs(new_total - (total - first[0]["estimated_cost"])) < 1e-6
+    assert first[0]["place_name"] not in html and first[1]["place_name"] in html
+
+    # A new item lands after the day's last visit, and only day 2's <tbody> changes
+    day1_body = html[html.index('<tbody data-day="1">'):html.index("</tbody>") + len("</tbody>")]
+    added = client.post("/api/itinerary", json={"trip_id": trip_id, "day": 2, "place_name": "Chandni Chowk",
+                                                 "start_time": "23:00", "end_time": "25:00", "estimated_cost": 100}).json()
+    items, newer_total, html = state()
+    day2 = [i for i in items if i["day"] == 2]
+    assert day2[-1]["id"] == added["id"] and day2[-1]["end_time"] > day2[-1]["start_time"]
+    assert abs(newer_total - new_total - 100) < 1e-6
+    assert day1_body in html and "Chandni Chowk" in html
+
+    # Times sent with a PUT are kept; the rest of the day is packed around them
+    moved = [i for i in items if i["day"] == 1][0]
+    client.put(f"/api/itinerary/{moved['id']}", json={**moved, "start_time": "15:00", "end_time": "16:00"})
+    items, _, _ = state()
+    day1 = [i for i in items if i["day"] == 1]
+    assert [(i["start_time"], i["end_time"]) for i in day1 if i["id"] == moved["id"]] == [("15:00", "16:00")]
+    assert all(a["end_time"] <= b["start_time"] for a, b in zip(day1, day1[1:]))
+
+    # A drag-and-drop reorder sends the day's items in their new order with the old times
+    swapped = [day1[1], day1[0]] + day1[2:]
+    fields = ("id", "day", "place_name", "start_time", "end_time", "notes", "estimated_cost")
+    assert client.post("/api/itinerary/bulk", json={"update": [{k: i[k] for k in fields} for i in swapped]}).status_code == 200
+    items, _, _ = state()
+    assert [i["id"] for i in items if i["day"] == 1] == [i["id"] for i in swapped]
+
+def test_trip_scenarios_are_side_effect_free():
+    from main import get_db_connection
+    db = get_db_connection()
+    trips_before = db.execute("SELECT COUNT(*) FROM Trips").fetchone()[0]
+    base = {"user_id": 1, "origin": "Delhi", "destination": "Delhi", "categories": [], "num_days": 3,
+            "budget": 15000, "travel_mode": "train", "selected_places": [],
+            "start_date": "2025-03-01", "end_date": "2025-03-03"}
+    res = client.post("/api/trips/plan/scenarios", json={
+        "base": base,
+        "variations": [{"name": "shoestring", "budget": 1}],
+        "grid": {"num_days": [3, 5], "travel_mode": ["train", "flight"]},
+    })
+    assert res.status_code == 200
+    data = res.json()
+    scenarios = {s["name"]: s for s in data["scenarios"]}
+    assert len(scenarios) == 5 and scenarios["shoestring"]["feasible"] is False
+    long_train, short_train = scenarios["num_days=5, travel_mode=train"], scenarios["num_days=3, travel_mode=train"]
+    assert long_train["params"]["num_days"] == 5 and long_train["visit_hours"] >= short_train["visit_hours"]
+    assert all(0 < s["coverage"] <= 1 and s["total_cost"] <= 15000 for s in data["scenarios"] if s["feasible"])
+    assert data["cheapest"] in scenarios
+    assert db.execute("SELECT COUNT(*) FROM Trips").fetchone()[0] == trips_before
+    db.close()
+
+    bad = client.post("/api/trips/plan/scenarios", json={"base": base, "grid": {"origin": ["Pune"]}})
+    assert bad.status_code == 400
+
+def test_admission_rate_limit_and_shedding():
+    from fastapi import FastAPI
+    import admission
+    import metrics
+
+    policies = admission.load_policies({"GET /slow/{n}": {"rate": 0.5, "burst": 2, "concurrency": 1, "queue": 1, "queue_timeout": 5}})
+    tiny = FastAPI()
+    tiny.get("/slow/{n}")(lambda n: {"n": n})
+    limited = TestClient(admission.AdmissionMiddleware(tiny, policies=policies))
+    assert [limited.get("/slow/1").status_code for _ in range(2)] == [200, 200]
+    denied = limited.get("/slow/2")
+    assert denied.status_code == 429 and int(denied.headers["retry-after"]) >= 1
+    # Buckets are per address; an unsigned session_user cookie can't buy a fresh one
+    assert [limited.get("/slow/3", headers={"Cookie": f"session_user={u}"}).status_code for u in (7, 8)] == [429, 429]
+    assert admission.client_key({"client": ("10.0.0.2", 1), "headers": [(b"cookie", b"session_user=7")]}) == "ip:10.0.0.2"
+    assert metrics.ADMISSION_DECISIONS.value("GET /slow/{n}", "rate_limited") >= 1
+
+    policy = policies["GET /slow/{n}"]
+    async def crowd():
+        assert await policy.acquire() is False                 # runs
+        waiting = asyncio.ensure_future(policy.acquire())      # queues
+        await asyncio.sleep(0)
+        with pytest.raises(admission.Rejected) as shed:
+            await policy.acquire()                             # queue full
+        assert shed.value.status == 503 and shed.value.reason == "shed"
+        policy.release(0.1)
+        assert await waiting is True and policy.in_flight == 1 and not policy.waiters
+        policy.release(0.1)
+        assert policy.in_flight == 0
+    asyncio.run(crowd())
+
+def test_trip_change_feed(app_db):
+    import changefeed
+    import main
+    from db_writer import get_writer
+    from main import get_db_connection, trip_feed
+
+    conn = get_db_connection()
+    trip_id = conn.execute("SELECT id FROM Trips ORDER BY id DESC LIMIT 1").fetchone()[0]
+    conn.close()
+    assert client.get("/api/trips/999999999/events").status_code == 404
+
+    # Write endpoints publish deltas once committed
+    expense = client.post("/api/expenses", json={"trip_id": trip_id, "user_id": 1, "category": "Food",
+                                                  "amount": 120, "currency": "INR", "date": "2025-03-01", "payer": "A"}).json()
+    client.patch(f"/api/expenses/{expense['id']}", json={"cleared": True})
+    client.delete(f"/api/expenses/{expense['id']}")
+    item = client.post("/api/itinerary", json={"trip_id": trip_id, "day": 1, "place_name": "Feed Test",
+                                               "start_time": "09:00", "end_time": "10:00", "estimated_cost": 0}).json()
+    events = trip_feed.backlog(trip_id)[-4:]
+    assert [e.kind for e in events] == ["expense.created", "expense.updated", "expense.deleted", "itinerary.changed"]
+    assert events[1].data == {"id": expense["id"], "cleared": True}
+    assert events[3].data["days"] == [1] and item["id"] in {i["id"] for i in events[3].data["items"]}
+    client.delete(f"/api/itinerary/{item['id']}")
+
+    async def resume():
+        # Missed events are replayed from the resume point, then live ones follow
+        subscription, missed = trip_feed.subscribe(trip_id, events[1].id)
+        assert [e.kind for e in missed][:3] == ["expense.deleted", "itinerary.changed", "itinerary.changed"]
+        threading.Thread(target=trip_feed.publish, args=(trip_id, "checklist.created", {"id": 1})).start()
+        body = changefeed.stream(subscription, [], lambda: asyncio.sleep(0, result=False), heartbeat=5)
+        assert (await body.__anext__()).startswith(b"retry:")
+        live = await body.__anext__()
+        assert b"event: checklist.created" in live and b"id: " + changefeed.BOOT.encode() in live
+        await body.aclose()
+        assert trip_feed.subscribers(trip_id) == 0
+        # An id from another boot can't be resumed
+        subscription, missed = trip_feed.subscribe(trip_id, "stale-5")
+        assert missed is None
+        subscription.close()
+    asyncio.run(resume())
+
+    # Events are logged in the database, and those of other workers are tailed from there
+    trip_feed.poll(force=True)
+    get_writer(main.DB_PATH, factory=main.TimedConnection).execute(lambda conn: None)
+    conn = get_db_connection()
+    logged = [r[0] for r in conn.execute("SELECT kind FROM TripEvents WHERE trip_id = ? AND boot = ?", (trip_id, changefeed.BOOT))]
+    assert logged[:3] == ["expense.created", "expense.updated", "expense.deleted"]
+    other = "INSERT INTO TripEvents (trip_id, boot, kind, data, created_at) VALUES (?, 'other', ?, ?, '')"
+    conn.execute(other, (trip_id, "member.added", '{"id": 5}'))
+    conn.commit()
+    trip_feed.poll(force=True)
+    remote = trip_feed.backlog(trip_id)[-1]
+    assert (remote.kind, remote.data) == ("member.added", {"id": 5})
+
+    async def trimmed():
+        # A worker that finds rows trimmed before it read them cuts its subscribers off and expires their ids
+        subscription, _ = trip_feed.subscribe(trip_id, remote.id)
+        seq = conn.execute(other, (trip_id, "member.removed", '{"id": 5}')).lastrowid
+        conn.execute("DELETE FROM TripEvents WHERE seq = ?", (seq,))
+        conn.execute(other, (trip_id, "member.added", '{"id": 6}'))
+        conn.commit()
+        await asyncio.to_thread(trip_feed.poll, True)
+        assert await subscription.next(1) is None and subscription.overflowed
+        subscription.close()
+        assert trip_feed.subscribe(trip_id, remote.id)[1] is None
+    asyncio.run(trimmed())
+    conn.close()
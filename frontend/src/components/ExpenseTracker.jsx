@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import { motion } from 'framer-motion';
 
-const ExpenseTracker = ({ tripId, onExpenseAdded }) => {
+const ExpenseTracker = ({ tripId, initial, onExpenseAdded }) => {
     const [expenses, setExpenses] = useState([]);
     const [newExpense, setNewExpense] = useState({
         description: '',
@@ -25,8 +25,13 @@ const ExpenseTracker = ({ tripId, onExpenseAdded }) => {
     };
 
     useEffect(() => {
-        fetchExpenses();
-    }, [tripId]);
+        // The trip overview already carries the expenses; only fetch when they weren't provided
+        if (initial) {
+            setExpenses(initial);
+        } else {
+            fetchExpenses();
+        }
+    }, [tripId, initial]);
 
     const fetchExpenses = async () => {
         try {
@@ -100,25 +100,22 @@ const EnhancedTripDetails = () => {
 
     const fetchTrip = async (userId) => {
         try {
-            const res = await axios.get(`http://localhost:8000/api/trips/user/${userId}`);
-            const found = res.data.find(t => t.id === parseInt(id));
-            if (found) {
+            // Trip, itinerary and expenses in a single roundtrip
+            const res = await axios.get(`http://localhost:8000/api/trips/${id}/overview?include=trip,itinerary,expenses`);
+            const found = res.data.trip;
+            if (found && found.user_id === parseInt(userId)) {
                 setTrip(found);
                 setTotalBudget(found.budget || 0);
                 setEstimatedCost(found.total_cost || 0);
 
-                // Fetch itinerary items
-                const itemsRes = await axios.get(`http://localhost:8000/api/itinerary/${id}`);
-                const items = itemsRes.data.map((item, idx) => ({
+                const items = res.data.itinerary.map((item, idx) => ({
                     ...item,
                     id: item.id || `item-${idx}`
                 }));
                 setItineraryItems(items);
 
-                // Fetch expenses
-                const expensesRes = await axios.get(`http://localhost:8000/api/expenses/trip/${id}`);
-                setExpenses(expensesRes.data);
-                const spent = expensesRes.data.reduce((sum, exp) => sum + (exp.amount || 0), 0);
+                setExpenses(res.data.expenses);
+                const spent = res.data.expenses.reduce((sum, exp) => sum + (exp.amount || 0), 0);
                 setSpentAmount(spent);
 
                 // Initialize map
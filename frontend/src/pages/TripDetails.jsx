@@ -65,30 +65,38 @@ function SortableItem({ item, onDelete }) {
     );
 }
 
-const ChecklistSection = ({ tripId }) => {
+const ChecklistSection = ({ tripId, initial }) => {
     const [items, setItems] = useState([]);
     const [newTask, setNewTask] = useState('');
     const [progress, setProgress] = useState(0);
     const [stats, setStats] = useState({ total: 0, completed: 0 });
 
     useEffect(() => {
+        const applyChecklist = (data) => {
+            // NEW: Handle progress data from backend
+            if (data.items) {
+                setItems(data.items);
+                setProgress(data.progress || 0);
+                setStats({ total: data.total || 0, completed: data.completed || 0 });
+            } else {
+                setItems(data);
+            }
+        };
         const fetchChecklist = async () => {
             try {
                 const res = await axios.get(`http://localhost:8000/api/trips/${tripId}/checklist`);
-                // NEW: Handle progress data from backend
-                if (res.data.items) {
-                    setItems(res.data.items);
-                    setProgress(res.data.progress || 0);
-                    setStats({ total: res.data.total || 0, completed: res.data.completed || 0 });
-                } else {
-                    setItems(res.data);
-                }
+                applyChecklist(res.data);
             } catch (err) {
                 console.error("Failed to fetch checklist", err);
             }
         };
-        fetchChecklist();
-    }, [tripId]);
+        // The trip overview already carries the checklist; only fetch when it wasn't provided
+        if (initial) {
+            applyChecklist(initial);
+        } else {
+            fetchChecklist();
+        }
+    }, [tripId, initial]);
 
     const handleAddTask = async (e) => {
         e.preventDefault();
@@ -187,9 +195,10 @@ const TripDetails = () => {
     const { id } = useParams();
     const [trip, setTrip] = useState(null);
     const [itineraryItems, setItineraryItems] = useState([]);
-    const [expenses, setExpenses] = useState([]);
+    const [expenses, setExpenses] = useState(null);
     const [totalBudget, setTotalBudget] = useState(0);
     const [spentAmount, setSpentAmount] = useState(0);
+    const [checklist, setChecklist] = useState(null);
 
     const sensors = useSensors(
         useSensor(PointerSensor),
@@ -201,36 +210,23 @@ const TripDetails = () => {
     useEffect(() => {
         const fetchTrip = async (userId) => {
             try {
-                const res = await axios.get(`http://localhost:8000/api/trips/user/${userId}`);
-                const found = res.data.find(t => t.id === parseInt(id));
-                if (found) {
+                // One roundtrip for trip, itinerary, expenses, actually spent and checklist
+                const res = await axios.get(`http://localhost:8000/api/trips/${id}/overview`);
+                const found = res.data.trip;
+                if (found && found.user_id === parseInt(userId)) {
                     setTrip(found);
                     setTotalBudget(found.budget || 0);
 
-                    // Fetch itinerary items
-                    try {
-                        const itemsRes = await axios.get(`http://localhost:8000/api/itinerary/${id}`);
-                        const items = itemsRes.data.map((item, idx) => ({
-                            ...item,
-                            id: item.id || `item-${idx}`
-                        }));
-                        setItineraryItems(items);
-                    } catch (err) {
-                        console.log('No itinerary items found', err);
-                    }
-
-                    // Fetch expenses and actually spent amount
-                    try {
-                        // Fetch actually spent (includes flight fees + expenses) using NumPy endpoint
-                        const actuallySpentRes = await axios.get(`http://localhost:8000/api/trips/${id}/actually-spent`);
-                        setSpentAmount(actuallySpentRes.data.actually_spent || 0);
-
-                        // Also fetch expenses list for display
-                        const expensesRes = await axios.get(`http://localhost:8000/api/trips/${id}/expenses`);
-                        setExpenses(expensesRes.data);
-                    } catch (err) {
-                        console.log('No expenses found', err);
-                    }
+                    const items = res.data.itinerary.map((item, idx) => ({
+                        ...item,
+                        id: item.id || `item-${idx}`
+                    }));
+                    setItineraryItems(items);
+
+                    // Actually spent includes flight fees + expenses
+                    setSpentAmount(res.data.actually_spent.actually_spent || 0);
+                    setExpenses(res.data.expenses);
+                    setChecklist(res.data.checklist);
                 }
             } catch (err) {
                 console.error(err);
@@ -275,14 +271,9 @@ const TripDetails = () => {
                     };
                 });
 
-                // Persist changes to backend
-                updatedItems.forEach(async (item) => {
-                    try {
-                        await axios.put(`http://localhost:8000/api/itinerary/${item.id}`, item, { withCredentials: true });
-                    } catch (err) {
-                        console.error("Failed to update item", item.id, err);
-                    }
-                });
+                // Persist changes to backend in a single transaction
+                axios.post(`http://localhost:8000/api/itinerary/bulk`, { update: updatedItems }, { withCredentials: true })
+                    .catch(err => console.error("Failed to update items", err));
 
                 return updatedItems;
             });
@@ -434,10 +425,10 @@ const TripDetails = () => {
                 </div>
 
                 {/* Expense Tracker */}
-                <ExpenseTracker tripId={id} />
+                <ExpenseTracker tripId={id} initial={expenses} />
 
                 {/* Checklist Section */}
-                <ChecklistSection tripId={id} />
+                <ChecklistSection tripId={id} initial={checklist} />
 
                 {/* Original Itinerary HTML (fallback) */}
                 {trip.itinerary_html && (